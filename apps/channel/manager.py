@@ -0,0 +1,10 @@
+from django.db import models
+
+
+class ChannelMessageQuerySet(models.QuerySet):
+
+    def for_serialization(self):
+        """
+        ChannelMessageSerializer uchun kerakli bog'lanishlarni oldindan yuklaydi (N+1 muammosiz).
+        """
+        return self.select_related("sender","channel__owner").prefetch_related("likes")
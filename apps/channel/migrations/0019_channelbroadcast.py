@@ -0,0 +1,47 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channel', '0018_alter_channelmessage_likes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChannelBroadcast',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('pending', 'PENDING'), ('running', 'RUNNING'), ('done', 'DONE')], default='pending', max_length=20)),
+                ('cursor', models.UUIDField(blank=True, null=True)),
+                ('processed_count', models.PositiveIntegerField(default=0)),
+                ('batches_sent', models.PositiveIntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Channel Broadcast',
+                'verbose_name_plural': 'Channel Broadcasts',
+                'db_table': 'channel_broadcast',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='channelmembership',
+            index=models.Index(fields=['channel', 'id'], name='membership_channel_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='channelbroadcast',
+            name='message',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='broadcast', to='channel.channelmessage'),
+        ),
+        migrations.AddIndex(
+            model_name='channelbroadcast',
+            index=models.Index(fields=['status', 'updated_at'], name='broadcast_status_updated_idx'),
+        ),
+    ]
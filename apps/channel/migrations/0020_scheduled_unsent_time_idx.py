@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channel', '0019_channelbroadcast'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='channelscheduledmessage',
+            index=models.Index(condition=models.Q(('sent', False)), fields=['scheduled_time'], name='chansched_unsent_time_idx'),
+        ),
+    ]
@@ -4,6 +4,8 @@ from enum import Enum
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from channel.manager import ChannelMessageQuerySet
+
 User = get_user_model()
 # Create your models here.
 class BaseModel(models.Model):
@@ -62,6 +64,10 @@ class ChannelMembership(BaseModel):
         verbose_name='Channel Membership'
         verbose_name_plural='Channels Membership'
         ordering = ['-created_at']
+        indexes = [
+            # Broadcast a'zolarni (channel, id) bo'yicha keyset tartibida aylanadi
+            models.Index(fields=['channel','id'],name='membership_channel_id_idx'),
+        ]
 
 class ChannelMessage(BaseModel):
     channel = models.ForeignKey(Channel,on_delete=models.CASCADE)
@@ -71,6 +77,7 @@ class ChannelMessage(BaseModel):
     file = models.FileField(upload_to="channel/messages/files/",null=True,blank=True)
     sent_at = models.DateTimeField(auto_now_add=True)
     likes = models.ManyToManyField(User,related_name="likes_channel",null=True,blank=True)
+    objects = ChannelMessageQuerySet.as_manager()
 
 
     class Meta:
@@ -94,3 +101,38 @@ class ChannelScheduledMessage(BaseModel):
     class Meta:
         db_table = 'channel_scheduled_message'
         ordering = ['-created_at']
+        indexes = [
+            # Faqat yuborilmagan habarlar: scheduler'ni qayta tiklash va vaqti kelganlarni olish uchun
+            models.Index(fields=['scheduled_time'],condition=models.Q(sent=False),name='chansched_unsent_time_idx'),
+        ]
+
+
+class ChannelBroadcastStatus(BaseEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+
+
+class ChannelBroadcast(BaseModel):
+    """
+    Kanal habari uchun push tarqatish ishi.
+    cursor - oxirgi ishlangan a'zolik id si, ishchi to'xtab qolsa shu joydan davom etiladi.
+    """
+    message = models.OneToOneField(ChannelMessage,on_delete=models.CASCADE,related_name='broadcast')
+    status = models.CharField(
+        max_length=20,choices=ChannelBroadcastStatus.choices(),default=ChannelBroadcastStatus.PENDING.value
+    )
+    cursor = models.UUIDField(null=True,blank=True)
+    processed_count = models.PositiveIntegerField(default=0)
+    batches_sent = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True,blank=True)
+
+    class Meta:
+        db_table = 'channel_broadcast'
+        verbose_name = 'Channel Broadcast'
+        verbose_name_plural = 'Channel Broadcasts'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status','updated_at'],name='broadcast_status_updated_idx'),
+        ]
+
@@ -1,39 +1,152 @@
+from datetime import timedelta
+from functools import partial
+
+from asgiref.sync import async_to_sync
 from celery import shared_task
 from celery.utils.log import get_task_logger
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, prefetch_related_objects
 from django.utils import timezone
-from firebase_admin import messaging
 
-from channel.models import ChannelScheduledMessage, ChannelMessage
-from share.tasks import send_push_notification
+from channel.models import ChannelScheduledMessage, ChannelMessage, ChannelBroadcast, ChannelBroadcastStatus, \
+    ChannelMembership
+from channel.serializers import ChannelMessageSerializer
+from share.broadcast import group_send_many, protocol_group_names
+from share.scheduler import MessageScheduler
+from share.tasks import send_push_batch
 logger = get_task_logger(__name__)
 
 @shared_task
-def send_channel_scheduled_message():
-    logger.info("Running schedule Message Channel")
+def send_channel_scheduled_message(ids=None):
+    """
+    ids - scheduler navbatidan olingan habarlar, berilmasa vaqti o'tgan barcha habarlar.
+    Habarlar partiyalab SKIP LOCKED bilan band qilinadi, bulk_create bilan yaratiladi
+    va bitta UPDATE bilan yuborilgan deb belgilanadi. Har bir kanal habari uchun
+    tarqatish ishi tranzaksiya tugagach navbatga qo'yiladi.
+    """
+    batch_size = MessageScheduler.get_batch_size()
+    sent = 0
     try:
-        now = timezone.now()
-        scheduled_messages = ChannelScheduledMessage.objects.filter(
-            scheduled_time__lte=now,sent=False
-        )
-        if not scheduled_messages.exists():
-            logger.info("No scheduled message in Channel")
-            return
-
-        for scheduled_message in scheduled_messages:
-            channel_message = ChannelMessage.objects.create(
-                channel=scheduled_message.channel,
-                sender=scheduled_message.sender,
-                text=scheduled_message.text
-            )
-            scheduled_message.sent=True
-            scheduled_message.save()
-            for membership in scheduled_message.channel.memberships.all():
-                notification_preference = getattr(membership.user, "notifications", None)
-                if notification_preference and notification_preference.notifications_enabled:
-                    send_push_notification.delay(notification_preference.device_token, f"New Message in {scheduled_message.channel.name}",
-                                                 scheduled_message.text)
-            logger.info(f"Group scheduled message sent {channel_message.text}")
-
+        while True:
+            with transaction.atomic():
+                scheduled_messages = MessageScheduler.claim_due(
+                    ChannelScheduledMessage.objects.select_related("sender","channel"),
+                    ids=ids,limit=batch_size,
+                )
+                if not scheduled_messages:
+                    break
+                channel_messages = ChannelMessage.objects.bulk_create([
+                    ChannelMessage(channel=scheduled_message.channel,sender=scheduled_message.sender,text=scheduled_message.text)
+                    for scheduled_message in scheduled_messages
+                ])
+                ChannelScheduledMessage.objects.filter(
+                    id__in=[scheduled_message.id for scheduled_message in scheduled_messages]
+                ).update(sent=True)
+                start_channel_broadcasts(channel_messages)
+            sent += len(channel_messages)
+            if len(scheduled_messages) < batch_size:
+                break
+        if sent:
+            logger.info(f"Sent {sent} channel scheduled messages.")
     except Exception as e:
         logger.error(f"Error send scheduled message task: {str(e)}")
+    return sent
+
+
+def start_channel_broadcast(message:ChannelMessage)->ChannelBroadcast:
+    """Habar uchun tarqatish ishini yaratib, tranzaksiya tugagach navbatga qo'yish"""
+    return start_channel_broadcasts([message])[0]
+
+
+def start_channel_broadcasts(messages:list[ChannelMessage])->list[ChannelBroadcast]:
+    """Bir nechta habar uchun tarqatish ishlarini bitta bulk_create bilan yaratish"""
+    broadcasts = ChannelBroadcast.objects.bulk_create([ChannelBroadcast(message=message) for message in messages])
+    broadcast_ids = [str(broadcast.id) for broadcast in broadcasts]
+
+    def enqueue():
+        publish_channel_messages(messages)
+        for broadcast_id in broadcast_ids:
+            run_channel_broadcast.delay(broadcast_id)
+
+    transaction.on_commit(enqueue)
+    return broadcasts
+
+
+def publish_channel_messages(messages:list[ChannelMessage]):
+    """Kanalga obuna bo'lgan WebSocket ulanishlariga har bir kanal uchun bitta partiya hodisasi"""
+    prefetch_related_objects(messages,"likes")
+    by_channel = {}
+    for message in messages:
+        by_channel.setdefault(message.channel_id,[]).append(message)
+
+    events = []
+    for channel_id,channel_messages in by_channel.items():
+        room = f"channel__{channel_id}"
+        # Kanal habarlarining lean formati yo'q, ikkala protokolga bir xil format ketadi
+        data = ChannelMessageSerializer(channel_messages,many=True).data
+        for group_name in protocol_group_names(room):
+            events.append((group_name,{"type":"channel_messages","room":room,"messages":data}))
+    async_to_sync(group_send_many)(get_channel_layer(),events)
+
+
+@shared_task
+def run_channel_broadcast(broadcast_id:str):
+    """
+    Kanal a'zolarini (channel, id) keyset tartibida partiyalab aylanib push yuborish.
+    Har bir partiya broadcast qatorini SKIP LOCKED bilan band qilib ishlanadi va
+    cursor shu tranzaksiyada saqlanadi, shuning uchun ikki ishchi bitta partiyani
+    ikki marta olmaydi, to'xtab qolgan ish esa cursor'dan davom etadi.
+    Bitta chaqiruvda ko'pi bilan CHANNEL_BROADCAST_CHUNKS_PER_RUN partiya ishlanadi.
+    """
+    batch_size = settings.PUSH_MULTICAST_BATCH_SIZE
+    for _ in range(settings.CHANNEL_BROADCAST_CHUNKS_PER_RUN):
+        with transaction.atomic():
+            broadcast = ChannelBroadcast.objects.select_for_update(skip_locked=True).filter(
+                id=broadcast_id
+            ).exclude(status=ChannelBroadcastStatus.DONE.value).select_related("message__channel").first()
+            if broadcast is None:
+                return
+            memberships = ChannelMembership.objects.filter(
+                channel_id=broadcast.message.channel_id
+            ).order_by("id")
+            if broadcast.cursor:
+                memberships = memberships.filter(id__gt=broadcast.cursor)
+            chunk = list(memberships.values_list("id","user_id")[:batch_size])
+            if not chunk:
+                ChannelBroadcast.objects.filter(id=broadcast.id).update(
+                    status=ChannelBroadcastStatus.DONE.value,finished_at=timezone.now(),updated_at=timezone.now()
+                )
+                logger.info(f"Channel broadcast {broadcast_id} finished: {broadcast.processed_count} members")
+                return
+            # Push cursor saqlangandan keyin navbatga qo'yiladi: tranzaksiya bekor bo'lsa,
+            # partiya qayta ishlanganda takroriy push ketmaydi
+            transaction.on_commit(partial(
+                send_push_batch.delay,
+                f"New Message in {broadcast.message.channel.name}",broadcast.message.text,
+                user_ids=[str(user_id) for _,user_id in chunk],
+            ))
+            ChannelBroadcast.objects.filter(id=broadcast.id).update(
+                status=ChannelBroadcastStatus.RUNNING.value,
+                cursor=chunk[-1][0],
+                processed_count=F("processed_count")+len(chunk),
+                batches_sent=F("batches_sent")+1,
+                updated_at=timezone.now(),
+            )
+    # Uzun ishlarni bitta vazifada ushlab turmaslik uchun davomini yangi vazifaga beramiz
+    run_channel_broadcast.delay(broadcast_id)
+
+
+@shared_task
+def resume_channel_broadcasts():
+    """Ishchi to'xtab qolgani sababli uzoq vaqt yangilanmagan ishlarni qayta navbatga qo'yish"""
+    stale_before = timezone.now()-timedelta(seconds=settings.CHANNEL_BROADCAST_STALE_AFTER)
+    broadcast_ids = ChannelBroadcast.objects.filter(
+        status__in=[ChannelBroadcastStatus.PENDING.value,ChannelBroadcastStatus.RUNNING.value],
+        updated_at__lt=stale_before,
+    ).values_list("id",flat=True)
+    for broadcast_id in broadcast_ids:
+        logger.info(f"Resuming channel broadcast {broadcast_id}")
+        run_channel_broadcast.delay(str(broadcast_id))
 
@@ -10,7 +10,8 @@ from channel.models import Channel, ChannelMembership, ChannelMessage, ChannelSc
 from channel.permissions import IsChannelOwner, IsChannelPrivate, IsChannelOwnerAndLeftMember, ChannelMessageOwner
 from channel.serializers import ChannelSerializer, ChannelMembershipSerializer, ChannelMessageSerializer, \
     ChannelScheduleMessageSerializer
-from channel.tasks import send_push_notification
+from channel.tasks import start_channel_broadcast
+from share.scheduler import MessageScheduler
 from user.paginations import CustomPagination
 
 
@@ -77,7 +78,7 @@ class ChannelMessageCreateListApiView(ListCreateAPIView):
     def get_queryset(self):
         if self.request.method=='GET':
             channel_id = self.kwargs.get('channel_id')
-            return self.queryset.filter(channel__id=channel_id)
+            return self.queryset.for_serialization().filter(channel__id=channel_id)
         return super().get_queryset()
 
     def perform_create(self, serializer):
@@ -89,8 +90,8 @@ class ChannelMessageCreateListApiView(ListCreateAPIView):
         if channel.owner != user:
             raise PermissionDenied(detail="Sizga ushbu kanalda xabar yaratishga ruxsat berilmagan.")
         message=serializer.save(channel=channel,sender=user)
-        for membership in channel.memberships.all():
-                send_push_notification.delay(str(membership.user.id),f"New Message in {channel.name}",message.text)
+        # Push tarqatish alohida ishda bajariladi, so'rov darhol qaytadi
+        start_channel_broadcast(message)
 
 class ChannelMessageRetrieveUpdateDestroy(RetrieveUpdateDestroyAPIView):
     queryset = ChannelMessage.objects.all()
@@ -110,7 +111,8 @@ class ChannelScheduleMessageApiView(CreateAPIView):
         user = self.request.user
         if channel.owner != user:
             raise PermissionDenied(detail="Sizga ushbu kanalda xabar yaratishga ruxsat berilmagan.")
-        serializer.save(channel=channel, sender=user)
+        scheduled_message = serializer.save(channel=channel, sender=user)
+        MessageScheduler.schedule_on_commit("channel",scheduled_message)
 
 class ChannelMessageLikeRemoveApiView(CreateAPIView,DestroyAPIView):
     queryset = ChannelMessage.objects.all()
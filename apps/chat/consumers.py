@@ -4,140 +4,170 @@ from channels.db import database_sync_to_async
 from djangochannelsrestframework.generics import GenericAsyncAPIConsumer
 from djangochannelsrestframework.observer.generics import ObserverModelInstanceMixin
 from django.contrib.auth.models import AnonymousUser
+from django.db.models import Q
 from djangochannelsrestframework.observer.generics import action
+from rest_framework.exceptions import ValidationError
 
 
 from chat.models import Chat, ChatParticipant, Message, ScheduledMessage
-from chat.serializers import ChatSerializer, MessageSerializer, UserSerializer
+from chat.serializers import ChatSerializer, MessageSerializer, UserSerializer, LeanMessageSerializer
+from share.broadcast import get_protocol_version, group_send_many, message_events, protocol_group_name, LEAN_PROTOCOL_VERSION
+from share.consumers import PresenceConsumerMixin, RosterConsumerMixin
+from share.paginations import MessageCursorPaginator, RosterPaginator
+from share.scheduler import MessageScheduler
 from user.models import User
 
 
-class ChatConsumer(ObserverModelInstanceMixin,GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
+class ChatConsumer(PresenceConsumerMixin,RosterConsumerMixin,ObserverModelInstanceMixin,GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
     queryset = Chat.objects.all()
     serializer_class = ChatSerializer
     lookup_field = 'pk' #qidirish uchun asosiy kalit maydon
+    participant_serializer_class = UserSerializer
+
+    joined = False
 
     async def connect(self):
         self.user = self.scope.get("user",AnonymousUser()) #foydalanuvchini olish
         self.chat_id = self.scope["url_route"]["kwargs"]["pk"] #Chat ID sini olish
-        self.chat = await self.get_chat(self.chat_id) #chat obyektini olish
-        self.participants = await self.current_users(self.chat) #Hozirgi ishtirokchilarni olish
+        self.protocol_version = get_protocol_version(self.scope) #?v=2 bo'lsa lean format
 
-        #Agar foydalanuchi autentifikatsiyadan o'tmagan bo'lsa,ulanishni yopamiz
+        #Agar foydalanuchi autentifikatsiyadan o'tmagan bo'lsa, bazaga murojaat qilmasdan yopamiz
         if not self.user.is_authenticated:
             return await self.close()
-        #Agar chat mavjud bo'lmasa,ulanishni yopamiz
-        if not self.chat:
-            return await self.close()
-        #Agar foydalanuvchi chat ishtirokchisi bo'lmasa chatni yopamiz
-        if self.user.id not in [self.chat.owner_id,self.chat.user_id]:
+        #Chat, a'zolik tekshiruvi va boshlang'ich sahifalar bitta thread hop'da olinadi.
+        #Chat mavjud bo'lmasa yoki foydalanuvchi uning ishtirokchisi bo'lmasa ulanishni yopamiz
+        initial = await self.open_chat(self.chat_id)
+        if initial is None:
             return await self.close()
 
-        # WebSocket guruhiga foydalanuvchini qo'shish
-        await self.channel_layer.group_add(f"chat__{self.chat_id}",self.channel_name)
-        await self.add_user_to_chat(self.chat_id) # Foydalanuvchini chatga qo'shish
+        # WebSocket guruhiga foydalanuvchini qo'shish (protokol versiyasiga mos guruhga)
+        await self.channel_layer.group_add(
+            protocol_group_name(f"chat__{self.chat_id}",self.protocol_version),self.channel_name
+        )
         await self.accept() #Ulanishni qabul qilish
+        self.joined = True
+        await self.send_json({"action":"get_messages",**initial["messages"]}) #Eng oxirgi habarlar sahifasi
+        await self.send_json({"action":"get_participants",**initial["participants"]}) #Ishtirokchilarning birinchi sahifasi
         await self.update_user_status(is_online=True) #Foydalanuvchi holatini yangilash
-        await self.notify_users() #Barcha foydalanuvchilarga yangi ishtirokchilar haqida xabar berish
-        await self.get_messages(self.chat_id) #Oldingi habarlarni olish
+        await self.announce_participant("join") #Boshqalarga qo'shilganini (yig'ilgan holda) bildirish
+
+    @database_sync_to_async
+    def open_chat(self,chat_id):
+        """
+        Ulanish uchun bitta DB ish birligi: foydalanuvchi ishtirokchi bo'lgan chatni olish,
+        uni ChatParticipant sifatida qayd etish, habarlar va ishtirokchilarning birinchi sahifasini seriyalash.
+        Chat topilmasa yoki foydalanuvchi ishtirokchi bo'lmasa None qaytaradi.
+        """
+        self.chat = Chat.objects.select_related("owner","user").filter(
+            Q(owner_id=self.user.id)|Q(user_id=self.user.id),pk=chat_id
+        ).first()
+        if self.chat is None:
+            return None
+        ChatParticipant.objects.get_or_create(user_id=self.user.id,chat_id=self.chat.id)
+
+        page = MessageCursorPaginator.paginate(Message.objects.for_serialization().filter(chat_id=self.chat.id))
+        if self.protocol_version>=LEAN_PROTOCOL_VERSION:
+            messages = LeanMessageSerializer(page["messages"],many=True).data
+        else:
+            messages = MessageSerializer(page["messages"],many=True,context={"user":self.user}).data
+        participants = RosterPaginator.paginate(self.get_participants_queryset())
+        participants["users"] = self.participant_serializer_class(participants["users"],many=True).data
+        return {
+            "messages":{"messages":messages,"has_more":page["has_more"],"cursors":page["cursors"]},
+            "participants":participants,
+        }
 
     #WebSocket uzilganda bajariladi
     async def disconnect(self, code):
-        if self.user.is_authenticated:
-            await self.remove_user_from_chat(self.chat_id) #Foydalanuvchini chatdan olib tashlash
+        if self.joined:
             await self.update_user_status(is_online=False)
-            await self.notify_users()
+            #Foydalanuvchining xonadagi oxirgi ulanishi yopilganda chatdan olib tashlanadi
+            if await self.announce_participant("leave"):
+                await self.remove_user_from_chat(self.chat_id)
             await self.channel_layer.group_discard(
-                f"chat__{self.chat_id}",self.channel_name
+                protocol_group_name(f"chat__{self.chat_id}",self.protocol_version),self.channel_name
             )
-        print("to'xtadi")
         await super().disconnect(code)
 
-    #Barcha foydalanuvchilarga ishtirokchilar ro'yhatini yuborish
-    async def notify_users(self):
-        participants = await self.current_users(self.chat) #Hozirgi ishtirokchilarni olish
-        users = await self.serialize_users(participants) #Ishtirokchilarni seriyalash
-        await self.channel_layer.group_send(
-            f"chat__{self.chat_id}",{"type":"update_users","users":users}
-        )
+    def get_room_name(self):
+        return f"chat__{self.chat_id}"
 
-    #Foydalanuvchilarni yangilash habarini yuborish
-    async def update_users(self,event):
-        await self.send_json({"users":event["users"]}) #Json Formatida yuborish
+    #Chatdagi hozirgi ishtirokchilar
+    def get_participants_queryset(self):
+        return User.objects.filter(chat_participants__chat_id=self.chat_id)
 
     # Xabarlarni olish uchun endpoint
+    # before/after - (sent_at, id) kursorlari, limit - sahifa hajmi
     @action()
-    async def get_messages(self,pk,**kwargs):
-        messages = await self.fetch_messages(pk) #Habarlarni bazadan olish
-        serialized_messages = await self.serialize_messages(messages)
+    async def get_messages(self,pk,before=None,after=None,limit=None,**kwargs):
+        after = after or kwargs.get("since") #qayta ulanganda o'tkazib yuborilgan habarlar
+        try:
+            page = await self.fetch_messages(pk,before=before,after=after,limit=limit) #Habarlarni bazadan olish
+        except ValidationError as e:
+            await self.send_json({"action":"get_messages","errors":e.detail})
+            return
+        serialized_messages = await self.serialize_messages(page["messages"])
 
         await self.send_json(
-            {"action":"get_messages","messages":serialized_messages}
+            {
+                "action":"get_messages",
+                "messages":serialized_messages,
+                "has_more":page["has_more"],
+                "cursors":page["cursors"],
+            }
         )
-    # Chatdan barcha xabarlarni olish uchun yordamchi method
+    # Chatdagi xabarlarning bitta sahifasini olish uchun yordamchi method
     @database_sync_to_async
-    def fetch_messages(self,pk:int):
-        try:
-            chat = Chat.objects.get(pk=pk)
-            return list(chat.messages.order_by("sent_at")) #Habarlarni sanaga ko'ra tartiblash
-        except Chat.DoesNotExist:
-            return []
+    def fetch_messages(self,pk:int,before:str=None,after:str=None,limit:int=None):
+        if self.user.id not in [self.chat.owner_id,self.chat.user_id] or str(pk)!=str(self.chat_id):
+            return {"messages":[],"has_more":False,"cursors":{"before":None,"after":None}}
+        queryset = Message.objects.for_serialization().filter(chat_id=pk)
+        return MessageCursorPaginator.paginate(queryset,before=before,after=after,limit=limit)
 
     # Bitta habarni olish
     @database_sync_to_async
     def get_message(self,pk):
         try:
-            message = Message.objects.get(pk=pk)
+            message = Message.objects.for_serialization().get(pk=pk)
             return message
         except Message.DoesNotExist:
             return None
 
     @database_sync_to_async
     def serialize_messages(self,messages):
+        if self.protocol_version>=LEAN_PROTOCOL_VERSION:
+            return LeanMessageSerializer(messages,many=True).data
         return MessageSerializer(messages,many=True,context={"user":self.user}).data
 
-    #Bitta habarni seriyalash
+    #Bitta habarni ikkala protokol uchun seriyalash (to'liq va lean)
     @database_sync_to_async
-    def serialize_message(self,message):
-        return MessageSerializer(message).data
+    def serialize_message_versions(self,message):
+        return MessageSerializer(message).data,LeanMessageSerializer(message).data
+
+    async def broadcast_message(self,event_type:str,key:str,message:Message):
+        """
+        Habarni chat guruhlariga yuborish:
+        legacy guruhga to'liq format, lean guruhga ixcham format ketadi
+        """
+        serialized_message,lean_message = await self.serialize_message_versions(message)
+        group_name = f"chat__{message.chat_id}"
+        await group_send_many(
+            self.channel_layer,message_events(group_name,event_type,key,serialized_message,lean_message)
+        )
 
     #Chat Obyektini olish
     @database_sync_to_async
     def get_chat(self,pk:int):
         try:
-            return Chat.objects.get(pk=pk)
+            return Chat.objects.select_related("owner","user").get(pk=pk)
         except Chat.DoesNotExist:
             return None
 
-    #Chatdagi hozirgi ishtirokchini olish
-    @database_sync_to_async
-    def current_users(self,chat:Chat):
-        participants = ChatParticipant.objects.filter(chat=chat).select_related("user")
-        return [UserSerializer(participant.user).data for participant in participants]
     #Foydalanuvchini chatdan olib tashlash
     @database_sync_to_async
     def remove_user_from_chat(self,chat_id:int):
         ChatParticipant.objects.filter(user=self.user,chat_id=chat_id).delete()
 
-    #Foydalanuvchini chatga qo'shish
-    @database_sync_to_async
-    def add_user_to_chat(self,chat_id:int):
-        chat = Chat.objects.get(pk=chat_id)
-        if not ChatParticipant.objects.filter(user=self.user,chat=chat).exists():
-            ChatParticipant.objects.create(user=self.user,chat=chat)
-
-    #Foydalanuvchilarni seriyalash
-    @database_sync_to_async
-    def serialize_users(self,users):
-        return UserSerializer(users,many=True).data
-
-    #Foydalanuvchi holatini yangilash
-    @database_sync_to_async
-    def update_user_status(self,is_online):
-        self.user.is_online = is_online
-        self.user.update_last_seen() #Oxirgi ko'rilgan vaqtni yangilash
-        self.user.save()
-
     async def chat_message(self,event):
         """
         Chatdagi habarni yuboradi.
@@ -145,6 +175,14 @@ class ChatConsumer(ObserverModelInstanceMixin,GenericAsyncAPIConsumer,AsyncJsonW
         """
         await self.send_json({"action":"new_message","data":event['text']})
 
+    async def chat_messages(self,event):
+        """
+        Rejalashtirilgan habarlar partiyasi (bitta channel layer hodisasi).
+        Mijozlar uchun format o'zgarmaydi: har bir habar alohida new_message bo'lib boradi.
+        """
+        for message in event['messages']:
+            await self.send_json({"action":"new_message","data":message})
+
     @action()
     async def create_message(self,pk,data,**kwargs):
         """
@@ -160,10 +198,7 @@ class ChatConsumer(ObserverModelInstanceMixin,GenericAsyncAPIConsumer,AsyncJsonW
             return
 
         message = await self.save_message(chat,user,data)
-        serialized_message = await self.serialize_message(message)
-        await self.channel_layer.group_send(
-            f"chat__{pk}",{"type":"chat_message","text":serialized_message}
-        )
+        await self.broadcast_message("chat_message","text",message)
     @database_sync_to_async
     def save_message(self,chat:Chat,user:User,data:dict):
         """
@@ -173,6 +208,7 @@ class ChatConsumer(ObserverModelInstanceMixin,GenericAsyncAPIConsumer,AsyncJsonW
         valid_keys = {"text","image","file"}
         message_data = {key:data.get(key) for key in valid_keys if data.get(key)}
         message = Message.objects.create(chat=chat,sender=user,**message_data)
+        message.likes_count = 0 #yangi habarda like yo'q, qo'shimcha COUNT so'rovi shart emas
         return message
 
     @database_sync_to_async
@@ -202,6 +238,7 @@ class ChatConsumer(ObserverModelInstanceMixin,GenericAsyncAPIConsumer,AsyncJsonW
     @database_sync_to_async
     def save_scheduled_message(self,chat:Chat,user:User,data:dict):
         scheduled_message = ScheduledMessage.objects.create(chat=chat,sender=user,**data)
+        MessageScheduler.schedule_on_commit("chat",scheduled_message)
         return scheduled_message
 
     async def message_liked(self,event):
@@ -215,40 +252,29 @@ class ChatConsumer(ObserverModelInstanceMixin,GenericAsyncAPIConsumer,AsyncJsonW
         user = self.scope['user']
         message = await self.get_message(message_id)
         if message:
-            await self.add_like(message,user)
-            serialized_message = await self.serialize_message(message)
-            await self.channel_layer.group_send(
-                f"chat__{message.chat.id}",
-                {
-                    "type":"message_liked",
-                    "message":serialized_message
-                }
-            )
+            message = await self.add_like(message,user)
+            await self.broadcast_message("message_liked","message",message)
 
     @action()
     async def unlike_message(self,message_id,**kwargs):
         user = self.scope['user']
         message = await self.get_message(message_id)
         if message:
-            await self.remove_like(message,user)
-            serialized_message = await self.serialize_message(message)
-            await self.channel_layer.group_send(
-                f"chat__{message.chat.id}",
-                {
-                    "type":"message_unliked",
-                    "message":serialized_message
-                }
-            )
+            message = await self.remove_like(message,user)
+            await self.broadcast_message("message_unliked","message",message)
 
+    # Like qo'shilgandan keyin habar yangilangan liked_by va likes_count bilan qaytariladi
     @database_sync_to_async
     def add_like(self,message,user):
         message.liked_by.add(user)
         message.save()
+        return Message.objects.for_serialization().get(pk=message.pk)
 
     @database_sync_to_async
     def remove_like(self,message,user):
         message.liked_by.remove(user)
         message.save()
+        return Message.objects.for_serialization().get(pk=message.pk)
 
 
 
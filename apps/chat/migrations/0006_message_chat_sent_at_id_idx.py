@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_scheduledmessage_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'sent_at', 'id'], name='message_chat_sent_at_id_idx'),
+        ),
+    ]
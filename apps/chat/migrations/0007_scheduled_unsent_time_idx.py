@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_message_chat_sent_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scheduledmessage',
+            index=models.Index(condition=models.Q(('sent', False)), fields=['scheduled_time'], name='schedmsg_unsent_time_idx'),
+        ),
+    ]
@@ -2,6 +2,8 @@ import uuid
 
 from django.contrib.auth import get_user_model
 from django.db import models
+
+from chat.manager import MessageQuerySet
 User = get_user_model()
 # Create your models here.
 
@@ -38,6 +40,7 @@ class Message(models.Model):
     sent_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
     liked_by = models.ManyToManyField(User,null=True,blank=True)
+    objects = MessageQuerySet.as_manager()
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -47,6 +50,9 @@ class Message(models.Model):
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['chat','sent_at','id'],name='message_chat_sent_at_id_idx'),
+        ]
 
 class ScheduledMessage(models.Model):
     chat = models.ForeignKey(Chat,on_delete=models.CASCADE,related_name='scheduled_messages')
@@ -59,3 +65,7 @@ class ScheduledMessage(models.Model):
         db_table = 'schedule_message'
         verbose_name = 'Schedule Message'
         verbose_name_plural = 'Schedule Messages'
+        indexes = [
+            # Faqat yuborilmagan habarlar: scheduler'ni qayta tiklash va vaqti kelganlarni olish uchun
+            models.Index(fields=['scheduled_time'],condition=models.Q(sent=False),name='schedmsg_unsent_time_idx'),
+        ]
@@ -52,6 +52,9 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'chat', 'sender', 'text', 'image', 'file', 'sent_at', 'is_read', 'liked_by', 'likes_count']
 
     def get_likes_count(self, obj):
+        # Message.objects.for_serialization() annotatsiyasi bo'lsa qo'shimcha so'rov yo'q
+        if hasattr(obj, 'likes_count'):
+            return obj.likes_count
         return obj.liked_by.count()
 
     def to_representation(self, instance):
@@ -70,3 +73,27 @@ class MessageSerializer(serializers.ModelSerializer):
 
         return message
 
+
+
+class LeanMessageSerializer(serializers.ModelSerializer):
+    """
+    Lean (v2) protokol uchun habar: ichma-ich chat va foydalanuvchi obyektlarisiz.
+    Mijoz chat va foydalanuvchilarni o'z keshidan id orqali topadi.
+    """
+    chat_id = serializers.UUIDField(read_only=True)
+    sender_id = serializers.UUIDField(read_only=True)
+    likes_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Message
+        fields = ['id', 'chat_id', 'sender_id', 'text', 'image', 'file', 'sent_at', 'is_read', 'likes_count']
+
+    def get_likes_count(self, obj):
+        if hasattr(obj, 'likes_count'):
+            return obj.likes_count
+        return obj.liked_by.count()
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        representation['id'] = str(representation['id'])
+        return representation
@@ -1,47 +1,75 @@
+from collections import defaultdict
+
 from celery import shared_task
 from .models import ScheduledMessage,Message
-from django.utils import timezone
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from celery.utils.log import get_task_logger
 
-from .serializers import MessageSerializer
+from share.broadcast import group_send_many, lean_group_name
+from share.scheduler import MessageScheduler
+from .serializers import MessageSerializer, LeanMessageSerializer
 
 logger = get_task_logger(__name__)
 
 @shared_task
-def send_scheduled_message():
-    logger.info("Running scheduled message task.")
+def send_scheduled_message(ids=None):
+    """
+    Vaqti kelgan rejalashtirilgan habarlarni yuborish.
+    ids - scheduler navbatidan olingan habarlar, berilmasa vaqti o'tgan barcha habarlar.
+    Habarlar partiyalab SKIP LOCKED bilan band qilinadi, shuning uchun bir nechta
+    ishchi bir vaqtda ishlasa ham bitta habar ikki marta yuborilmaydi.
+    Har bir partiya bitta bulk_create va bitta UPDATE bilan saqlanadi.
+    """
+    batch_size = MessageScheduler.get_batch_size()
+    sent = 0
     try:
-        now = timezone.now()
-        scheduled_messages = ScheduledMessage.objects.filter(
-            scheduled_time__lte = now,sent=False
-        )
-
-        if not scheduled_messages.exists():
-            logger.info("No scheduled message to send.")
-            return
-        logger.info(f"Found {scheduled_messages.count()} scheduled message to send.")
-
-        for scheduled_message in scheduled_messages:
-            message = Message.objects.create(
-                chat = scheduled_message.chat,
-                sender = scheduled_message.sender,
-                text = scheduled_message.text,
-                sent_at = timezone.now()
-            )
-            scheduled_message.sent = True
-            scheduled_message.save()
-            logger.info(f"Message sent: {message.text}")
+        while True:
+            with transaction.atomic():
+                scheduled_messages = MessageScheduler.claim_due(
+                    ScheduledMessage.objects.select_related("sender","chat__owner","chat__user"),
+                    ids=ids,limit=batch_size,
+                )
+                if not scheduled_messages:
+                    break
+                messages = Message.objects.bulk_create([
+                    Message(chat=scheduled_message.chat,sender=scheduled_message.sender,text=scheduled_message.text)
+                    for scheduled_message in scheduled_messages
+                ])
+                ScheduledMessage.objects.filter(
+                    id__in=[scheduled_message.id for scheduled_message in scheduled_messages]
+                ).update(sent=True)
+            publish_scheduled_messages(messages)
+            sent += len(messages)
+            if len(scheduled_messages) < batch_size:
+                break
+        if sent:
+            logger.info(f"Sent {sent} scheduled messages.")
+    except Exception as e:
+        logger.error(f"Error in send_scheduled_message task: {str(e)}")
+    return sent
 
-            serializer = MessageSerializer(message)
-            channel_layer = get_channel_layer()
 
-            async_to_sync(channel_layer.group_send)(
-                f"chat__{scheduled_message.chat.id}",
-                {"type":"chat_message","text":serializer.data}
-            )
-            logger.info(f"Message sent: {message.text}")
+def publish_scheduled_messages(messages):
+    """Har bir chatga bitta partiya hodisasi (protokol versiyasi bo'yicha) yuborish"""
+    prefetch_related_objects(messages,"liked_by")
+    by_chat = defaultdict(list)
+    for message in messages:
+        message.likes_count = 0
+        by_chat[message.chat_id].append(message)
 
-    except Exception as e:
-        logger.error(f"Error in send_scheduled_message task: {str(e)}")
+    events = []
+    for chat_id,chat_messages in by_chat.items():
+        group_name = f"chat__{chat_id}"
+        events.append((
+            group_name,
+            {"type":"chat_messages","room":group_name,"messages":MessageSerializer(chat_messages,many=True).data}
+        ))
+        events.append((
+            lean_group_name(group_name),
+            {"type":"chat_messages","room":group_name,"messages":LeanMessageSerializer(chat_messages,many=True).data}
+        ))
+    # Barcha chatlarning hodisalari bitta chaqiruvda (shard bo'yicha pipeline) yuboriladi
+    async_to_sync(group_send_many)(get_channel_layer(),events)
@@ -9,7 +9,8 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
 from chat.models import Chat, Message
-from chat.serializers import ChatSerializer, MessageSerializer
+from chat.serializers import ChatSerializer, MessageSerializer, LeanMessageSerializer
+from share.broadcast import group_send_many, message_events
 from user.paginations import CustomPagination
 
 
@@ -45,25 +46,24 @@ class MessageListCreateView(ListCreateAPIView):
     pagination_class = CustomPagination
     permission_classes = [IsAuthenticated,]
 
+    def get_queryset(self):
+        if self.request.method=='GET':
+            # Faqat so'ralgan chat habarlari va faqat foydalanuvchi ishtirokchi bo'lgan chatda
+            user = self.request.user
+            return self.queryset.for_serialization().filter(
+                Q(chat__owner_id=user.id)|Q(chat__user_id=user.id),chat_id=self.kwargs.get('pk')
+            )
+        return super().get_queryset()
+
     def perform_create(self, serializer):
         chat_id = self.kwargs.get('pk')
         chat = Chat.objects.get(pk=chat_id)
         message = serializer.save(sender=self.request.user,chat=chat)
         if message.file or message.image:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"chat_{message.chat.id}",
-                {
-                    "type":"chat_message",
-                    "message_id":str(message.id),
-                    "sender":{
-                        "id":str(message.sender.id),
-                        "user_name":str(message.sender.username),
-                    },
-                    "text":message.text,
-                    "image":message.image.url if message.image.url else None,
-                    "file":message.file if message.file else None,
-                    "sent_at":message.sent_at.isoformat()
-                },
-            )
-
+            # Konsumerlardagidek: legacy guruhga to'liq, lean guruhga ixcham format
+            message.likes_count = 0
+            group_name = f"chat__{message.chat_id}"
+            async_to_sync(group_send_many)(get_channel_layer(),message_events(
+                group_name,"chat_message","text",
+                MessageSerializer(message).data,LeanMessageSerializer(message).data,
+            ))
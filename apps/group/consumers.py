@@ -1,3 +1,5 @@
+import time
+
 from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
@@ -5,19 +7,29 @@ from django.contrib.auth import get_user_model
 from djangochannelsrestframework.generics import GenericAsyncAPIConsumer
 from djangochannelsrestframework.observer.generics import action
 from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import ValidationError
 
 
 from chat.serializers import UserSerializer
-from share.tasks import send_push_notification
-from .models import Group, GroupParticipant, GroupMessage, GroupPermission, GroupScheduledMessage
-from .serializers import GroupMessageSerializer
+from share.broadcast import get_protocol_version, group_send_many, message_events, protocol_group_name, LEAN_PROTOCOL_VERSION
+from share.consumers import PresenceConsumerMixin, RosterConsumerMixin
+from share.paginations import MessageCursorPaginator
+from share.scheduler import MessageScheduler
+from .tasks import fan_out_group_message
+from .models import Group, GroupParticipant, GroupMessage, GroupScheduledMessage
+from .services import GroupAccessService
+from .serializers import GroupMessageSerializer, LeanGroupMessageSerializer
 User = get_user_model()
 
 # GroupConsumer Websocket uchun ishlaydigan Consumer bo'lib,guruhdagi foydalanuvchilarni boshqaradi.
-class GroupConsumer(GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
+class GroupConsumer(PresenceConsumerMixin,RosterConsumerMixin,GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
     queryset = Group.objects.all()
     serializer_class = GroupMessageSerializer # Faqat messagelar uchun ishlatiladi
+    participant_serializer_class = UserSerializer
     lookup_field = 'pk'
+    access = None
+    access_expires_at = 0.0
+    joined = False
 
     async def connect(self):
         """Websocket ulanishini boshqarish"""
@@ -26,88 +38,96 @@ class GroupConsumer(GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
 
         # Url dan guruh ID sini olish
         self.group_id = self.scope["url_route"]["kwargs"]["pk"]
+        # Mijoz so'ragan protokol versiyasi (?v=2 - lean format)
+        self.protocol_version = get_protocol_version(self.scope)
 
         # Agar foydalanuvchi authentifikatsiyadan o'tmagan yoki guruhga kirishga huquqi yo'q bo'lsa ulanishni yopamiz
         if not (await self.is_authenticated() and await self.has_group_access()):
             await self.close()
             return
 
-        # Foydalanuvchini guruhga qo'shish
-        await self.channel_layer.group_add(f"group__{self.group_id}",self.channel_name)
+        # Foydalanuvchini protokol versiyasiga mos guruhga qo'shish
+        await self.channel_layer.group_add(
+            protocol_group_name(f"group__{self.group_id}",self.protocol_version),self.channel_name
+        )
         #Ulanishni qabul qilish
         await self.accept()
+        self.joined = True
 
         # Foydalanuchini guruhga qo'shish va uni holatini o'zgartirish
         await self.add_user_to_group()
         await self.update_user_status(is_online=True)
 
-        # Guruhdagi barcha foydalanuvchilarga habar yuboramiz
-        await self.notify_group_users()
-        # Guruhdagi barcha habarlarni olish
+        # Boshqa a'zolarga qo'shilganini bildiramiz (qisqa oyna ichida yig'ilib yuboriladi)
+        await self.announce_participant("join")
+        # Guruhdagi eng oxirgi habarlar sahifasini olish
         await self.get_messages(self.group_id)
+        # A'zolar ro'yhatining birinchi sahifasi faqat shu ulanishga yuboriladi
+        await self.get_participants()
 
     async def disconnect(self, code):
         """WebSocket ulanishini yopish"""
-        if await self.is_authenticated():
-            # Foydalanuvchini guruhdan olib tashlash
-            await self.remove_user_from_group()
+        # connect() da rad etilgan ulanish guruhga qo'shilmagan, "leave" ham e'lon qilinmaydi
+        if self.joined:
             await self.update_user_status(is_online=False)
-            # Guruhdagi foydalanuvchilarga habar yuborish
-            await self.notify_group_users()
-
-        await self.channel_layer.group_discard(f"group__{self.group_id}",self.channel_name)
+            # Guruhdagi foydalanuvchilarga habar yuborish, oxirgi ulanish yopilganda guruhdan olib tashlash
+            if await self.announce_participant("leave"):
+                await self.remove_user_from_group()
+            await self.channel_layer.group_discard(
+                protocol_group_name(f"group__{self.group_id}",self.protocol_version),self.channel_name
+            )
         await super().disconnect(code)
 
-    async def notify_group_users(self):
-        """Guruh a'zolarini foydalanuvchi holati o'zgarganini habar berish"""
-        group_members = await self.get_group_members()
-        await self.channel_layer.group_send(
-            f"group__{self.group_id}",
-            {
-                "type":"update_group_users",
-                "users":group_members
-            }
-        )
+    def get_room_name(self):
+        return f"group__{self.group_id}"
 
-    async def update_group_users(self,event:dict):
-        """Guruhdagi foydalanuchilar ro'yhatini mijozga yuborish"""
-        await self.send_json({"users":event['users']})
+    def get_participants_queryset(self):
+        """Guruh a'zolari"""
+        return self.group.members.all()
 
     @action()
-    async def get_messages(self,pk,**kwargs):
-        """Guruh habarlarini olish"""
-        messages = await self.fetch_group_messages(pk)
-        serialized_messages = await self.serialize_messages(messages)
-        await self.send_json(
-            {"action":"get_messages","messages":serialized_messages}
-        )
+    async def get_messages(self,pk,before=None,since=None,limit=None,**kwargs):
+        """Guruh habarlarining bitta sahifasini olish"""
+        await self.send_message_page("get_messages",pk,before=before,since=since or kwargs.get("after"),limit=limit)
 
     @action()
-    async def get_group_messages(self,pk,**kwargs):
+    async def get_group_messages(self,pk,before=None,since=None,limit=None,**kwargs):
         """Guruhdagi habarlarni olish va yuborish"""
-        messages = await self.fetch_group_messages(pk)
-        serialized_messages = await self.serialize_messages(messages)
+        await self.send_message_page("get_group_messages",pk,before=before,since=since or kwargs.get("after"),limit=limit)
+
+    async def send_message_page(self,action_name,pk,before=None,since=None,limit=None):
+        """
+        before - kursordan eskiroq habarlar (tarixni varaqlash)
+        since - kursordan keyingi habarlar (qayta ulanganda faqat o'tkazib yuborilganlari)
+        """
+        try:
+            page = await self.fetch_group_messages(pk,before=before,since=since,limit=limit)
+        except ValidationError as e:
+            await self.send_json({"action":action_name,"errors":e.detail})
+            return
+        serialized_messages = await self.serialize_messages(page["messages"])
         await self.send_json(
-            {"action": "get_group_messages", "messages": serialized_messages}
+            {
+                "action":action_name,
+                "messages":serialized_messages,
+                "has_more":page["has_more"],
+                "cursors":page["cursors"],
+            }
         )
 
     @database_sync_to_async
     def get_group(self):
-        """Guruhni ID orqali olish"""
-        return Group.objects.filter(pk=self.group_id).first()
+        """Guruhni ID orqali a'zolik va huquqlar snapshoti bilan birga olish (bitta so'rov)"""
+        return GroupAccessService.get_group(self.group_id,self.user.id)
 
     @database_sync_to_async
     def serialize_messages(self,messages):
+        if self.protocol_version>=LEAN_PROTOCOL_VERSION:
+            return LeanGroupMessageSerializer(messages,many=True).data
         return GroupMessageSerializer(
             messages,many=True,context={"user":self.user}
         ).data
 
-    @database_sync_to_async
-    def get_group_members(self):
-        """Guruh a'zolarini olish."""
-        group = self.group
-        return [UserSerializer(user).data for user in group.members.all()]
-
     @database_sync_to_async
     def add_user_to_group(self):
         """Foydalanuvchini guruhga qo'shish"""
@@ -119,26 +139,12 @@ class GroupConsumer(GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
         GroupParticipant.objects.filter(group_id=self.group_id,user=self.user).delete()
 
     @database_sync_to_async
-    def fetch_group_messages(self,pk:int):
-        """Guruh habarlarini olish"""
-        group = Group.objects.filter(pk=pk).first()
-        if not group:
-            return []
-        return list(group.messages.order_by("sent_at"))
-
-    @database_sync_to_async
-    def update_user_status(self,is_online):
-        """Foydalanuvchi onlayn holatini va ohirgi ko'rish vaqtini yangilash"""
-        self.user.is_online = is_online
-        self.user.update_last_seen()
-        self.user.save()
-
-    @database_sync_to_async
-    def is_user_group_member(self):
-        """Foydalanuvchi guruh a'zosi yoki emasligini tekshirish"""
-        if self.group.owner.id ==self.user.id:
-            return True
-        return self.group.members.filter(id=self.user.id).exists()
+    def fetch_group_messages(self,pk:int,before:str=None,since:str=None,limit:int=None):
+        """Guruh habarlarini (sent_at, id) kursori bo'yicha sahifalab olish"""
+        if str(pk)!=str(self.group_id):
+            return {"messages":[],"has_more":False,"cursors":{"before":None,"after":None}}
+        queryset = GroupMessage.objects.for_serialization().filter(group_id=pk)
+        return MessageCursorPaginator.paginate(queryset,before=before,after=since,limit=limit)
 
     async def is_authenticated(self):
         """Foydalanuvchi authentifikatsiyadan o'tganligini tekshirish"""
@@ -149,31 +155,58 @@ class GroupConsumer(GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
         self.group = await self.get_group()
         if not self.group:
             return False
+        self.set_access(GroupAccessService.snapshot(self.group,self.user.id))
 
         if self.group.is_private:
-            return await self.is_user_group_member()
+            return self.access["is_member"]
 
         return True
 
-    @database_sync_to_async
-    def can_send_message(self,pk):
-        group_permission = GroupPermission.objects.filter(group_id=pk).first()
-        return group_permission.can_send_messages
+    def set_access(self,access):
+        """Ulanishdagi snapshot GROUP_ACCESS_CACHE_TTL dan keyin eskiradi"""
+        self.access = access
+        self.access_expires_at = time.monotonic()+GroupAccessService.get_ttl()
+
+    async def get_access(self,refresh=False):
+        """
+        A'zolik va huquqlar snapshoti: avval ulanishdagi, keyin jarayon keshidagi,
+        ikkalasi ham eskirgan bo'lsa bazadan olinadi
+        """
+        if refresh:
+            GroupAccessService.cache.delete((str(self.group_id),str(self.user.id)))
+            self.access = None
+        if self.access is not None and time.monotonic() >= self.access_expires_at:
+            self.access = None
+        if self.access is None:
+            access = GroupAccessService.get_cached_access(self.group_id,self.user.id)
+            if access is None:
+                access = await database_sync_to_async(GroupAccessService.get_access)(self.group_id,self.user.id)
+            self.set_access(access)
+        return self.access or {}
+
+    async def group_access_changed(self,event):
+        """A'zolik yoki huquqlar o'zgardi (group.signals dan): snapshotni eskirgan deb belgilash"""
+        GroupAccessService.forget_group(event["group_id"])
+        self.access = None
 
     # habar yuborish fuksiyasi
     @action()
     async def create_message(self,pk,data,**kwargs):
         """Yangi habar yaratish va uni guruh a'zolariga tarqatish"""
 
+        access = await self.get_access()
+        # Rad etishdan oldin snapshot bazadan qayta tekshiriladi (ruxsat berilgan yo'l keshda qoladi)
+        if not (access.get("is_member") and access.get("can_send_messages")):
+            access = await self.get_access(refresh=True)
         #agar foydalanuvchi guruh a'zosi bo'lmasa
-        if not await self.is_user_group_member():
+        if not access.get("is_member"):
             await self.send_json(
                 {"detail":"You are not a member of this group. Please join first."}
             )
             return
 
         # Agar foydalanuvchi habar yuborish huquqi bo'lmasa
-        if not await self.can_send_message(self.group_id):
+        if not access.get("can_send_messages"):
             await self.send_json(
                 {"detail":"Sizning habar yuborish huquqingiz yo'q."}
             )
@@ -181,41 +214,10 @@ class GroupConsumer(GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
 
         #Xabarni saqlash
         message = await self.save_message(self.group,self.user,data)
-        serialized_message = await self.serialize_message(message)
-
-        await self.channel_layer.group_send(
-            f"group__{pk}",
-            {
-                "type":"group_message",
-                "text":serialized_message
-            }
-        )
-        # yangi qo'shilgan kodlar
-        group_members = await self.get_group_members()
-
-        for member_data in group_members:
-            user = await self.get_user(member_data["id"])
-
-            if user.is_online is False:
-                try:
-                    user_notification_pref = await sync_to_async(
-                        lambda: getattr(user, "notifications", None)
-                    )()
-
-                    if (
-                            user_notification_pref is not None
-                            and user_notification_pref.notifications_enabled
-                    ):
-                        device_token = await sync_to_async(
-                            lambda: user_notification_pref.device_token
-                        )()
-                        send_push_notification.delay(
-                            token=device_token,
-                            title="New Message in Group",
-                            body=message.text,
-                        )
-                except Exception as e:
-                    print(f"Error: {e}")
+        await self.broadcast_message("group_message","text",message)
+        # Oflayn a'zolarga push alohida navbatda (push) yuboriladi,
+        # shuning uchun jo'natuvchi uchun kechikish guruh hajmiga bog'liq emas
+        await sync_to_async(fan_out_group_message.delay)(str(message.id))
 
     # Xabarni qabul qiluvchi handler
     async def group_message(self, event):
@@ -223,22 +225,39 @@ class GroupConsumer(GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
         text = event.get("text", {})
         await self.send_json({"action": "new_message", "data": text})
 
+    async def group_messages(self, event):
+        """Rejalashtirilgan habarlar partiyasini mijozga bittadan new_message qilib yuborish"""
+        for message in event["messages"]:
+            await self.send_json({"action": "new_message", "data": message})
+
     @database_sync_to_async
     def save_message(self,group:Group,user:User,data:dict):
         """Guruhga yangi habarni saqlash"""
         valid_keys = {"text","image","file"}
         message_data = {key:data.get(key) for key in valid_keys if data.get(key)}
-        return GroupMessage.objects.create(group=group,sender=user,**message_data)
+        message = GroupMessage.objects.create(group=group,sender=user,**message_data)
+        # Yangi habarda like yo'q: seriyalashda qo'shimcha COUNT va liked_by so'rovlari shart emas
+        message.likes_count = 0
+        message._prefetched_objects_cache = {"liked_by":User.objects.none()}
+        return message
 
-    # Bitta messageni seriyalash
+    # Bitta messageni ikkala protokol uchun seriyalash (to'liq va lean)
     @database_sync_to_async
-    def serialize_message(self,message):
-        return GroupMessageSerializer(message).data
+    def serialize_message_versions(self,message):
+        return GroupMessageSerializer(message).data,LeanGroupMessageSerializer(message).data
+
+    async def broadcast_message(self,event_type:str,key:str,message:GroupMessage):
+        """Habarni legacy guruhga to'liq, lean guruhga ixcham formatda yuborish"""
+        serialized_message,lean_message = await self.serialize_message_versions(message)
+        group_name = f"group__{message.group_id}"
+        await group_send_many(
+            self.channel_layer,message_events(group_name,event_type,key,serialized_message,lean_message)
+        )
 
 
     @action()
     async def schedule_message(self,data,**kwargs):
-        group = self.get_group()
+        group = await self.get_group()
         if not group:
             return None
         user = self.scope['user']
@@ -250,24 +269,17 @@ class GroupConsumer(GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
     @database_sync_to_async
     def save_scheduled_message(self,group:Group,user:User,data:dict):
         scheduled_message = GroupScheduledMessage.objects.create(group=group,sender=user,**data)
+        MessageScheduler.schedule_on_commit("group",scheduled_message)
         return scheduled_message
 
     @database_sync_to_async
     def get_message(self,pk):
         try:
-            group_message=GroupMessage.objects.get(pk=pk)
+            group_message=GroupMessage.objects.for_serialization().get(pk=pk)
             return group_message
         except GroupMessage.DoesNotExist:
             return None
 
-    @database_sync_to_async
-    def get_user(self,pk):
-        try:
-            user = User.objects.get(pk=pk)
-            return user
-        except User.DoesNotExist:
-            return None
-
     async def message_liked(self,event):
         print(event['message'])
         await self.send_json({"action":"message_liked","data":event['message']})
@@ -280,38 +292,26 @@ class GroupConsumer(GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
         user = self.scope['user']
         message = await self.get_message(message_id)
         if message:
-            await self.add_like(message,user)
-            serialized_message = await self.serialize_message(message)
-            await self.channel_layer.group_send(
-                f"group__{message.group.id}",
-                {
-                    "type":"message_liked",
-                    "message":serialized_message
-                }
-            )
+            message = await self.add_like(message,user)
+            await self.broadcast_message("message_liked","message",message)
     @action()
     async def unlike_message(self,message_id,**kwargs):
         user = self.scope['user']
         message = await self.get_message(message_id)
         if message:
-            await self.remove_like(message,user)
-            serialized_message = await self.serialize_message(message)
-            await self.channel_layer.group_send(
-                f"group__{message.group.id}",
-                {
-                    "type":"message_unliked",
-                    "message":serialized_message
-                }
-            )
+            message = await self.remove_like(message,user)
+            await self.broadcast_message("message_unliked","message",message)
     @database_sync_to_async
     def add_like(self,message,user):
         message.liked_by.add(user)
         message.save()
+        return GroupMessage.objects.for_serialization().get(pk=message.pk)
 
     @database_sync_to_async
     def remove_like(self,message,user):
         message.liked_by.remove(user)
         message.save()
+        return GroupMessage.objects.for_serialization().get(pk=message.pk)
 
 
 
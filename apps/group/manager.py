@@ -0,0 +1,16 @@
+from django.db import models
+from django.db.models import Count
+
+
+class GroupMessageQuerySet(models.QuerySet):
+
+    def for_serialization(self):
+        """
+        GroupMessageSerializer uchun kerakli bog'lanishlarni oldindan yuklaydi
+        va likes_count ni bitta so'rovda hisoblaydi (N+1 muammosiz).
+        """
+        return (
+            self.select_related("sender","group__owner")
+            .prefetch_related("liked_by")
+            .annotate(likes_count=Count("liked_by",distinct=True))
+        )
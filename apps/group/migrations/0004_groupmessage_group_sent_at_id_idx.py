@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0003_alter_group_options_alter_groupparticipant_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['group', 'sent_at', 'id'], name='groupmsg_group_sent_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0004_groupmessage_group_sent_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupscheduledmessage',
+            index=models.Index(condition=models.Q(('sent', False)), fields=['scheduled_time'], name='groupsched_unsent_time_idx'),
+        ),
+    ]
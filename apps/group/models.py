@@ -2,6 +2,8 @@ import uuid
 
 from django.contrib.auth import get_user_model
 from django.db import models
+
+from group.manager import GroupMessageQuerySet
 User = get_user_model()
 # Create your models here.
 
@@ -38,9 +40,13 @@ class GroupMessage(BaseModel):
     sent_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
     liked_by = models.ManyToManyField(User,related_name="liked_messages")
+    objects = GroupMessageQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['group','sent_at','id'],name='groupmsg_group_sent_at_id_idx'),
+        ]
 
 class GroupScheduledMessage(BaseModel):
     group = models.ForeignKey(Group,on_delete=models.CASCADE)
@@ -51,6 +57,10 @@ class GroupScheduledMessage(BaseModel):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Faqat yuborilmagan habarlar: scheduler'ni qayta tiklash va vaqti kelganlarni olish uchun
+            models.Index(fields=['scheduled_time'],condition=models.Q(sent=False),name='groupsched_unsent_time_idx'),
+        ]
 
 class GroupPermission(BaseModel):
     group = models.ForeignKey(Group,on_delete=models.CASCADE)
@@ -36,9 +36,29 @@ class GroupMessageSerializer(serializers.ModelSerializer):
         read_only_fields = ['liked_by']
 
     def get_likes_count(self,obj):
+        # GroupMessage.objects.for_serialization() annotatsiyasi bo'lsa qo'shimcha so'rov yo'q
+        if hasattr(obj,'likes_count'):
+            return obj.likes_count
         return obj.liked_by.count()
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         representation['id'] = str(representation['id'])
-        return representation
\ No newline at end of file
+        return representation
+
+class LeanGroupMessageSerializer(serializers.ModelSerializer):
+    """
+    Lean (v2) protokol uchun guruh habari: ichma-ich guruh va foydalanuvchi obyektlarisiz.
+    """
+    group_id = serializers.UUIDField(read_only=True)
+    sender_id = serializers.UUIDField(read_only=True)
+    likes_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GroupMessage
+        fields = ['id','group_id','sender_id','text','image','file','sent_at','is_read','likes_count']
+
+    def get_likes_count(self,obj):
+        if hasattr(obj,'likes_count'):
+            return obj.likes_count
+        return obj.liked_by.count()
@@ -0,0 +1,81 @@
+from typing import Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Subquery
+
+from group.models import Group, GroupPermission
+from share.broadcast import group_send_many, protocol_group_names
+from share.cache import LocalTTLCache
+
+
+class GroupAccessService:
+    """
+    Foydalanuvchining guruhdagi a'zoligi va huquqlari (snapshot).
+    Snapshot bitta so'rov bilan olinadi, ulanishda va jarayon keshida GROUP_ACCESS_CACHE_TTL
+    soniya saqlanadi. Group, GroupPermission yoki a'zolar o'zgarganda group.signals
+    notify_changed() chaqiradi: guruhga ulangan barcha consumerlar channel layer orqali
+    xabar olib, keshni tozalaydi.
+    """
+    cache = LocalTTLCache(
+        maxsize=getattr(settings,"GROUP_ACCESS_CACHE_MAX_SIZE",10000),
+        ttl=getattr(settings,"GROUP_ACCESS_CACHE_TTL",60),
+    )
+
+    @classmethod
+    def get_group(cls,group_id,user_id)->Optional[Group]:
+        """Guruhni a'zolik va huquq annotatsiyalari bilan olish, snapshot keshga yoziladi"""
+        group = Group.objects.select_related("owner").annotate(
+            is_member=Exists(Group.members.through.objects.filter(group_id=OuterRef("pk"),user_id=user_id)),
+            can_send_messages=Subquery(
+                GroupPermission.objects.filter(group_id=OuterRef("pk")).values("can_send_messages")[:1]
+            ),
+            can_send_media=Subquery(
+                GroupPermission.objects.filter(group_id=OuterRef("pk")).values("can_send_media")[:1]
+            ),
+        ).filter(pk=group_id).first()
+        if group is not None:
+            cls.cache.set((str(group_id),str(user_id)),cls.snapshot(group,user_id))
+        return group
+
+    @classmethod
+    def snapshot(cls,group:Group,user_id)->dict:
+        return {
+            "is_private":group.is_private,
+            "is_member":str(group.owner_id)==str(user_id) or group.is_member,
+            # GroupPermission qatori bo'lmasa model standart qiymatlari amal qiladi
+            "can_send_messages":group.can_send_messages is not False,
+            "can_send_media":group.can_send_media is not False,
+        }
+
+    @classmethod
+    def get_ttl(cls)->float:
+        return getattr(settings,"GROUP_ACCESS_CACHE_TTL",60)
+
+    @classmethod
+    def get_cached_access(cls,group_id,user_id)->Optional[dict]:
+        return cls.cache.get((str(group_id),str(user_id)))
+
+    @classmethod
+    def get_access(cls,group_id,user_id)->Optional[dict]:
+        access = cls.get_cached_access(group_id,user_id)
+        if access is None:
+            group = cls.get_group(group_id,user_id)
+            access = cls.snapshot(group,user_id) if group is not None else None
+        return access
+
+    @classmethod
+    def forget_group(cls,group_id)->None:
+        group_id = str(group_id)
+        cls.cache.delete_where(lambda key:key[0]==group_id)
+
+    @classmethod
+    def notify_changed(cls,group_id)->None:
+        """A'zolik yoki huquqlar o'zgardi: barcha jarayonlardagi snapshotlarni eskirgan deb belgilash"""
+        cls.forget_group(group_id)
+        room = f"group__{group_id}"
+        async_to_sync(group_send_many)(get_channel_layer(),[
+            (group_name,{"type":"group_access_changed","room":room,"group_id":str(group_id)})
+            for group_name in protocol_group_names(room)
+        ])
@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from group.models import Group, GroupPermission
+from group.services import GroupAccessService
+
+# Snapshotga kiradigan Group maydonlari (nomi va h.k. o'zgarsa snapshot eskirmaydi)
+ACCESS_FIELDS = {"is_private","owner","owner_id"}
+
+
+def notify_on_commit(group_ids)->None:
+    """Tranzaksiya yakunlangach snapshotlarni eskirgan deb belgilash (consumerlar yangi qatorni o'qiydi)"""
+    for group_id in set(group_ids):
+        transaction.on_commit(lambda group_id=group_id:GroupAccessService.notify_changed(group_id))
+
+
+@receiver(post_save,sender=Group)
+def group_saved(sender,instance,created,update_fields=None,**kwargs):
+    if created or (update_fields and ACCESS_FIELDS.isdisjoint(update_fields)):
+        return
+    notify_on_commit([instance.pk])
+
+
+@receiver(post_save,sender=GroupPermission)
+@receiver(post_delete,sender=GroupPermission)
+def group_permission_changed(sender,instance,**kwargs):
+    notify_on_commit([instance.group_id])
+
+
+@receiver(pre_delete,sender=Group)
+def group_deleted(sender,instance,**kwargs):
+    notify_on_commit([instance.pk])
+
+
+@receiver(m2m_changed,sender=Group.members.through)
+def group_members_changed(sender,instance,action,reverse,pk_set,**kwargs):
+    """group.members.add(user) va user.user_groups.add(group) ikkala yo'nalishi ham"""
+    if action == "pre_clear" and reverse:
+        # Teskari clear() da pk_set bo'lmaydi: guruhlar o'chirilishidan oldin olinadi
+        notify_on_commit(instance.user_groups.values_list("pk",flat=True))
+        return
+    if action not in ("post_add","post_remove","post_clear"):
+        return
+    if not reverse:
+        notify_on_commit([instance.pk])
+    elif pk_set:
+        notify_on_commit(pk_set)
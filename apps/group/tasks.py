@@ -1,40 +1,126 @@
+from collections import defaultdict
+
 from asgiref.sync import async_to_sync
 from celery import shared_task
 from celery.utils.log import get_task_logger
 from channels.layers import get_channel_layer
-from django.utils import timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 
 from group.models import GroupScheduledMessage, GroupMessage
-from group.serializers import GroupMessageSerializer
+from group.serializers import GroupMessageSerializer, LeanGroupMessageSerializer
+from share.broadcast import group_send_many, lean_group_name
+from share.scheduler import MessageScheduler
+from share.services import PresenceService
+from share.tasks import send_push_batch
+from user.models import NotificationPreference
 
 logger = get_task_logger(__name__)
 
 @shared_task
-def send_group_scheduled_message():
-    logger.info("Running Scheduled group message.")
+def send_group_scheduled_message(ids=None):
+    """
+    ids - scheduler navbatidan olingan habarlar, berilmasa vaqti o'tgan barcha habarlar.
+    Habarlar partiyalab SKIP LOCKED bilan band qilinadi, bulk_create bilan yaratiladi
+    va bitta UPDATE bilan yuborilgan deb belgilanadi.
+    """
+    batch_size = MessageScheduler.get_batch_size()
+    sent = 0
     try:
-        now = timezone.now()
-        scheduled_messages = GroupScheduledMessage.objects.filter(
-            scheduled_time__lte=now,sent=False
-        )
-        if not scheduled_messages.exists():
-            logger.info("No scheduled message to send.")
-            return
-        for scheduled_message in scheduled_messages:
-            group_message=GroupMessage.objects.create(
-                group=scheduled_message.group,
-                sender=scheduled_message.sender,
-                text=scheduled_message.text
-            )
-            scheduled_message.sent = True
-            scheduled_message.save()
-            logger.info(f"Group scheduled message sent {group_message.text}")
-            serializer = GroupMessageSerializer(group_message)
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"group__{scheduled_message.group.id}",
-                {"type":"group_message","text":serializer.data}
-            )
-            logger.info(f"Message sent: {group_message.text}")
+        while True:
+            with transaction.atomic():
+                scheduled_messages = MessageScheduler.claim_due(
+                    GroupScheduledMessage.objects.select_related("sender","group__owner"),
+                    ids=ids,limit=batch_size,
+                )
+                if not scheduled_messages:
+                    break
+                group_messages = GroupMessage.objects.bulk_create([
+                    GroupMessage(group=scheduled_message.group,sender=scheduled_message.sender,text=scheduled_message.text)
+                    for scheduled_message in scheduled_messages
+                ])
+                GroupScheduledMessage.objects.filter(
+                    id__in=[scheduled_message.id for scheduled_message in scheduled_messages]
+                ).update(sent=True)
+            publish_group_scheduled_messages(group_messages)
+            sent += len(group_messages)
+            if len(scheduled_messages) < batch_size:
+                break
+        if sent:
+            logger.info(f"Sent {sent} group scheduled messages.")
     except Exception as e:
-        logger.error(f"Error send scheduled message task: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error send scheduled message task: {str(e)}")
+    return sent
+
+
+def publish_group_scheduled_messages(group_messages):
+    """Har bir guruhga bitta partiya hodisasi (protokol versiyasi bo'yicha) yuborish"""
+    prefetch_related_objects(group_messages,"liked_by")
+    by_group = defaultdict(list)
+    for group_message in group_messages:
+        group_message.likes_count = 0
+        by_group[group_message.group_id].append(group_message)
+
+    events = []
+    for group_id,messages in by_group.items():
+        group_name = f"group__{group_id}"
+        events.append((
+            group_name,
+            {"type":"group_messages","room":group_name,"messages":GroupMessageSerializer(messages,many=True).data}
+        ))
+        events.append((
+            lean_group_name(group_name),
+            {"type":"group_messages","room":group_name,"messages":LeanGroupMessageSerializer(messages,many=True).data}
+        ))
+    # Barcha guruhlarning hodisalari bitta chaqiruvda (shard bo'yicha pipeline) yuboriladi
+    async_to_sync(group_send_many)(get_channel_layer(),events)
+
+
+@shared_task
+def fan_out_group_message(message_id: str):
+    """
+    Guruhdagi yangi habar haqida oflayn a'zolarga push yuborish.
+    Bildirishnomasi yoqilgan a'zolarning tokenlari bitta so'rov bilan olinadi,
+    onlayn bo'lganlar Redis pipeline orqali chiqarib tashlanadi va tokenlar
+    FCM multicast partiyalariga (PUSH_MULTICAST_BATCH_SIZE) bo'linadi.
+    """
+    message = GroupMessage.objects.filter(id=message_id).values("group_id","sender_id","text").first()
+    if message is None:
+        logger.info(f"Group message {message_id} not found, skipping push fan-out.")
+        return 0
+    batch_size = getattr(settings,"PUSH_MULTICAST_BATCH_SIZE",500)
+    recipients = NotificationPreference.objects.filter(
+        user__user_groups__id=message["group_id"],
+        notifications_enabled=True,
+        device_token__isnull=False,
+    ).exclude(device_token="").exclude(user_id=message["sender_id"]).values_list("user_id","device_token")
+
+    batches = 0
+    tokens = []
+    for chunk in _chunks(recipients.iterator(chunk_size=batch_size),batch_size):
+        presence = PresenceService.get_presence_many([user_id for user_id,_ in chunk])
+        for user_id,device_token in chunk:
+            if not presence.get(str(user_id),{}).get("is_online"):
+                tokens.append(device_token)
+        while len(tokens) >= batch_size:
+            send_push_batch.delay("New Message in Group",message["text"],tokens=tokens[:batch_size])
+            tokens = tokens[batch_size:]
+            batches += 1
+    if tokens:
+        send_push_batch.delay("New Message in Group",message["text"],tokens=tokens)
+        batches += 1
+    logger.info(f"Group message {message_id} fanned out in {batches} push batches.")
+    return batches
+
+
+def _chunks(iterable,size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
@@ -13,7 +13,8 @@ from sentry_sdk.integrations.beam import raise_exception
 
 from group.models import Group, GroupPermission, GroupParticipant, GroupMessage
 from group.permissions import IsGroupOwnerOrReadOnly, IsGroupOwnerUsePermission, IsGroupCanSendMediaPermission
-from group.serializers import GroupSerializer, GroupPermissionSerializer, GroupMemberSerializer, GroupMessageSerializer
+from group.serializers import GroupSerializer, GroupPermissionSerializer, GroupMemberSerializer, GroupMessageSerializer, LeanGroupMessageSerializer
+from share.broadcast import group_send_many, message_events
 from user.paginations import CustomPagination
 
 
@@ -104,7 +105,7 @@ class GroupSendMediaFileApiView(ListCreateAPIView):
        group = self.get_object()
        if not group:
            return Response(data={"detail":"Group Not Found"},status=status.HTTP_404_NOT_FOUND)
-       serializer = self.get_serializer(group.messages.all(),many=True)
+       serializer = self.get_serializer(GroupMessage.objects.for_serialization().filter(group=group),many=True)
        return Response(serializer.data)
 
    def perform_create(self, serializer):
@@ -113,19 +114,10 @@ class GroupSendMediaFileApiView(ListCreateAPIView):
        message = serializer.save(group=group,sender=sender)
 
        if message.file or message.image:
-           channel_layer = get_channel_layer()
-           async_to_sync(channel_layer.group_send)(
-               f"group__{message.group.id}",
-               {
-                   "type":"group_message",
-                   "message_id":str(message.id),
-                   "sender":{
-                       "id":str(message.sender.id),
-                       "user_name":str(message.sender.username),
-                   },
-                   "text":message.text,
-                   "image":message.image.url if message.image.url else None,
-                   "file":message.file if message.file else None,
-                   "sent_at":message.sent_at.isoformat()
-               }
-           )
\ No newline at end of file
+           # Konsumerlardagidek: legacy guruhga to'liq, lean guruhga ixcham format
+           message.likes_count = 0
+           group_name = f"group__{message.group_id}"
+           async_to_sync(group_send_many)(get_channel_layer(),message_events(
+               group_name,"group_message","text",
+               GroupMessageSerializer(message).data,LeanGroupMessageSerializer(message).data,
+           ))
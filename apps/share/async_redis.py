@@ -0,0 +1,69 @@
+import asyncio
+import types
+
+from django.conf import settings
+from redis import asyncio as aioredis
+
+# event loop -> {cache alias: client}
+_clients = {}
+
+
+def get_connection_url(alias: str) -> str:
+    location = settings.CACHES[alias]["LOCATION"]
+    # django_redis accepts a list of servers, the first one is the primary
+    if isinstance(location, (list, tuple)):
+        return location[0]
+    return location.split(",")[0]
+
+
+def get_connection_kwargs(alias: str) -> dict:
+    """Connection options of the django_redis cache, so both clients reach Redis the same way"""
+    options = settings.CACHES[alias].get("OPTIONS", {})
+    kwargs = dict(options.get("CONNECTION_POOL_KWARGS", {}))
+    if options.get("PASSWORD"):
+        kwargs["password"] = options["PASSWORD"]
+    if options.get("SOCKET_CONNECT_TIMEOUT"):
+        kwargs["socket_connect_timeout"] = options["SOCKET_CONNECT_TIMEOUT"]
+    if options.get("SOCKET_TIMEOUT"):
+        kwargs["socket_timeout"] = options["SOCKET_TIMEOUT"]
+    kwargs.setdefault("max_connections", getattr(settings, "ASYNC_REDIS_MAX_CONNECTIONS", 50))
+    kwargs.setdefault("timeout", getattr(settings, "ASYNC_REDIS_POOL_TIMEOUT", 5))
+    return kwargs
+
+
+def get_async_redis_connection(alias: str = "default") -> aioredis.Redis:
+    """
+    Async counterpart of django_redis.get_redis_connection for code running on the event loop.
+    Connections can not be shared between event loops, so every loop gets its own
+    pooled client; under a burst callers wait for a free connection instead of failing.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _clients.get(loop)
+    if clients is None:
+        clients = _clients[loop] = {}
+        _close_with_loop(loop)
+    client = clients.get(alias)
+    if client is None:
+        pool = aioredis.BlockingConnectionPool.from_url(get_connection_url(alias), **get_connection_kwargs(alias))
+        client = clients[alias] = aioredis.Redis.from_pool(pool)
+    return client
+
+
+def _close_with_loop(loop) -> None:
+    """Short-lived loops (tests, async_to_sync) close their pools before they close, like channels_redis does"""
+    close = loop.close
+
+    def _close(self, *args, **kwargs):
+        clients = _clients.pop(self, {})
+        for client in clients.values():
+            self.run_until_complete(client.aclose())
+        self.close = close
+        return close(*args, **kwargs)
+
+    loop.close = types.MethodType(_close, loop)
+
+
+async def close_async_redis_connections() -> None:
+    """Close the pools of the running event loop"""
+    for client in _clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.aclose()
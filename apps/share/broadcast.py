@@ -0,0 +1,74 @@
+from urllib.parse import parse_qs
+
+from django.utils import timezone
+
+# WebSocket protocol versions:
+# 1 - legacy format, every message embeds the chat/group object and the liked_by users
+# 2 - lean format, only ids, text, media urls, timestamps and the like count
+LEGACY_PROTOCOL_VERSION = 1
+LEAN_PROTOCOL_VERSION = 2
+
+
+def get_protocol_version(scope: dict) -> int:
+    """
+    Read the protocol version the client asked for on the handshake (?v=2).
+    Unknown or missing values fall back to the legacy format.
+    """
+    query = parse_qs(scope.get("query_string", b"").decode())
+    try:
+        version = int(query.get("v", [LEGACY_PROTOCOL_VERSION])[0])
+    except (TypeError, ValueError):
+        return LEGACY_PROTOCOL_VERSION
+    return LEAN_PROTOCOL_VERSION if version >= LEAN_PROTOCOL_VERSION else LEGACY_PROTOCOL_VERSION
+
+
+def lean_group_name(group_name: str) -> str:
+    """Channel layer group for connections that speak the lean protocol."""
+    return f"{group_name}__lean"
+
+
+def protocol_group_name(group_name: str, version: int) -> str:
+    if version >= LEAN_PROTOCOL_VERSION:
+        return lean_group_name(group_name)
+    return group_name
+
+
+def protocol_group_names(group_name: str) -> list[str]:
+    """All channel layer groups of a room, one per protocol version."""
+    return [group_name, lean_group_name(group_name)]
+
+
+def message_events(group_name: str, event_type: str, key: str, message: dict, lean_message: dict) -> list[tuple[str, dict]]:
+    """One message event for both protocol groups of a room: full format to legacy, lean format to lean."""
+    return [
+        (group_name, {"type": event_type, "room": group_name, key: message}),
+        (lean_group_name(group_name), {"type": event_type, "room": group_name, key: lean_message}),
+    ]
+
+
+async def group_send_many(channel_layer, events: list[tuple[str, dict]]):
+    """
+    Send several group events, e.g. the legacy and lean copies of one message.
+    NodeFanoutChannelLayer pipelines them (one round trip per shard), other layers get them one by one.
+    """
+    from share.layers import NodeFanoutChannelLayer
+
+    if isinstance(channel_layer, NodeFanoutChannelLayer):
+        await channel_layer.group_send_many(events)
+        return
+    for group, message in events:
+        await channel_layer.group_send(group, message)
+
+
+def presence_group_name(user_id) -> str:
+    """Channel layer group that receives online/offline changes of one user."""
+    return f"presence__{user_id}"
+
+
+def presence_event(user_id, is_online: bool) -> dict:
+    return {
+        "type": "presence_changed",
+        "user_id": str(user_id),
+        "is_online": is_online,
+        "last_seen": timezone.now().isoformat(),
+    }
@@ -0,0 +1,183 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis import Redis, RedisError
+from redis import asyncio as aioredis
+
+from .async_redis import get_async_redis_connection
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LocalTTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire `ttl` seconds after
+    they were stored. Lookups never leave the process.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate) -> None:
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class AuthCache:
+    """
+    Per-process cache of access token decisions, keyed by (user_id, jti), and of
+    authenticated user objects, so a hot token is validated without Redis or
+    database round trips.
+    Logout and user changes are published on INVALIDATION_CHANNEL and every
+    process drops the user's entries. The cache is only used while this process
+    is subscribed: a missed invalidation can never leave a revoked token usable
+    for longer than AUTH_CACHE_TTL.
+    """
+    INVALIDATION_CHANNEL = "auth:invalidate"
+    RECONNECT_DELAY = 1.0
+
+    decisions = LocalTTLCache(
+        maxsize=getattr(settings, "AUTH_CACHE_MAX_SIZE", 10000), ttl=getattr(settings, "AUTH_CACHE_TTL", 30)
+    )
+    users = LocalTTLCache(
+        maxsize=getattr(settings, "AUTH_CACHE_MAX_SIZE", 10000), ttl=getattr(settings, "AUTH_USER_CACHE_TTL", 30)
+    )
+    listening = threading.Event()
+    _listener = None
+    _listener_lock = threading.Lock()
+
+    @classmethod
+    def get_redis_client(cls) -> Redis:
+        return get_redis_connection("default")
+
+    @classmethod
+    def aget_redis_client(cls) -> aioredis.Redis:
+        return get_async_redis_connection("default")
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        if not getattr(settings, "AUTH_CACHE_ENABLED", True):
+            return False
+        cls.start_listener()
+        return cls.listening.is_set()
+
+    @classmethod
+    def is_token_valid(cls, user_id, jti):
+        """True if the token was recently validated, None if unknown."""
+        if not cls.is_enabled():
+            return None
+        return cls.decisions.get((str(user_id), jti))
+
+    @classmethod
+    def remember_token(cls, user_id, jti) -> None:
+        if cls.is_enabled():
+            cls.decisions.set((str(user_id), jti), True)
+
+    @classmethod
+    def get_user(cls, user_id):
+        if not cls.is_enabled():
+            return None
+        user = cls.users.get(str(user_id))
+        # Views may modify request.user, every request gets its own copy
+        return copy.copy(user) if user is not None else None
+
+    @classmethod
+    def remember_user(cls, user) -> None:
+        if cls.is_enabled():
+            cls.users.set(str(user.pk), copy.copy(user))
+
+    @classmethod
+    def forget_user(cls, user_id) -> None:
+        """Drop a user's entries from this process only."""
+        user_id = str(user_id)
+        cls.users.delete(user_id)
+        cls.decisions.delete_where(lambda key: key[0] == user_id)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls.users.clear()
+        cls.decisions.clear()
+
+    @classmethod
+    def invalidate_user(cls, user_id) -> None:
+        """Drop a user's entries in every process."""
+        cls.forget_user(user_id)
+        try:
+            cls.get_redis_client().publish(cls.INVALIDATION_CHANNEL, str(user_id))
+        except RedisError:
+            logger.exception("Could not publish auth cache invalidation for user %s", user_id)
+
+    @classmethod
+    async def ainvalidate_user(cls, user_id) -> None:
+        cls.forget_user(user_id)
+        try:
+            await cls.aget_redis_client().publish(cls.INVALIDATION_CHANNEL, str(user_id))
+        except RedisError:
+            logger.exception("Could not publish auth cache invalidation for user %s", user_id)
+
+    @classmethod
+    def start_listener(cls) -> None:
+        if cls._listener is not None:
+            return
+        with cls._listener_lock:
+            if cls._listener is None:
+                cls._listener = threading.Thread(target=cls.listen, name="auth-cache-invalidation", daemon=True)
+                cls._listener.start()
+
+    @classmethod
+    def listen(cls) -> None:
+        while True:
+            try:
+                pubsub = cls.get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(cls.INVALIDATION_CHANNEL)
+                cls.listening.set()
+                for message in pubsub.listen():
+                    if message["type"] == "message":
+                        cls.forget_user(message["data"].decode())
+            except Exception:
+                logger.warning("Auth cache invalidation listener disconnected, retrying", exc_info=True)
+            # Invalidations may have been missed while disconnected
+            cls.listening.clear()
+            cls.clear()
+            time.sleep(cls.RECONNECT_DELAY)
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from djangochannelsrestframework.decorators import action
+from rest_framework.exceptions import ValidationError
+
+from share.broadcast import group_send_many, presence_event, presence_group_name, protocol_group_names
+from share.paginations import RosterPaginator
+from share.services import PresenceService, RosterService
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceConsumerMixin:
+    """
+    Keeps the connected user's presence in Redis for the lifetime of the socket.
+    The server refreshes it every third of the TTL, so idle clients stay online;
+    inbound frames and {"action": "heartbeat"} refresh it as well.
+    """
+    presence_refreshed_at = 0.0
+    presence_task = None
+
+    async def update_user_status(self,is_online):
+        """Foydalanuvchi onlayn holatini Redis'da yangilash (har bir ulanish alohida hisoblanadi)"""
+        if is_online:
+            changed = await PresenceService.aconnect(self.user.id,self.channel_name)
+            self.presence_refreshed_at = time.monotonic()
+            if self.presence_task is None:
+                self.presence_task = asyncio.ensure_future(self.keep_presence())
+        else:
+            self.stop_presence_refresh()
+            changed = await PresenceService.adisconnect(self.user.id,self.channel_name)
+        # Holat haqiqatan o'zgarganda (birinchi yoki oxirgi ulanish) obunachilarga xabar beramiz
+        if changed:
+            await self.channel_layer.group_send(
+                presence_group_name(self.user.id),presence_event(self.user.id,is_online)
+            )
+
+    async def keep_presence(self):
+        """Kadr yubormaydigan (jim) mijoz ham onlayn qoladi: holat server tomonidan yangilanadi"""
+        interval = PresenceService.get_ttl()/3
+        while True:
+            await asyncio.sleep(max(interval-(time.monotonic()-self.presence_refreshed_at),0))
+            if time.monotonic()-self.presence_refreshed_at < interval:
+                continue
+            try:
+                await self.update_user_status(is_online=True)
+            except Exception:
+                logger.exception("Presence refresh failed for %s",self.channel_name)
+                self.presence_refreshed_at = time.monotonic()
+
+    def stop_presence_refresh(self):
+        if self.presence_task is not None:
+            self.presence_task.cancel()
+            self.presence_task = None
+
+    async def disconnect(self,code):
+        self.stop_presence_refresh()
+        await super().disconnect(code)
+
+    async def refresh_presence(self):
+        user = getattr(self,"user",None)
+        if user is None or not user.is_authenticated:
+            return
+        if time.monotonic()-self.presence_refreshed_at < PresenceService.get_ttl()/3:
+            return
+        await self.update_user_status(is_online=True)
+
+    async def receive_json(self,content,**kwargs):
+        await self.refresh_presence()
+        await super().receive_json(content,**kwargs)
+
+    @action()
+    async def heartbeat(self,**kwargs):
+        await self.update_user_status(is_online=True)
+        return {"ttl":PresenceService.get_ttl()},200
+
+
+class RosterConsumerMixin:
+    """
+    Participant list of a chat/group room.
+    Joins and leaves are coalesced per room over ROSTER_DELTA_WINDOW and broadcast
+    as one delta, the full list is only sent page by page (get_participants).
+    Consumers define get_room_name(), get_participants_queryset() and
+    participant_serializer_class.
+    """
+    participant_serializer_class = None
+    roster_tasks = None
+
+    def get_room_name(self)->str:
+        raise NotImplementedError
+
+    def get_participants_queryset(self):
+        raise NotImplementedError
+
+    async def announce_participant(self,change)->bool:
+        """
+        change - "join" yoki "leave".
+        Foydalanuvchining xonadagi birinchi ulanishi "join", oxirgisi "leave" deb e'lon qilinadi,
+        boshqa tablar ochilib-yopilganda hech narsa yuborilmaydi. E'lon qilinsa True qaytaradi.
+        """
+        room = self.get_room_name()
+        if not await RosterService.atrack_socket(room,self.user.id,self.channel_name,change):
+            return False
+        if await RosterService.arecord(room,self.user.id,change):
+            # Oynani birinchi ochgan ulanish uni yopib, yig'ilgan o'zgarishlarni yuboradi
+            if self.roster_tasks is None:
+                self.roster_tasks = set()
+            task = asyncio.ensure_future(self.flush_participant_changes(room))
+            self.roster_tasks.add(task)
+            task.add_done_callback(self.roster_tasks.discard)
+        return True
+
+    async def flush_participant_changes(self,room,delay=None):
+        await asyncio.sleep(RosterService.get_window() if delay is None else delay)
+        changes = await RosterService.apop_changes(room)
+        if not changes["join"] and not changes["leave"]:
+            return
+        joined = await self.serialize_participants(changes["join"])
+        await group_send_many(self.channel_layer,[
+            (group_name,{"type":"participants_changed","room":room,"joined":joined,"left":changes["leave"]})
+            for group_name in protocol_group_names(room)
+        ])
+
+    async def disconnect(self,code):
+        # Shu ulanish ochgan oyna kutilmasdan yopiladi va yig'ilgan o'zgarishlar darhol yuboriladi
+        if self.roster_tasks:
+            for task in list(self.roster_tasks):
+                task.cancel()
+            room = self.get_room_name()
+            await RosterService.aclose_window(room)
+            try:
+                await self.flush_participant_changes(room,delay=0)
+            except Exception:
+                logger.exception("Roster flush failed for %s",room)
+        await super().disconnect(code)
+
+    async def participants_changed(self,event):
+        # Ulanishning o'z foydalanuvchisi haqidagi o'zgarish yuborilmaydi
+        user_id = str(self.user.id)
+        joined = [user for user in event["joined"] if user["id"]!=user_id]
+        left = [left_id for left_id in event["left"] if left_id!=user_id]
+        if joined or left:
+            await self.send_json({"action":"participants_changed","joined":joined,"left":left})
+
+    @action()
+    async def get_participants(self,after=None,limit=None,**kwargs):
+        """Ishtirokchilar ro'yhatini sahifalab olish (after - oldingi sahifaning oxirgi id si)"""
+        try:
+            page = await self.fetch_participants(after=after,limit=limit)
+        except ValidationError as e:
+            await self.send_json({"action":"get_participants","errors":e.detail})
+            return
+        await self.send_json({"action":"get_participants",**page})
+
+    @database_sync_to_async
+    def fetch_participants(self,after=None,limit=None):
+        page = RosterPaginator.paginate(self.get_participants_queryset(),after=after,limit=limit)
+        page["users"] = self.participant_serializer_class(page["users"],many=True).data
+        return page
+
+    @database_sync_to_async
+    def serialize_participants(self,user_ids):
+        queryset = self.participant_serializer_class.Meta.model.objects.filter(id__in=user_ids)
+        return self.participant_serializer_class(queryset,many=True).data
@@ -0,0 +1,116 @@
+import uuid
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from channel.models import Channel, ChannelMessage, ChannelType
+from channel.serializers import ChannelMessageSerializer
+from chat.models import Chat, Message
+from chat.serializers import LeanMessageSerializer, MessageSerializer
+from group.models import Group, GroupMessage
+from group.serializers import GroupMessageSerializer, LeanGroupMessageSerializer
+from share.broadcast import LEAN_PROTOCOL_VERSION
+from share.paginations import MessageCursorPaginator
+
+ROOM_KINDS = ("chat", "group", "channel")
+
+
+def room_name(kind: str, room_id) -> str:
+    """Channel layer group of a room, the same one the per-room consumers use."""
+    return f"{kind}__{room_id}"
+
+
+def parse_room_name(name: str) -> dict:
+    kind, room_id = name.split("__", 1)
+    return {"kind": kind, "id": room_id}
+
+
+class GatewayService:
+    """
+    Rooms (chats, groups and channels) carried by the user gateway socket.
+    Access to any number of rooms is checked with at most one query per room kind,
+    history pages come from the same cursor paginator as the per-room consumers.
+    """
+
+    @classmethod
+    def get_max_rooms(cls) -> int:
+        return settings.GATEWAY_MAX_ROOMS
+
+    @classmethod
+    def parse_rooms(cls, rooms) -> list[tuple[str, str]]:
+        """[{"kind": "chat", "id": "..."}] -> [("chat", "...")], duplicates dropped"""
+        if not isinstance(rooms, list):
+            raise ValidationError({"rooms": ["Expected a list of rooms."]})
+        parsed = []
+        for room in rooms:
+            try:
+                if room["kind"] not in ROOM_KINDS:
+                    raise ValueError
+                key = (room["kind"], str(uuid.UUID(str(room["id"]))))
+            except (TypeError, KeyError, ValueError):
+                raise ValidationError({"rooms": [f"Invalid room: {room!r}."]})
+            if key not in parsed:
+                parsed.append(key)
+        return parsed
+
+    @classmethod
+    def get_allowed_rooms(cls, user, rooms: list[tuple[str, str]]) -> set[tuple[str, str]]:
+        """Rooms from the list the user may read (one query per room kind present)."""
+        ids = {kind: [room_id for room_kind, room_id in rooms if room_kind == kind] for kind in ROOM_KINDS}
+        allowed = set()
+        if ids["chat"]:
+            chat_ids = Chat.objects.filter(
+                Q(owner_id=user.id) | Q(user_id=user.id), id__in=ids["chat"]
+            ).values_list("id", flat=True)
+            allowed |= {("chat", str(chat_id)) for chat_id in chat_ids}
+        if ids["group"]:
+            group_ids = Group.objects.filter(
+                Q(is_private=False) | Q(owner_id=user.id) | Q(members__id=user.id), id__in=ids["group"]
+            ).values_list("id", flat=True).distinct()
+            allowed |= {("group", str(group_id)) for group_id in group_ids}
+        if ids["channel"]:
+            channel_ids = Channel.objects.filter(
+                Q(channel_type=ChannelType.PUBLIC.value) | Q(owner_id=user.id) | Q(memberships__user_id=user.id),
+                id__in=ids["channel"],
+            ).values_list("id", flat=True).distinct()
+            allowed |= {("channel", str(channel_id)) for channel_id in channel_ids}
+        return allowed
+
+    @classmethod
+    def get_message_queryset(cls, kind: str, room_id):
+        if kind == "chat":
+            return Message.objects.for_serialization().filter(chat_id=room_id)
+        if kind == "group":
+            return GroupMessage.objects.for_serialization().filter(group_id=room_id)
+        return ChannelMessage.objects.for_serialization().filter(channel_id=room_id)
+
+    @classmethod
+    def serialize_messages(cls, kind: str, messages, user, protocol_version: int):
+        lean = protocol_version >= LEAN_PROTOCOL_VERSION
+        if kind == "chat":
+            if lean:
+                return LeanMessageSerializer(messages, many=True).data
+            return MessageSerializer(messages, many=True, context={"user": user}).data
+        if kind == "group":
+            serializer_class = LeanGroupMessageSerializer if lean else GroupMessageSerializer
+            return serializer_class(messages, many=True).data
+        return ChannelMessageSerializer(messages, many=True).data
+
+    @classmethod
+    def get_history(cls, kind: str, room_id, user, protocol_version: int, before=None, after=None, limit=None) -> dict:
+        page = MessageCursorPaginator.paginate(
+            cls.get_message_queryset(kind, room_id), before=before, after=after, limit=limit
+        )
+        return {
+            "messages": cls.serialize_messages(kind, page["messages"], user, protocol_version),
+            "has_more": page["has_more"],
+            "cursors": page["cursors"],
+        }
+
+    @classmethod
+    def serialize_message_versions(cls, kind: str, message) -> tuple[dict, dict]:
+        """One new message in the legacy and lean formats, like broadcast_message of the room consumers"""
+        if kind == "chat":
+            return MessageSerializer(message).data, LeanMessageSerializer(message).data
+        return GroupMessageSerializer(message).data, LeanGroupMessageSerializer(message).data
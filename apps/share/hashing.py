@@ -0,0 +1,124 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.translation import gettext as _
+from rest_framework.exceptions import Throttled
+
+
+def setup_worker():
+    """Pool processes are spawned, not forked from a threaded server: they load Django themselves"""
+    django.setup()
+
+
+class PasswordHashService:
+    """
+    Password hashing (PBKDF2) in a bounded process pool.
+    Hashers are deliberately slow: run inline they keep a server process busy for
+    hundreds of milliseconds per call, and every socket served by that process waits.
+    The pool does the work in separate processes, at most PASSWORD_HASH_WORKERS at a time.
+    When PASSWORD_HASH_MAX_PENDING calls are already waiting, new ones are refused with
+    429 Too Many Requests, so a login burst is shed instead of queueing without limit.
+    PASSWORD_HASH_WORKERS = 0 hashes inline (management commands, single process setups).
+    """
+    _executor = None
+    _lock = threading.Lock()
+    _pending = 0
+
+    @classmethod
+    def get_workers(cls) -> int:
+        return getattr(settings, "PASSWORD_HASH_WORKERS", 2)
+
+    @classmethod
+    def get_max_pending(cls) -> int:
+        return getattr(settings, "PASSWORD_HASH_MAX_PENDING", 32)
+
+    @classmethod
+    def get_timeout(cls) -> float:
+        return getattr(settings, "PASSWORD_HASH_TIMEOUT", 10)
+
+    @classmethod
+    def get_executor(cls):
+        if cls._executor is None and cls.get_workers() > 0:
+            with cls._lock:
+                if cls._executor is None:
+                    cls._executor = ProcessPoolExecutor(
+                        max_workers=cls.get_workers(),
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=setup_worker,
+                    )
+        return cls._executor
+
+    @classmethod
+    def pending(cls) -> int:
+        return cls._pending
+
+    @classmethod
+    def release(cls, future: Future) -> None:
+        with cls._lock:
+            cls._pending -= 1
+
+    @classmethod
+    def busy(cls) -> Throttled:
+        return Throttled(wait=1, detail=_("Too many password checks right now, please try again."))
+
+    @classmethod
+    def submit(cls, function, *args) -> Future:
+        """Queue a hashing call, Throttled (429) when the queue is full"""
+        with cls._lock:
+            if cls._pending >= cls.get_max_pending():
+                raise cls.busy()
+            cls._pending += 1
+        try:
+            executor = cls.get_executor()
+            if executor is None:
+                future = Future()
+                future.set_result(function(*args))
+            else:
+                future = executor.submit(function, *args)
+        except BaseException:
+            cls.release(None)
+            raise
+        future.add_done_callback(cls.release)
+        return future
+
+    @classmethod
+    def run(cls, function, *args):
+        try:
+            return cls.submit(function, *args).result(timeout=cls.get_timeout())
+        except TimeoutError:
+            raise cls.busy()
+
+    @classmethod
+    async def arun(cls, function, *args):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(cls.submit(function, *args)), cls.get_timeout())
+        except TimeoutError:
+            raise cls.busy()
+
+    @classmethod
+    def make_password(cls, password: str) -> str:
+        return cls.run(hashers.make_password, password)
+
+    @classmethod
+    def check_password(cls, password: str, encoded: str) -> bool:
+        return cls.run(hashers.check_password, password, encoded)
+
+    @classmethod
+    async def amake_password(cls, password: str) -> str:
+        return await cls.arun(hashers.make_password, password)
+
+    @classmethod
+    async def acheck_password(cls, password: str, encoded: str) -> bool:
+        return await cls.arun(hashers.check_password, password, encoded)
+
+    @classmethod
+    def shutdown(cls) -> None:
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,97 @@
+from typing import Iterable, Optional
+
+from django.apps import apps
+from django.db import transaction
+from django_elasticsearch_dsl.apps import DEDConfig
+from django_elasticsearch_dsl.registries import registry
+from django_elasticsearch_dsl.signals import RealTimeSignalProcessor
+from django_redis import get_redis_connection
+from redis import Redis
+
+
+class SearchIndexService:
+    """
+    Write-behind queue for Elasticsearch documents.
+    A save only adds "app_label.model:pk" to a Redis set after the transaction commits,
+    so repeated writes to a row are indexed once. flush_search_index_task drains the set
+    in batches: one query and one bulk request (without a forced refresh) per document.
+    Rows that no longer exist are removed from the index in the same bulk request.
+    """
+    QUEUE_KEY = "search:index:pending"
+
+    @classmethod
+    def get_redis_client(cls)->Redis:
+        return get_redis_connection("default")
+
+    @classmethod
+    def get_documents(cls,model)->set:
+        return registry.get_documents([model])
+
+    @classmethod
+    def indexed_fields(cls,model)->Optional[set]:
+        """Model attributes the documents read, None when a prepare_<field> method may read anything"""
+        fields = set()
+        for document in cls.get_documents(model):
+            for name,field in getattr(document,"_fields",{}).items():
+                if hasattr(document,f"prepare_{name}") or hasattr(document,f"prepare_{name}_with_related"):
+                    return None
+                fields.add(field._path[0] if getattr(field,"_path",None) else name)
+        return fields
+
+    @classmethod
+    def is_relevant(cls,model,update_fields:Optional[Iterable[str]]=None)->bool:
+        """A save matters when the model is indexed and it may have changed an indexed field"""
+        if not DEDConfig.autosync_enabled() or not cls.get_documents(model):
+            return False
+        if update_fields is None:
+            return True
+        fields = cls.indexed_fields(model)
+        return fields is None or not fields.isdisjoint(update_fields)
+
+    @classmethod
+    def enqueue(cls,instance)->None:
+        member = f"{instance._meta.label_lower}:{instance.pk}"
+        transaction.on_commit(lambda:cls.get_redis_client().sadd(cls.QUEUE_KEY,member))
+
+    @classmethod
+    def pop_pending(cls,count:int)->dict:
+        """Take up to `count` queued rows, grouped by model: {model: [pk, ...]}"""
+        pending = {}
+        for member in cls.get_redis_client().spop(cls.QUEUE_KEY,count) or []:
+            label,pk = member.decode().split(":",1)
+            pending.setdefault(apps.get_model(label),[]).append(pk)
+        return pending
+
+    @classmethod
+    def index(cls,model,pks:list)->int:
+        """Index the current state of the rows, delete the ones that are gone"""
+        for document in cls.get_documents(model):
+            if document.django.ignore_signals:
+                continue
+            doc = document()
+            objects = list(doc.get_queryset().filter(pk__in=pks))
+            found = {str(instance.pk) for instance in objects}
+            stale = [model(pk=pk) for pk in pks if pk not in found]
+            if objects:
+                doc.update(objects,refresh=False)
+            if stale:
+                doc.update(stale,refresh=False,action="delete",raise_on_error=False)
+        return len(pks)
+
+
+class FieldAwareSignalProcessor(RealTimeSignalProcessor):
+    """
+    Signal processor that keeps indexing off the request path.
+    Saves that touch no indexed field (update_fields=["is_online","last_seen"], last_login, ...)
+    are ignored, the others and deletes are queued in SearchIndexService.
+    Documents with related_models are still updated by the stock processor.
+    """
+    def handle_save(self,sender,instance,update_fields=None,**kwargs):
+        # m2m_changed passes the through model as sender
+        if SearchIndexService.is_relevant(instance.__class__,update_fields):
+            SearchIndexService.enqueue(instance)
+        registry.update_related(instance)
+
+    def handle_delete(self,sender,instance,**kwargs):
+        if SearchIndexService.is_relevant(instance.__class__):
+            SearchIndexService.enqueue(instance)
@@ -0,0 +1,354 @@
+import asyncio
+import logging
+import time
+import uuid
+from urllib.parse import urlsplit, urlunsplit
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels_redis.core import RedisChannelLayer, RedisLoopLayer
+from redis import asyncio as aioredis
+from channels_redis.serializers import MsgPackSerializer, registry
+from channels_redis.utils import _wrap_close
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_default(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"can not serialize {type(value).__name__!r} object")
+
+
+class UUIDMsgPackSerializer(MsgPackSerializer):
+    """
+    msgpack that sends UUIDs as strings. Model observer events carry UUID primary keys;
+    the stock layer only serialized them when a group had members, a PUBLISH always does.
+    """
+    as_bytes = staticmethod(lambda message: msgpack.packb(message, default=_encode_default))
+
+
+registry.register_serializer("msgpack-uuid", UUIDMsgPackSerializer)
+
+
+class FanoutListener:
+    """
+    One pub/sub connection per Redis shard and event loop.
+    Subscribes to the fan-out channel of every room that has a local socket
+    and hands incoming events to the loop layer.
+    """
+    poll_interval = 0.1
+
+    def __init__(self, loop_layer: "FanoutLoopLayer", index: int):
+        self.loop_layer = loop_layer
+        self.index = index
+        self.lock = asyncio.Lock()
+        self.subscribed = set()
+        self.pubsub = None
+        self.task = None
+
+    async def subscribe(self, name: str):
+        async with self.lock:
+            if name in self.subscribed:
+                return
+            if self.pubsub is None:
+                self.pubsub = self.loop_layer.get_connection(self.index).pubsub()
+            await self.pubsub.subscribe(name)
+            self.subscribed.add(name)
+            if self.task is None:
+                self.task = asyncio.ensure_future(self.run())
+
+    async def unsubscribe(self, name: str):
+        async with self.lock:
+            if name not in self.subscribed:
+                return
+            self.subscribed.discard(name)
+            await self.pubsub.unsubscribe(name)
+
+    async def run(self):
+        while True:
+            try:
+                if self.pubsub.subscribed:
+                    message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=self.poll_interval)
+                    if message is not None:
+                        self.loop_layer.deliver(message["channel"], message["data"])
+                else:
+                    await asyncio.sleep(self.poll_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Fan-out listener failed, retrying")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+        self.task = self.pubsub = None
+        self.subscribed = set()
+
+
+class FanoutLoopLayer(RedisLoopLayer):
+    """
+    Per event loop state of NodeFanoutChannelLayer: Redis connections (as in the stock layer),
+    the room registry of local sockets, the pub/sub listeners and the pump that moves
+    direct messages of this process from Redis into the receive buffers.
+    """
+
+    def __init__(self, channel_layer: "NodeFanoutChannelLayer"):
+        super().__init__(channel_layer)
+        self.groups = {}  # group -> local channel names
+        self.listeners = {}
+        self.pump = None
+
+    def get_listener(self, index: int) -> FanoutListener:
+        if index not in self.listeners:
+            self.listeners[index] = FanoutListener(self, index)
+        return self.listeners[index]
+
+    def deliver(self, name, data):
+        """Room event from pub/sub: one in-memory copy per local socket of the room"""
+        if isinstance(name, bytes):
+            name = name.decode()
+        channels = self.groups.get(self.channel_layer.group_from_fanout_name(name))
+        if not channels:
+            return
+        message = self.channel_layer.deserialize(data)
+        # Like the stock layer for a process-wide message, every buffer gets the same dict
+        for channel in channels:
+            self.channel_layer.receive_buffer[channel].put_nowait(message)
+
+    def ensure_pump(self):
+        if self.pump is None:
+            self.pump = asyncio.ensure_future(self.run_pump())
+
+    async def run_pump(self):
+        """Direct (channel_layer.send) messages for every local channel, read from the process queue"""
+        real_channel = f"specific.{self.channel_layer.client_prefix}!"
+        while True:
+            try:
+                channel, message = await self.channel_layer.receive_single(real_channel)
+                self.channel_layer.receive_buffer[channel].put_nowait(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Channel layer receive pump failed, retrying")
+                await asyncio.sleep(1)
+
+    async def flush(self):
+        if self.pump is not None:
+            self.pump.cancel()
+            try:
+                await self.pump
+            except asyncio.CancelledError:
+                pass
+            self.pump = None
+        for listener in self.listeners.values():
+            await listener.close()
+        self.listeners = {}
+        self.groups = {}
+        await super().flush()
+
+
+class NodeFanoutChannelLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer whose groups fan out once per process instead of once per member.
+
+    The stock layer keeps every member channel in a Redis sorted set: each join and leave
+    is a Redis write, and every group_send reads the whole set back (ZRANGE of 10k channel
+    names for a 10k-member room) before a Lua script queues the event per process.
+    Here group membership of local sockets lives in a per-process registry: the first
+    local member of a room subscribes the process to the room's pub/sub channel, joins
+    and leaves after that stay in memory, group_send is a single PUBLISH whatever the
+    room size, and every process copies the event to its own sockets in memory.
+
+    Direct sends (channel_layer.send) keep the stock queue semantics. Pub/sub delivery is
+    at-most-once: a process that is not connected to Redis misses the room events of
+    that moment, just like sockets that are reconnecting.
+    Only channels created by this process (consumers' own channel_name) can join groups.
+
+    Hosts are shards: rooms and process queues are spread over them by consistent hash,
+    every shard gets its own blocking connection pool (max_connections per host entry).
+    """
+
+    pool_timeout = 5
+
+    def __init__(self, *args, serializer_format="msgpack-uuid", **kwargs):
+        super().__init__(*args, serializer_format=serializer_format, **kwargs)
+
+    def create_pool(self, index):
+        """Blocking pool: under a burst the layer waits for a free connection instead of failing"""
+        host = dict(self.hosts[index])
+        if "address" not in host:
+            return super().create_pool(index)
+        address = host.pop("address")
+        host.setdefault("timeout", self.pool_timeout)
+        return aioredis.BlockingConnectionPool.from_url(address, **host)
+
+    def shard_index(self, channel: str) -> int:
+        """Shard of a channel; process channels hash on their process part like receive_single does"""
+        if "!" in channel:
+            return self.consistent_hash(self.non_local_name(channel))
+        return next(self._send_index_generator)
+
+    def fanout_name(self, group: str) -> str:
+        return f"{self.prefix}:fanout:{group}"
+
+    def group_from_fanout_name(self, name: str) -> str:
+        return name[len(self.prefix) + len(":fanout:"):]
+
+    def is_local_channel(self, channel: str) -> bool:
+        return "!" in channel and self.non_local_name(channel) == f"specific.{self.client_prefix}!"
+
+    def loop_layer(self) -> FanoutLoopLayer:
+        loop = asyncio.get_running_loop()
+        try:
+            return self._layers[loop]
+        except KeyError:
+            _wrap_close(self, loop)
+            layer = self._layers[loop] = FanoutLoopLayer(self)
+            return layer
+
+    def connection(self, index):
+        if not 0 <= index < self.ring_size:
+            raise ValueError(f"There are only {self.ring_size} hosts - you asked for {index}!")
+        return self.loop_layer().get_connection(index)
+
+    async def send(self, channel, message):
+        """
+        Stock send in one pipelined round trip instead of four
+        (expire old messages, count, add, refresh the key TTL).
+        """
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+        channel_non_local_name = channel
+        if "!" in channel:
+            message = dict(message.items())
+            message["__asgi_channel__"] = channel
+            channel_non_local_name = self.non_local_name(channel)
+        channel_key = self.prefix + channel_non_local_name
+        connection = self.connection(self.shard_index(channel))
+        member = self.serialize(message)
+        async with connection.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(channel_key, min=0, max=int(time.time()) - int(self.expiry))
+            pipe.zcount(channel_key, "-inf", "+inf")
+            pipe.zadd(channel_key, {member: time.time()})
+            pipe.expire(channel_key, int(self.expiry))
+            _, queued, _, _ = await pipe.execute()
+        if queued >= self.get_capacity(channel):
+            await connection.zrem(channel_key, member)
+            raise ChannelFull()
+
+    async def receive(self, channel):
+        if "!" not in channel:
+            return await super().receive(channel)
+        assert self.is_local_channel(channel), "Wrong client prefix"
+        # Every local channel waits on its own buffer, filled by the pump and the fan-out listeners
+        self.loop_layer().ensure_pump()
+        queue = self.receive_buffer[channel]
+        try:
+            message = await queue.get()
+        except asyncio.CancelledError:
+            # The consumer is gone, drop its buffer
+            self.receive_buffer.pop(channel, None)
+            raise
+        if queue.empty():
+            self.receive_buffer.pop(channel, None)
+        return message
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        if not self.is_local_channel(channel):
+            raise RuntimeError(
+                "NodeFanoutChannelLayer can only add channels of this process to groups "
+                "(self.channel_layer.group_add(group, self.channel_name))."
+            )
+        loop_layer = self.loop_layer()
+        channels = loop_layer.groups.setdefault(group, set())
+        channels.add(channel)
+        if len(channels) == 1:
+            await loop_layer.get_listener(self.consistent_hash(group)).subscribe(self.fanout_name(group))
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        loop_layer = self.loop_layer()
+        channels = loop_layer.groups.get(group)
+        if not channels or channel not in channels:
+            return
+        channels.discard(channel)
+        if not channels:
+            del loop_layer.groups[group]
+            await loop_layer.get_listener(self.consistent_hash(group)).unsubscribe(self.fanout_name(group))
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), "Group name not valid"
+        connection = self.connection(self.consistent_hash(group))
+        await connection.publish(self.fanout_name(group), self.serialize(message))
+
+    async def group_send_many(self, events: list[tuple[str, dict]]):
+        """Several room events (group, message): PUBLISHes are pipelined per shard"""
+        by_shard = {}
+        for group, message in events:
+            assert self.valid_group_name(group), "Group name not valid"
+            by_shard.setdefault(self.consistent_hash(group), []).append((group, message))
+        for index, shard_events in by_shard.items():
+            async with self.connection(index).pipeline(transaction=False) as pipe:
+                for group, message in shard_events:
+                    pipe.publish(self.fanout_name(group), self.serialize(message))
+                await pipe.execute()
+
+    def redacted_address(self, index: int):
+        address = self.hosts[index].get("address")
+        if not address:
+            return None
+        parts = urlsplit(address)
+        return urlunsplit(parts._replace(netloc=parts.netloc.rsplit("@", 1)[-1]))
+
+    async def shard_stats(self) -> dict:
+        """
+        Queue depth per shard (direct messages waiting in process queues, rooms with
+        pub/sub subscribers) and the room registry of this process.
+        """
+        shards = []
+        for index in range(self.ring_size):
+            connection = self.connection(index)
+            queue_keys = [
+                key async for key in connection.scan_iter(match=f"{self.prefix}*", count=1000)
+                if not key.endswith(b"$inflight") and b":group:" not in key
+            ]
+            depths = []
+            if queue_keys:
+                async with connection.pipeline(transaction=False) as pipe:
+                    for key in queue_keys:
+                        pipe.zcard(key)
+                    depths = await pipe.execute()
+            rooms = await connection.pubsub_channels(f"{self.fanout_name('')}*")
+            shards.append({
+                "shard": index,
+                "address": self.redacted_address(index),
+                "queues": len(queue_keys),
+                "queued_messages": sum(depths),
+                "max_queue_depth": max(depths, default=0),
+                "rooms": len(rooms),
+            })
+        loop_layers = [layer for layer in self._layers.values() if isinstance(layer, FanoutLoopLayer)]
+        return {
+            "shards": shards,
+            "process": {
+                "rooms": sum(len(layer.groups) for layer in loop_layers),
+                "members": sum(len(channels) for layer in loop_layers for channels in layer.groups.values()),
+                "buffered_messages": sum(queue.qsize() for queue in self.receive_buffer.values()),
+            },
+        }
+
+    async def flush(self):
+        await super().flush()
+        self.receive_buffer.clear()
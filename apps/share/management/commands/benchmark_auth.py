@@ -0,0 +1,58 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from share.cache import LocalTTLCache
+from share.services import TokenService
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare access token check overhead: the old per-user token set (SMEMBERS), "
+        "the jti revocation list and the in-process cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=5000, help="Number of checks per scheme")
+        parser.add_argument("--tokens", type=int, default=50, help="Tokens in the user's set for the old scheme")
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        user_id = uuid.uuid4()
+        token = AccessToken()
+        token["user_id"] = str(user_id)
+        raw_token = str(token)
+        redis_client = TokenService.get_redis_client()
+
+        # Old scheme: every request transferred the whole token set of the user
+        token_set_key = f"benchmark:user:{user_id}:access"
+        redis_client.sadd(token_set_key, raw_token, *[f"token-{i}" for i in range(options["tokens"] - 1)])
+        try:
+            started = time.perf_counter()
+            for _ in range(count):
+                assert raw_token.encode() in redis_client.smembers(token_set_key)
+            token_set = time.perf_counter() - started
+        finally:
+            redis_client.delete(token_set_key)
+
+        started = time.perf_counter()
+        for _ in range(count):
+            assert not TokenService.is_token_revoked(token)
+        revocation_list = time.perf_counter() - started
+
+        cache = LocalTTLCache(maxsize=10000, ttl=60)
+        cache.set((str(user_id), token["jti"]), True)
+        started = time.perf_counter()
+        for _ in range(count):
+            assert cache.get((str(user_id), token["jti"]))
+        local_cache = time.perf_counter() - started
+
+        self.stdout.write(f"checks: {count}, tokens in the old set: {options['tokens']}")
+        for name, elapsed in (
+            ("token set (SMEMBERS)", token_set),
+            ("revocation list", revocation_list),
+            ("local cache", local_cache),
+        ):
+            self.stdout.write(f"{name}: {elapsed:.3f}s ({elapsed / count * 1e6:.1f} us/check)")
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from channels_redis.core import RedisChannelLayer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from share.layers import NodeFanoutChannelLayer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare one group_send to a room with N local subscribers on the stock "
+        "RedisChannelLayer and on NodeFanoutChannelLayer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--subscribers", type=int, nargs="+", default=[1000, 10000, 100000], help="Room sizes to measure"
+        )
+
+    def handle(self, *args, **options):
+        for subscribers in options["subscribers"]:
+            for name, layer_class in (("stock", RedisChannelLayer), ("node fan-out", NodeFanoutChannelLayer)):
+                layer = layer_class(
+                    hosts=[settings.REDIS_URL], prefix=f"benchmark-fanout-{name.replace(' ', '-')}",
+                    capacity=10,
+                )
+                send, deliver, members_read = async_to_sync(self.run)(layer, subscribers)
+                self.stdout.write(
+                    f"{name:>12} | subscribers: {subscribers:>6} | group_send: {send * 1000:8.1f} ms "
+                    f"| all delivered: {deliver * 1000:9.1f} ms | members read from redis per send: {members_read}"
+                )
+
+    async def run(self, layer, subscribers):
+        group = "group__benchmark"
+        channels = [await layer.new_channel() for _ in range(subscribers)]
+        try:
+            if isinstance(layer, NodeFanoutChannelLayer):
+                for channel in channels:
+                    await layer.group_add(group, channel)
+                members_read = 0
+            else:
+                # The same sorted set that group_add would build, written in one command
+                connection = layer.connection(layer.consistent_hash(group))
+                await connection.zadd(layer._group_key(group), {channel: time.time() for channel in channels})
+                members_read = subscribers
+
+            # Sockets are already waiting for events, like connected consumers
+            receivers = [asyncio.ensure_future(layer.receive(channel)) for channel in channels]
+            await asyncio.sleep(0.5)
+            started = time.perf_counter()
+            await layer.group_send(group, {"type": "group.message", "text": "Benchmark"})
+            send = time.perf_counter() - started
+            await asyncio.gather(*receivers)
+            deliver = time.perf_counter() - started
+        finally:
+            await layer.flush()
+        return send, deliver, members_read
@@ -0,0 +1,67 @@
+import time
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.models import Chat
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare watching N chats with one socket per chat against one gateway socket "
+        "subscribed to all of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=50, help="Number of chats the user watches")
+
+    def handle(self, *args, **options):
+        owner, _ = User.objects.get_or_create(phone_number="benchmark-owner")
+        peers = [
+            User.objects.get_or_create(phone_number=f"benchmark-peer-{i}")[0] for i in range(options["rooms"])
+        ]
+        Chat.objects.filter(owner=owner, user__in=peers).delete()
+        chats = Chat.objects.bulk_create([Chat(owner=owner, user=peer) for peer in peers])
+        try:
+            token = str(AccessToken.for_user(owner))
+            per_room, gateway = async_to_sync(self.run)(token, [str(chat.id) for chat in chats])
+        finally:
+            Chat.objects.filter(id__in=[chat.id for chat in chats]).delete()
+
+        self.stdout.write(f"rooms: {len(chats)}")
+        self.stdout.write(f"socket per room: {len(chats)} sockets, {per_room * 1000:.1f} ms")
+        self.stdout.write(f"gateway: 1 socket, {gateway * 1000:.1f} ms")
+
+    async def run(self, token, chat_ids):
+        from core.asgi import application
+
+        started = time.perf_counter()
+        communicators = []
+        for chat_id in chat_ids:
+            communicator = WebsocketCommunicator(application, f"/ws/chats/{chat_id}/?token={token}")
+            await communicator.connect(timeout=10)
+            await communicator.receive_json_from(timeout=10)  # get_messages
+            await communicator.receive_json_from(timeout=10)  # get_participants
+            communicators.append(communicator)
+        per_room = time.perf_counter() - started
+        for communicator in communicators:
+            await communicator.disconnect()
+
+        started = time.perf_counter()
+        communicator = WebsocketCommunicator(application, f"/ws/gateway/?token={token}")
+        await communicator.connect(timeout=10)
+        await communicator.send_json_to(
+            {
+                "action": "subscribe",
+                "request_id": "benchmark",
+                "rooms": [{"kind": "chat", "id": chat_id} for chat_id in chat_ids],
+            }
+        )
+        await communicator.receive_json_from(timeout=10)
+        gateway = time.perf_counter() - started
+        await communicator.disconnect()
+        return per_room, gateway
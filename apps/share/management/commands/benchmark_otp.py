@@ -0,0 +1,70 @@
+import time
+from unittest import mock
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from share.utils import otp_digest, otp_keys, redis_conn
+from user.models import User
+from user.views import LoginView, VerifyView
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure requests/sec of /api/users/login/ and /api/users/verify/ and compare "
+        "the OTP hashing cost of the password hasher with the keyed HMAC."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Login + verify rounds")
+        parser.add_argument("--hashes", type=int, default=20, help="Hash + check pairs per scheme")
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        phone_number = "+998900009999"
+        User.objects.get_or_create(phone_number=phone_number, defaults={"is_verified": True})
+        redis_conn.delete(*otp_keys(phone_number))
+        client = Client()
+        login_time = verify_time = 0.0
+        try:
+            # Anonim throttling va email yuborish o'lchovga kirmaydi
+            with override_settings(ALLOWED_HOSTS=["testserver"]), \
+                    mock.patch.object(LoginView, "throttle_classes", []), \
+                    mock.patch.object(VerifyView, "throttle_classes", []), \
+                    mock.patch("user.serializers.send_email_task") as send_email:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    response = client.post(
+                        "/api/users/login/", {"phone_number": phone_number}, content_type="application/json"
+                    )
+                    login_time += time.perf_counter() - started
+                    assert response.status_code == 200, response.content
+                    otp_code = send_email.delay.call_args.kwargs["otp_code"]
+
+                    started = time.perf_counter()
+                    response = client.patch(
+                        f"/api/users/verify/{response.json()['otp_secret']}/",
+                        {"phone_number": phone_number, "otp_code": otp_code},
+                        content_type="application/json",
+                    )
+                    verify_time += time.perf_counter() - started
+                    assert response.status_code == 200, response.content
+        finally:
+            redis_conn.delete(*otp_keys(phone_number))
+
+        self.stdout.write(f"rounds: {count}")
+        self.stdout.write(f"login: {count / login_time:.1f} req/s ({login_time / count * 1000:.2f} ms/request)")
+        self.stdout.write(f"verify: {count / verify_time:.1f} req/s ({verify_time / count * 1000:.2f} ms/request)")
+
+        hashes = options["hashes"]
+        started = time.perf_counter()
+        for i in range(hashes):
+            assert check_password(f"secret:{i:06d}", make_password(f"secret:{i:06d}"))
+        password_hasher = time.perf_counter() - started
+        started = time.perf_counter()
+        for i in range(hashes):
+            assert otp_digest(phone_number, "secret", f"{i:06d}") == otp_digest(phone_number, "secret", f"{i:06d}")
+        keyed_hmac = time.perf_counter() - started
+        for name, elapsed in (("password hasher", password_hasher), ("keyed HMAC", keyed_hmac)):
+            self.stdout.write(f"{name}: {elapsed / hashes * 1000:.3f} ms per issue + verify")
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from share.tasks import send_push_batch
+
+
+class Command(BaseCommand):
+    help = "Measure push delivery throughput offline against the fake FCM transport."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tokens", type=int, default=10000, help="Number of device tokens")
+        parser.add_argument("--latency", type=float, default=0.05, help="Fake FCM latency per call, seconds")
+        parser.add_argument(
+            "--unregistered", type=float, default=0.01, help="Share of tokens FCM reports as unregistered"
+        )
+
+    def handle(self, *args, **options):
+        count = options["tokens"]
+        unregistered_every = int(1 / options["unregistered"]) if options["unregistered"] else 0
+        tokens = [
+            f"unregistered-{i}" if unregistered_every and i % unregistered_every == 0 else f"token-{i}"
+            for i in range(count)
+        ]
+        with override_settings(PUSH_TRANSPORT="share.push.FakeTransport", PUSH_FAKE_LATENCY=options["latency"]):
+            started = time.perf_counter()
+            result = send_push_batch.apply(args=("Benchmark", "Benchmark body"), kwargs={"tokens": tokens}).get()
+            elapsed = time.perf_counter() - started
+
+        per_token_estimate = count * options["latency"]
+        self.stdout.write(f"tokens: {count}, result: {result}")
+        self.stdout.write(f"multicast: {elapsed:.2f}s ({count / elapsed:.0f} tokens/s)")
+        self.stdout.write(f"one call per token would take about {per_token_estimate:.2f}s")
@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from chat.models import Chat, Message, ScheduledMessage
+from chat.tasks import send_scheduled_message
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure scheduled message throughput with several workers draining the same backlog "
+        "and check that no message is sent twice. Needs a database with SKIP LOCKED (PostgreSQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=5000, help="Number of due scheduled messages")
+        parser.add_argument("--workers", type=int, default=4, help="Number of concurrent workers")
+        parser.add_argument("--chats", type=int, default=50, help="Number of chats the messages are spread over")
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows claimed per transaction")
+
+    def handle(self, *args, **options):
+        count, workers = options["messages"], options["workers"]
+        # Benchmark users are kept between runs, a chat needs a distinct peer per owner
+        owner, _ = User.objects.get_or_create(phone_number="benchmark-owner")
+        peers = [User.objects.get_or_create(phone_number=f"benchmark-peer-{i}")[0] for i in range(options["chats"])]
+        Chat.objects.filter(owner=owner).delete()
+        try:
+            chats = Chat.objects.bulk_create([Chat(owner=owner, user=peer) for peer in peers])
+            due_at = timezone.now() - timedelta(seconds=1)
+            scheduled = ScheduledMessage.objects.bulk_create(
+                [
+                    ScheduledMessage(
+                        chat=chats[i % len(chats)], sender=owner, text=f"Benchmark {i}", scheduled_time=due_at
+                    )
+                    for i in range(count)
+                ],
+                batch_size=1000,
+            )
+
+            # Every worker is handed the whole backlog, so they all compete for the same rows
+            ids = [scheduled_message.id for scheduled_message in scheduled]
+            with override_settings(SCHEDULER_BATCH_SIZE=options["batch_size"]):
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    reported = sum(pool.map(self.run_worker, [ids] * workers))
+                elapsed = time.perf_counter() - started
+
+            created = Message.objects.filter(chat__owner=owner).count()
+            left = ScheduledMessage.objects.filter(sender=owner, sent=False).count()
+            self.stdout.write(f"messages: {count}, workers: {workers}, batch size: {options['batch_size']}")
+            self.stdout.write(f"sent: {reported}, created: {created}, left unsent: {left}")
+            self.stdout.write(f"elapsed: {elapsed:.2f}s ({created / elapsed:.0f} messages/s)")
+            if created != count or reported != count:
+                self.stderr.write(self.style.ERROR("Scheduled messages were sent more than once or lost."))
+        finally:
+            # Scheduled and sent messages are removed with the chats (CASCADE)
+            Chat.objects.filter(owner=owner).delete()
+
+    @staticmethod
+    def run_worker(ids):
+        try:
+            return send_scheduled_message(ids=ids)
+        finally:
+            connection.close()
@@ -0,0 +1,68 @@
+import asyncio
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.models import Chat, Message
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure chat WebSocket connect latency (handshake until the first history page arrives) "
+        "and print percentiles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=200, help="Number of connections to open")
+        parser.add_argument("--concurrency", type=int, default=10, help="Connections opened at the same time")
+        parser.add_argument("--messages", type=int, default=100, help="Messages in the chat history")
+
+    def handle(self, *args, **options):
+        owner, _ = User.objects.get_or_create(phone_number="benchmark-owner")
+        peer, _ = User.objects.get_or_create(phone_number="benchmark-peer-0")
+        Chat.objects.filter(owner=owner, user=peer).delete()
+        chat = Chat.objects.create(owner=owner, user=peer)
+        try:
+            Message.objects.bulk_create(
+                [Message(chat=chat, sender=owner, text=f"Benchmark {i}") for i in range(options["messages"])]
+            )
+            token = str(AccessToken.for_user(owner))
+            latencies = async_to_sync(self.run)(
+                f"/ws/chats/{chat.id}/?token={token}", options["connections"], options["concurrency"]
+            )
+        finally:
+            chat.delete()
+
+        latencies.sort()
+        self.stdout.write(f"connections: {len(latencies)}, concurrency: {options['concurrency']}")
+        for percentile in (50, 90, 99):
+            index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+            self.stdout.write(f"p{percentile}: {latencies[index] * 1000:.1f} ms")
+        self.stdout.write(f"mean: {statistics.mean(latencies) * 1000:.1f} ms")
+
+    async def run(self, path, connections, concurrency):
+        from core.asgi import application
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def connect_once():
+            async with semaphore:
+                communicator = WebsocketCommunicator(application, path)
+                started = time.perf_counter()
+                connected, _ = await communicator.connect(timeout=10)
+                if connected:
+                    await communicator.receive_json_from(timeout=10)  # get_messages
+                    latencies.append(time.perf_counter() - started)
+                await communicator.disconnect()
+
+        await asyncio.gather(*(connect_once() for _ in range(connections)))
+        # Let the coalesced roster updates of the last connections go out
+        await asyncio.sleep(settings.ROSTER_DELTA_WINDOW)
+        return latencies
@@ -0,0 +1,19 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from share.scheduler import MessageScheduler
+
+
+class Command(BaseCommand):
+    help = "Run the scheduled-message loop (chat, group and channel)."
+
+    def handle(self, *args, **options):
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        self.stdout.write("Scheduler started.")
+        try:
+            MessageScheduler.run_forever(should_stop=lambda: bool(stopping))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write("Scheduler stopped.")
@@ -1,4 +1,6 @@
 import os
+from typing import Optional
+from urllib.parse import parse_qs
 
 import django
 import jwt
@@ -6,11 +8,12 @@ from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
-from django.db import close_old_connections
 
 from channels.sessions import CookieMiddleware,SessionMiddleware
 from rest_framework_simplejwt.utils import aware_utcnow
 
+from share.cache import AuthCache
+from share.services import TokenService
 from user.models import User
 
 ALGORITHM = "HS256"
@@ -19,39 +22,71 @@ ALGORITHM = "HS256"
 os.environ.setdefault("DJANGO_SETTINGS_MODULE","config.settings")
 django.setup()
 
-#Foydalanuvchini jwt token orqali olish funksiyasi
-@database_sync_to_async
-def get_user(token):
+def decode_token(token)->Optional[dict]:
+    """Tokenni bazaga murojaat qilmasdan tekshirish (imzo va muddat)"""
     try:
-        #Tokenni decode qilish
         payload = jwt.decode(token,settings.SECRET_KEY,algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         #Token muddati tugagan bo'lsa
-        return AnonymousUser()
+        return None
     except jwt.InvalidTokenError:
         #token yaroqsiz bo'lsa
-        return AnonymousUser()
+        return None
+    #Refresh token bilan ulanib bo'lmaydi
+    if payload.get('token_type','access') != 'access':
+        return None
+    return payload
+
+def load_user(user_id):
+    """Kesh sovuq bo'lganda foydalanuvchini bazadan olish (yagona thread hop)"""
     try:
-        user = User.objects.get(id=payload['user_id'])
+        user = User.objects.get(id=user_id)
     except User.DoesNotExist:
         #Foydalanuvchi mavjud emas
         return AnonymousUser()
+    if not user.is_active:
+        return AnonymousUser()
+    AuthCache.remember_user(user)
     return user
 
+#Foydalanuvchini jwt token orqali olish funksiyasi.
+#Token va foydalanuvchi REST autentifikatsiyasi bilan umumiy keshda bo'lsa bazaga ham, Redis'ga ham murojaat qilinmaydi.
+#Bekor qilinganini tekshirish async Redis client orqali event loop'da bajariladi, thread pool faqat bazaga kerak
+async def get_user(token):
+    payload = decode_token(token)
+    if payload is None:
+        return AnonymousUser()
+    user_id = payload.get('user_id')
+    if not AuthCache.is_token_valid(user_id,payload.get('jti')):
+        if await TokenService.ais_token_revoked(payload):
+            return AnonymousUser()
+        AuthCache.remember_token(user_id,payload.get('jti'))
+    user = AuthCache.get_user(user_id)
+    if user is not None:
+        return user
+    return await database_sync_to_async(load_user)(user_id)
+
+def get_token(scope)->Optional[str]:
+    query = parse_qs(scope.get("query_string",b"").decode())
+    return query.get("token",[None])[0]
+
 # JWT authentifikatsiya Middleware
 class TokenAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope,receive,send):
-        close_old_connections()
-        token_key = None
-        query_string = scope.get("query_string",b"").decode()
-
-        #Queary string orqali tokkeni olish
-        if query_string:
-            token_key = dict(x.split("=") for x in query_string.split("&")).get('token')
+        token_key = get_token(scope)
         #Foydalanuvchi aniqlash va scope'ga qo'shish
-        scope['user']  = await get_user(token_key)
+        scope['user'] = await get_user(token_key)
+        # Muddati o'tgan, yaroqsiz yoki bekor qilingan token bilan kelgan ulanish
+        # router va consumer yaratilmasdan oldin rad etiladi
+        if token_key and scope.get("type") == "websocket" and not scope['user'].is_authenticated:
+            return await self.reject(receive,send)
         return await super().__call__(scope,receive,send)
 
+    async def reject(self,receive,send):
+        message = await receive()
+        if message["type"] == "websocket.connect":
+            await send({"type":"websocket.close","code":4401})
+
 #WebSocket Uchun middleware Stack
 def JwtAuthMiddlewareStack(inner):
     return CookieMiddleware(SessionMiddleware(TokenAuthMiddleware(inner)))
\ No newline at end of file
@@ -0,0 +1,115 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+class MessageCursorPaginator:
+    """
+    Keyset pagination over (sent_at, id) for message history.
+    Cursors are opaque url-safe strings, pages are always returned oldest first.
+    """
+    page_size = getattr(settings, "MESSAGE_HISTORY_PAGE_SIZE", 50)
+    max_page_size = getattr(settings, "MESSAGE_HISTORY_MAX_PAGE_SIZE", 100)
+
+    @classmethod
+    def encode_cursor(cls, message) -> str:
+        payload = json.dumps({"sent_at": message.sent_at.isoformat(), "id": str(message.id)})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    @classmethod
+    def decode_cursor(cls, cursor: str, model) -> tuple[datetime, object]:
+        """Cursors come from clients: the id is converted with the model's primary key field"""
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            sent_at = parse_datetime(payload["sent_at"])
+            message_id = model._meta.pk.to_python(payload["id"])
+        except (TypeError, ValueError, KeyError, AttributeError, DjangoValidationError):
+            raise ValidationError("Invalid cursor.")
+        if sent_at is None or message_id is None:
+            raise ValidationError("Invalid cursor.")
+        return sent_at, message_id
+
+    @classmethod
+    def get_limit(cls, limit=None) -> int:
+        try:
+            limit = int(limit) if limit is not None else cls.page_size
+        except (TypeError, ValueError):
+            limit = cls.page_size
+        return max(1, min(limit, cls.max_page_size))
+
+    @classmethod
+    def paginate(cls, queryset: QuerySet, before: str = None, after: str = None, limit=None) -> dict:
+        """
+        before - messages older than the cursor
+        after - messages newer than the cursor
+        Without a cursor the newest page is returned.
+        """
+        limit = cls.get_limit(limit)
+        if after:
+            sent_at, message_id = cls.decode_cursor(after, queryset.model)
+            queryset = queryset.filter(
+                Q(sent_at__gt=sent_at) | Q(sent_at=sent_at, id__gt=message_id)
+            ).order_by("sent_at", "id")
+            messages = list(queryset[:limit + 1])
+            has_more = len(messages) > limit
+            messages = messages[:limit]
+        else:
+            if before:
+                sent_at, message_id = cls.decode_cursor(before, queryset.model)
+                queryset = queryset.filter(
+                    Q(sent_at__lt=sent_at) | Q(sent_at=sent_at, id__lt=message_id)
+                )
+            messages = list(queryset.order_by("-sent_at", "-id")[:limit + 1])
+            has_more = len(messages) > limit
+            messages = messages[:limit][::-1]
+
+        return {
+            "messages": messages,
+            "has_more": has_more,
+            "cursors": {
+                "before": cls.encode_cursor(messages[0]) if messages else before,
+                "after": cls.encode_cursor(messages[-1]) if messages else after,
+            },
+        }
+
+
+class RosterPaginator:
+    """
+    Keyset pagination of room participants ordered by user id.
+    The cursor is the id of the last user on the previous page.
+    """
+    page_size = getattr(settings, "ROSTER_PAGE_SIZE", 100)
+    max_page_size = getattr(settings, "ROSTER_MAX_PAGE_SIZE", 500)
+
+    @classmethod
+    def get_limit(cls, limit=None) -> int:
+        try:
+            limit = int(limit) if limit is not None else cls.page_size
+        except (TypeError, ValueError):
+            limit = cls.page_size
+        return max(1, min(limit, cls.max_page_size))
+
+    @classmethod
+    def paginate(cls, queryset: QuerySet, after: str = None, limit=None) -> dict:
+        limit = cls.get_limit(limit)
+        if after:
+            try:
+                after = uuid.UUID(str(after))
+            except ValueError:
+                raise ValidationError("Invalid cursor.")
+            queryset = queryset.filter(id__gt=after)
+        users = list(queryset.order_by("id")[:limit + 1])
+        has_more = len(users) > limit
+        users = users[:limit]
+        return {
+            "users": users,
+            "has_more": has_more,
+            "next": str(users[-1].id) if has_more else None,
+        }
@@ -0,0 +1,54 @@
+import itertools
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from firebase_admin import exceptions, messaging
+
+# FCM accepts at most 500 tokens per multicast call
+MAX_MULTICAST_TOKENS = 500
+
+# Errors that mean the token will never work again and should be forgotten
+UNREGISTERED_ERRORS = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+# Errors worth retrying later with backoff
+TRANSIENT_ERRORS = (
+    messaging.QuotaExceededError,
+    exceptions.UnavailableError,
+    exceptions.InternalError,
+    exceptions.DeadlineExceededError,
+    exceptions.ResourceExhaustedError,
+)
+
+
+class FirebaseTransport:
+    """Sends multicast messages through the real FCM API."""
+
+    def send_multicast(self, message: messaging.MulticastMessage) -> messaging.BatchResponse:
+        return messaging.send_each_for_multicast(message)
+
+
+class FakeTransport:
+    """
+    Offline stand-in for FCM, used for tests and benchmarks.
+    Tokens starting with "unregistered" fail as unregistered, tokens starting
+    with "unavailable" fail as a transient error, every other token succeeds.
+    PUSH_FAKE_LATENCY seconds are slept per call to imitate the network.
+    """
+    counter = itertools.count()
+
+    def send_multicast(self, message: messaging.MulticastMessage) -> messaging.BatchResponse:
+        latency = getattr(settings, "PUSH_FAKE_LATENCY", 0)
+        if latency:
+            time.sleep(latency)
+        return messaging.BatchResponse([self.respond(token) for token in message.tokens])
+
+    def respond(self, token: str) -> messaging.SendResponse:
+        if token.startswith("unregistered"):
+            return messaging.SendResponse(None, messaging.UnregisteredError("Requested entity was not found."))
+        if token.startswith("unavailable"):
+            return messaging.SendResponse(None, exceptions.UnavailableError("FCM is temporarily unavailable."))
+        return messaging.SendResponse({"name": f"projects/fake/messages/{next(self.counter)}"}, None)
+
+
+def get_transport():
+    return import_string(getattr(settings, "PUSH_TRANSPORT", "share.push.FirebaseTransport"))()
@@ -0,0 +1,155 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+from redis import Redis
+
+# Atomically take up to ARGV[2] members due at ARGV[1], so several scheduler
+# processes never dispatch the same item twice.
+POP_DUE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #items > 0 then
+    redis.call('ZREM', KEYS[1], unpack(items))
+end
+return items
+"""
+
+
+class MessageScheduler:
+    """
+    One scheduler for chat, group and channel scheduled messages.
+    Pending items live in a Redis sorted set scored by due time, members are
+    "<kind>:<id>". The loop sleeps exactly until the head of the set is due
+    (or until an earlier item is scheduled), then dispatches due items in
+    batches to the kind's task. The set is rebuilt from the database on start
+    and periodically, so nothing is lost if Redis is flushed.
+    Kinds are configured in settings.SCHEDULED_MESSAGE_KINDS.
+    """
+    DUE_KEY = "scheduler:due"
+    WAKEUP_KEY = "scheduler:wakeup"
+
+    @classmethod
+    def get_redis_client(cls) -> Redis:
+        return get_redis_connection("default")
+
+    @classmethod
+    def get_kinds(cls) -> dict:
+        return settings.SCHEDULED_MESSAGE_KINDS
+
+    @classmethod
+    def get_batch_size(cls) -> int:
+        return settings.SCHEDULER_BATCH_SIZE
+
+    @classmethod
+    def to_timestamp(cls, due_at) -> float:
+        """Rows created from client data may still hold the raw ISO string."""
+        if isinstance(due_at, str):
+            due_at = parse_datetime(due_at)
+        if timezone.is_naive(due_at):
+            due_at = timezone.make_aware(due_at)
+        return due_at.timestamp()
+
+    @classmethod
+    def schedule(cls, kind: str, object_id, due_at: datetime) -> None:
+        member = f"{kind}:{object_id}"
+        redis_client = cls.get_redis_client()
+        pipeline = redis_client.pipeline()
+        pipeline.zadd(cls.DUE_KEY, {member: cls.to_timestamp(due_at)})
+        pipeline.zrange(cls.DUE_KEY, 0, 0)
+        _, head = pipeline.execute()
+        # The new item is the earliest one: wake the loop so it can shorten its sleep
+        if head and head[0].decode() == member:
+            pipeline = redis_client.pipeline()
+            pipeline.lpush(cls.WAKEUP_KEY, 1)
+            pipeline.ltrim(cls.WAKEUP_KEY, 0, 0)
+            pipeline.execute()
+
+    @classmethod
+    def schedule_on_commit(cls, kind: str, scheduled_message) -> None:
+        """Schedule once the row is committed, so the dispatcher can see it."""
+        transaction.on_commit(
+            lambda: cls.schedule(kind, scheduled_message.pk, scheduled_message.scheduled_time)
+        )
+
+    @classmethod
+    def claim_due(cls, queryset, ids=None, limit: int = None) -> list:
+        """
+        Lock up to `limit` unsent rows of `queryset` with FOR UPDATE SKIP LOCKED.
+        Rows already claimed by another worker are skipped instead of waited on,
+        so any number of workers can drain the same backlog without sending a
+        row twice. Must be called inside transaction.atomic(): the claim lasts
+        until the transaction that marks the rows sent commits.
+        `ids` narrows the claim to items handed over by the scheduler loop,
+        otherwise every row whose scheduled_time has passed is due.
+        """
+        limit = limit or cls.get_batch_size()
+        queryset = queryset.select_for_update(skip_locked=True, of=("self",)).filter(sent=False)
+        if ids is not None:
+            queryset = queryset.filter(id__in=ids)
+        else:
+            queryset = queryset.filter(scheduled_time__lte=timezone.now())
+        return list(queryset.order_by("scheduled_time")[:limit])
+
+    @classmethod
+    def pop_due(cls, now: float = None, limit: int = None) -> list[str]:
+        now = time.time() if now is None else now
+        limit = limit or cls.get_batch_size()
+        items = cls.get_redis_client().eval(POP_DUE_SCRIPT, 1, cls.DUE_KEY, now, limit)
+        return [item.decode() for item in items]
+
+    @classmethod
+    def seconds_until_next_due(cls) -> float:
+        head = cls.get_redis_client().zrange(cls.DUE_KEY, 0, 0, withscores=True)
+        if not head:
+            return settings.SCHEDULER_MAX_SLEEP
+        return min(max(head[0][1] - time.time(), 0), settings.SCHEDULER_MAX_SLEEP)
+
+    @classmethod
+    def dispatch_due(cls, now: float = None) -> int:
+        """Hand due items to their kind's task, one call per kind. Returns the number of items."""
+        items = cls.pop_due(now)
+        by_kind = defaultdict(list)
+        for item in items:
+            kind, object_id = item.split(":", 1)
+            by_kind[kind].append(object_id)
+        kinds = cls.get_kinds()
+        for kind, object_ids in by_kind.items():
+            import_string(kinds[kind]["task"]).delay(ids=object_ids)
+        return len(items)
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Re-add every unsent scheduled message (served by the partial index on sent=False)."""
+        redis_client = cls.get_redis_client()
+        count = 0
+        for kind, options in cls.get_kinds().items():
+            model = apps.get_model(options["model"])
+            rows = model.objects.filter(sent=False).values_list("id", "scheduled_time")
+            pipeline = redis_client.pipeline(transaction=False)
+            for object_id, scheduled_time in rows.iterator(chunk_size=settings.SCHEDULER_BATCH_SIZE):
+                pipeline.zadd(cls.DUE_KEY, {f"{kind}:{object_id}": scheduled_time.timestamp()}, nx=True)
+                count += 1
+            pipeline.execute()
+        return count
+
+    @classmethod
+    def run_forever(cls, should_stop=lambda: False) -> None:
+        redis_client = cls.get_redis_client()
+        cls.rebuild()
+        rebuilt_at = time.monotonic()
+        while not should_stop():
+            if cls.dispatch_due() >= settings.SCHEDULER_BATCH_SIZE:
+                continue  # there may be more due items
+            timeout = cls.seconds_until_next_due()
+            if timeout > 0:
+                redis_client.blpop(cls.WAKEUP_KEY, timeout=max(timeout, 0.01))
+            if time.monotonic() - rebuilt_at > settings.SCHEDULER_REBUILD_INTERVAL:
+                cls.rebuild()
+                rebuilt_at = time.monotonic()
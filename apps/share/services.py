@@ -1,45 +1,485 @@
 import datetime
+import time
 import uuid
+from typing import Optional, Union
+
+from django.conf import settings
+from django.utils import timezone
 from redis import Redis
-from .enums import TokenType
+from redis import asyncio as aioredis
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+from .async_redis import get_async_redis_connection
+from .cache import AuthCache
+from .tokens import ISSUED_AT_MS_CLAIM
 from django_redis import get_redis_connection
 
+# Revoked if the jti is on the revocation list or the token was issued
+# before the user's "revoked before" timestamp (logout from all devices), both in milliseconds
+IS_TOKEN_REVOKED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 1
+end
+local revoked_before = redis.call('GET', KEYS[2])
+if revoked_before and tonumber(ARGV[1]) < tonumber(revoked_before) then
+    return 1
+end
+return 0
+"""
+
+# Connections that timed out without a disconnect (crashed worker, lost network):
+# users whose every connection has expired are taken off the expiry index and marked dirty
+EXPIRE_PRESENCE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local offline = {}
+for _, user_id in ipairs(expired) do
+    local key = ARGV[3] .. user_id .. ARGV[4]
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', ARGV[1])
+    redis.call('ZREM', KEYS[1], user_id)
+    if redis.call('ZCARD', key) == 0 then
+        redis.call('SADD', KEYS[2], user_id)
+        table.insert(offline, user_id)
+    end
+end
+return offline
+"""
+
+# A user whose last connection closed cleanly leaves the expiry index
+FORGET_EXPIRY_SCRIPT = """
+if redis.call('ZCOUNT', KEYS[1], ARGV[1], '+inf') == 0 then
+    redis.call('ZREM', KEYS[2], ARGV[2])
+end
+return 0
+"""
+
+# Sockets a user has open in a room. Sockets whose presence connection has expired
+# (crashed worker) are dropped first, the caller's own socket is kept or removed
+# as asked. Returns how many sockets are left
+ROSTER_SOCKETS_SCRIPT = """
+for _, socket in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    local expiry = redis.call('ZSCORE', KEYS[2], socket)
+    if socket ~= ARGV[1] and (not expiry or tonumber(expiry) <= tonumber(ARGV[3])) then
+        redis.call('SREM', KEYS[1], socket)
+    end
+end
+if ARGV[2] == 'join' then
+    redis.call('SADD', KEYS[1], ARGV[1])
+else
+    redis.call('SREM', KEYS[1], ARGV[1])
+end
+local count = redis.call('SCARD', KEYS[1])
+if count > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+end
+return count
+"""
+
 class TokenService:
+    """
+    Revocation list for JWTs.
+    Single tokens are revoked by jti, the entry expires together with the token.
+    Logging out everywhere stores a per-user "revoked before" timestamp (ms) that
+    rejects every token issued before that moment. Both are checked in one
+    round trip, validated tokens are also kept in AuthCache.
+    Methods prefixed with "a" are the async variants for the event loop.
+    """
+    @classmethod
+    def get_redis_client(cls)->Redis:
+        return get_redis_connection("default")
+
+    @classmethod
+    def aget_redis_client(cls)->aioredis.Redis:
+        return get_async_redis_connection("default")
+
+    @classmethod
+    def revoked_token_key(cls,jti:str)->str:
+        return f"revoked:jti:{jti}"
+
+    @classmethod
+    def revoked_before_key(cls,user_id:uuid.UUID)->str:
+        return f"revoked:user:{user_id}:before"
+
+    @classmethod
+    def get_revoke_user_lifetime(cls)->datetime.timedelta:
+        return max(api_settings.ACCESS_TOKEN_LIFETIME,api_settings.REFRESH_TOKEN_LIFETIME)
+
+    @classmethod
+    def now_ms(cls)->int:
+        return int(time.time()*1000)
+
+    @classmethod
+    def issued_at_ms(cls,token:Union[Token,dict])->int:
+        """Tokens issued before the iat_ms claim existed count from the start of their second"""
+        issued_at = token.get(ISSUED_AT_MS_CLAIM)
+        if issued_at is None:
+            issued_at = int(token.get("iat",0))*1000
+        return int(issued_at)
+
+    @classmethod
+    def revoke_token(cls,token:Token)->None:
+        """Revoke one access or refresh token until it expires on its own"""
+        cls.get_redis_client().set(cls.revoked_token_key(token[api_settings.JTI_CLAIM]),1,exat=int(token["exp"]))
+        AuthCache.invalidate_user(token[api_settings.USER_ID_CLAIM])
+
+    @classmethod
+    async def arevoke_token(cls,token:Token)->None:
+        await cls.aget_redis_client().set(cls.revoked_token_key(token[api_settings.JTI_CLAIM]),1,exat=int(token["exp"]))
+        await AuthCache.ainvalidate_user(token[api_settings.USER_ID_CLAIM])
+
+    @classmethod
+    def revoke_user_tokens(cls,user_id:uuid.UUID)->None:
+        """Revoke every token issued to the user so far"""
+        cls.get_redis_client().set(cls.revoked_before_key(user_id),cls.now_ms(),ex=cls.get_revoke_user_lifetime())
+        AuthCache.invalidate_user(user_id)
+
+    @classmethod
+    async def arevoke_user_tokens(cls,user_id:uuid.UUID)->None:
+        await cls.aget_redis_client().set(
+            cls.revoked_before_key(user_id),cls.now_ms(),ex=cls.get_revoke_user_lifetime()
+        )
+        await AuthCache.ainvalidate_user(user_id)
+
+    @classmethod
+    def revocation_check_args(cls,token:Union[Token,dict])->tuple:
+        """Keys and arguments of IS_TOKEN_REVOKED_SCRIPT"""
+        return (
+            cls.revoked_token_key(token.get(api_settings.JTI_CLAIM)),
+            cls.revoked_before_key(token.get(api_settings.USER_ID_CLAIM)),
+            cls.issued_at_ms(token),
+        )
+
+    @classmethod
+    def is_token_revoked(cls,token:Union[Token,dict])->bool:
+        """token - simplejwt token or a decoded payload; a token without iat only passes if never revoked"""
+        return cls.get_redis_client().eval(IS_TOKEN_REVOKED_SCRIPT,2,*cls.revocation_check_args(token)) == 1
+
+    @classmethod
+    async def ais_token_revoked(cls,token:Union[Token,dict])->bool:
+        return await cls.aget_redis_client().eval(IS_TOKEN_REVOKED_SCRIPT,2,*cls.revocation_check_args(token)) == 1
+
+
+class PresenceService:
+    """
+    Online/last seen state kept in Redis instead of the user table.
+    Every open socket (and the HTTP session as a whole) is a member of a per-user
+    sorted set scored by its expiry time, so several tabs or devices are counted
+    separately and a crashed worker's connections simply time out.
+    EXPIRY_KEY indexes users by their latest connection expiry, so expire_presence_task
+    finds the users whose connections timed out without a disconnect.
+    Changes are flushed to the database in batches by flush_presence_task.
+    Sockets use the async variants ("a" prefix), the pipelines are shared.
+    """
+    HTTP_CONNECTION = "http"
+    LAST_SEEN_KEY = "presence:last_seen"
+    DIRTY_KEY = "presence:dirty"
+    EXPIRY_KEY = "presence:expiry"
+    CONNECTIONS_KEY_PREFIX = "presence:"
+    CONNECTIONS_KEY_SUFFIX = ":connections"
+
+    @classmethod
+    def get_redis_client(cls)->Redis:
+        return get_redis_connection("default")
+
+    @classmethod
+    def aget_redis_client(cls)->aioredis.Redis:
+        return get_async_redis_connection("default")
+
+    @classmethod
+    def get_ttl(cls)->int:
+        return getattr(settings,"PRESENCE_TTL",120)
+
+    @classmethod
+    def connections_key(cls,user_id:uuid.UUID)->str:
+        return f"{cls.CONNECTIONS_KEY_PREFIX}{user_id}{cls.CONNECTIONS_KEY_SUFFIX}"
+
+    @classmethod
+    def connect_pipeline(cls,pipeline,user_id:uuid.UUID,connection_id:str):
+        now = time.time()
+        ttl = cls.get_ttl()
+        key = cls.connections_key(user_id)
+        pipeline.zremrangebyscore(key,"-inf",now)
+        pipeline.zcard(key)
+        pipeline.zadd(key,{connection_id:now+ttl})
+        pipeline.expire(key,ttl)
+        pipeline.zadd(cls.EXPIRY_KEY,{str(user_id):now+ttl})
+        pipeline.hset(cls.LAST_SEEN_KEY,str(user_id),now)
+        pipeline.sadd(cls.DIRTY_KEY,str(user_id))
+        return pipeline
+
+    @classmethod
+    def connect(cls,user_id:uuid.UUID,connection_id:str)->bool:
+        """
+        Register a connection or extend its heartbeat.
+        Returns True when the user has just come online.
+        """
+        _,active_connections,*_ = cls.connect_pipeline(cls.get_redis_client().pipeline(),user_id,connection_id).execute()
+        return active_connections == 0
+
+    @classmethod
+    async def aconnect(cls,user_id:uuid.UUID,connection_id:str)->bool:
+        pipeline = cls.connect_pipeline(cls.aget_redis_client().pipeline(),user_id,connection_id)
+        _,active_connections,*_ = await pipeline.execute()
+        return active_connections == 0
+
+    @classmethod
+    def heartbeat(cls,user_id:uuid.UUID,connection_id:str)->bool:
+        return cls.connect(user_id,connection_id)
+
+    @classmethod
+    async def aheartbeat(cls,user_id:uuid.UUID,connection_id:str)->bool:
+        return await cls.aconnect(user_id,connection_id)
+
+    @classmethod
+    def disconnect_pipeline(cls,pipeline,user_id:uuid.UUID,connection_id:str):
+        now = time.time()
+        key = cls.connections_key(user_id)
+        pipeline.zremrangebyscore(key,"-inf",now)
+        pipeline.zrem(key,connection_id)
+        pipeline.zcard(key)
+        pipeline.hset(cls.LAST_SEEN_KEY,str(user_id),now)
+        pipeline.sadd(cls.DIRTY_KEY,str(user_id))
+        pipeline.eval(FORGET_EXPIRY_SCRIPT,2,key,cls.EXPIRY_KEY,now,str(user_id))
+        return pipeline
+
+    @classmethod
+    def disconnect(cls,user_id:uuid.UUID,connection_id:str)->bool:
+        """
+        Drop a connection. Returns True when it was the user's last one.
+        """
+        pipeline = cls.disconnect_pipeline(cls.get_redis_client().pipeline(),user_id,connection_id)
+        _,removed,active_connections,*_ = pipeline.execute()
+        return bool(removed) and active_connections == 0
+
+    @classmethod
+    async def adisconnect(cls,user_id:uuid.UUID,connection_id:str)->bool:
+        pipeline = cls.disconnect_pipeline(cls.aget_redis_client().pipeline(),user_id,connection_id)
+        _,removed,active_connections,*_ = await pipeline.execute()
+        return bool(removed) and active_connections == 0
+
+    @classmethod
+    def touch(cls,user_id:uuid.UUID)->bool:
+        """Mark activity coming from an authenticated HTTP request."""
+        return cls.connect(user_id,cls.HTTP_CONNECTION)
+
+    @classmethod
+    def is_online(cls,user_id:uuid.UUID)->bool:
+        return bool(cls.get_redis_client().zcount(cls.connections_key(user_id),time.time(),"+inf"))
+
+    @classmethod
+    async def ais_online(cls,user_id:uuid.UUID)->bool:
+        return bool(await cls.aget_redis_client().zcount(cls.connections_key(user_id),time.time(),"+inf"))
+
+    @classmethod
+    def presence_pipeline(cls,pipeline,user_id:uuid.UUID):
+        pipeline.zcount(cls.connections_key(user_id),time.time(),"+inf")
+        pipeline.hget(cls.LAST_SEEN_KEY,str(user_id))
+        return pipeline
+
+    @classmethod
+    def get_presence(cls,user_id:uuid.UUID)->Optional[dict]:
+        """
+        Return {"is_online", "last_seen"} from Redis, or None when Redis has
+        never seen this user (the caller should fall back to the database).
+        """
+        pipeline = cls.presence_pipeline(cls.get_redis_client().pipeline(transaction=False),user_id)
+        return cls.to_presence(*pipeline.execute())
+
+    @classmethod
+    async def aget_presence(cls,user_id:uuid.UUID)->Optional[dict]:
+        pipeline = cls.presence_pipeline(cls.aget_redis_client().pipeline(transaction=False),user_id)
+        return cls.to_presence(*await pipeline.execute())
+
+    @classmethod
+    def to_presence(cls,connections,last_seen)->Optional[dict]:
+        if not connections and last_seen is None:
+            return None
+        return {
+            "is_online":bool(connections),
+            "last_seen":cls.to_datetime(last_seen),
+        }
+
+    @classmethod
+    def presence_many_pipeline(cls,pipeline,user_ids:list[str]):
+        now = time.time()
+        for user_id in user_ids:
+            pipeline.zcount(cls.connections_key(user_id),now,"+inf")
+        pipeline.hmget(cls.LAST_SEEN_KEY,user_ids)
+        return pipeline
+
+    @classmethod
+    def get_presence_many(cls,user_ids:list)->dict:
+        """
+        Presence of many users in a single pipeline round trip.
+        Users Redis has never seen are left out of the result.
+        """
+        user_ids = [str(user_id) for user_id in user_ids]
+        if not user_ids:
+            return {}
+        pipeline = cls.presence_many_pipeline(cls.get_redis_client().pipeline(transaction=False),user_ids)
+        return cls.to_presence_many(user_ids,pipeline.execute())
+
+    @classmethod
+    async def aget_presence_many(cls,user_ids:list)->dict:
+        user_ids = [str(user_id) for user_id in user_ids]
+        if not user_ids:
+            return {}
+        pipeline = cls.presence_many_pipeline(cls.aget_redis_client().pipeline(transaction=False),user_ids)
+        return cls.to_presence_many(user_ids,await pipeline.execute())
+
+    @classmethod
+    def to_presence_many(cls,user_ids:list[str],replies:list)->dict:
+        *connections,last_seen = replies
+        result = {}
+        for index,user_id in enumerate(user_ids):
+            if not connections[index] and last_seen[index] is None:
+                continue
+            result[user_id] = {
+                "is_online":bool(connections[index]),
+                "last_seen":cls.to_datetime(last_seen[index]),
+            }
+        return result
+
+    @classmethod
+    def to_datetime(cls,timestamp)->Optional[datetime.datetime]:
+        if timestamp is None:
+            return None
+        return datetime.datetime.fromtimestamp(float(timestamp),tz=datetime.timezone.utc)
+
+    @classmethod
+    def expire(cls,count:int)->list[str]:
+        """
+        Take up to `count` users whose connections all timed out without a disconnect,
+        mark them dirty and return their ids.
+        """
+        offline = cls.get_redis_client().eval(
+            EXPIRE_PRESENCE_SCRIPT,2,cls.EXPIRY_KEY,cls.DIRTY_KEY,
+            time.time(),count,cls.CONNECTIONS_KEY_PREFIX,cls.CONNECTIONS_KEY_SUFFIX,
+        )
+        return [user_id.decode() for user_id in offline]
+
+    @classmethod
+    def mark_dirty(cls,user_ids:list)->None:
+        if user_ids:
+            cls.get_redis_client().sadd(cls.DIRTY_KEY,*[str(user_id) for user_id in user_ids])
+
+    @classmethod
+    def pop_dirty(cls,count:int)->list[dict]:
+        """Take up to `count` changed users and return their current presence."""
+        user_ids = [user_id.decode() for user_id in cls.get_redis_client().spop(cls.DIRTY_KEY,count) or []]
+        presence = cls.get_presence_many(user_ids)
+        return [
+            {
+                "user_id":user_id,
+                "is_online":presence[user_id]["is_online"],
+                "last_seen":presence[user_id]["last_seen"] or timezone.now(),
+            }
+            for user_id in user_ids if user_id in presence
+        ]
+
+
+class RosterService:
+    """
+    Join/leave changes of a room collected in Redis over a short window,
+    so a reconnect storm produces one broadcast per window instead of one per socket.
+    A user with several tabs in a room joins with the first socket and leaves with the last.
+    Consumers use the async variants ("a" prefix).
+    """
+    SOCKETS_TTL = 24*60*60
+
     @classmethod
     def get_redis_client(cls)->Redis:
         return get_redis_connection("default")
 
     @classmethod
-    def get_valid_tokens(cls,user_id:uuid.UUID,token_type:TokenType)->set:
-        redis_client = cls.get_redis_client()
-        token_key = f"user:{user_id}:{token_type}"
-        valid_tokens = redis_client.smembers(token_key)
-        return valid_tokens
+    def aget_redis_client(cls)->aioredis.Redis:
+        return get_async_redis_connection("default")
+
+    @classmethod
+    def get_window(cls)->float:
+        return getattr(settings,"ROSTER_DELTA_WINDOW",0.5)
 
     @classmethod
-    def add_token_to_redis(
-            cls,
-            user_id:uuid.UUID,
-            token:str,
-            token_type:TokenType,
-            expire_time: datetime.timedelta,
-    )->None:
-        redis_client = cls.get_redis_client()
-        token_key = f"user:{user_id}:{token_type}"
+    def changes_key(cls,room:str)->str:
+        return f"roster:{room}:changes"
 
-        redis_client.sadd(token_key,token)
-        redis_client.expire(token_key,expire_time)
+    @classmethod
+    def window_key(cls,room:str)->str:
+        return f"roster:{room}:window"
+
+    @classmethod
+    def sockets_key(cls,room:str,user_id:uuid.UUID)->str:
+        return f"roster:{room}:{user_id}:sockets"
+
+    @classmethod
+    def track_socket_args(cls,room:str,user_id:uuid.UUID,socket:str,change:str)->tuple:
+        """Keys and arguments of ROSTER_SOCKETS_SCRIPT"""
+        return (
+            cls.sockets_key(room,user_id),PresenceService.connections_key(user_id),
+            socket,change,time.time(),cls.SOCKETS_TTL,
+        )
+
+    @classmethod
+    def track_socket(cls,room:str,user_id:uuid.UUID,socket:str,change:str)->bool:
+        """
+        Add ("join") or remove ("leave") one of the user's sockets in the room.
+        Returns True when it was the user's first or last socket, so the change has to be announced.
+        """
+        count = cls.get_redis_client().eval(ROSTER_SOCKETS_SCRIPT,2,*cls.track_socket_args(room,user_id,socket,change))
+        return count == (1 if change == "join" else 0)
+
+    @classmethod
+    async def atrack_socket(cls,room:str,user_id:uuid.UUID,socket:str,change:str)->bool:
+        count = await cls.aget_redis_client().eval(
+            ROSTER_SOCKETS_SCRIPT,2,*cls.track_socket_args(room,user_id,socket,change)
+        )
+        return count == (1 if change == "join" else 0)
+
+    @classmethod
+    def record_pipeline(cls,pipeline,room:str,user_id:uuid.UUID,change:str):
+        window_ms = int(cls.get_window()*1000)
+        pipeline.hset(cls.changes_key(room),str(user_id),change)
+        pipeline.pexpire(cls.changes_key(room),window_ms*10)
+        pipeline.set(cls.window_key(room),1,nx=True,px=window_ms)
+        return pipeline
+
+    @classmethod
+    def record(cls,room:str,user_id:uuid.UUID,change:str)->bool:
+        """
+        Remember that user joined ("join") or left ("leave") the room, the last change wins.
+        Returns True when the caller opened the window and has to flush it.
+        """
+        *_,opened = cls.record_pipeline(cls.get_redis_client().pipeline(),room,user_id,change).execute()
+        return bool(opened)
+
+    @classmethod
+    async def arecord(cls,room:str,user_id:uuid.UUID,change:str)->bool:
+        *_,opened = await cls.record_pipeline(cls.aget_redis_client().pipeline(),room,user_id,change).execute()
+        return bool(opened)
+
+    @classmethod
+    async def aclose_window(cls,room:str)->None:
+        """Close the window early, the next change opens a new one"""
+        await cls.aget_redis_client().delete(cls.window_key(room))
+
+    @classmethod
+    def pop_changes_pipeline(cls,pipeline,room:str):
+        pipeline.hgetall(cls.changes_key(room))
+        pipeline.delete(cls.changes_key(room))
+        return pipeline
+
+    @classmethod
+    def pop_changes(cls,room:str)->dict[str,list[str]]:
+        changes,_ = cls.pop_changes_pipeline(cls.get_redis_client().pipeline(),room).execute()
+        return cls.to_changes(changes)
 
     @classmethod
-    def delete_tokens(cls,user_id:uuid.UUID,token_type:TokenType)->None:
-        redis_client = cls.get_redis_client()
-        token_key = f"user:{user_id}:{token_type}"
-        valid_tokens = redis_client.smembers(token_key)
-        if valid_tokens is not None:
-            redis_client.delete(token_key)
+    async def apop_changes(cls,room:str)->dict[str,list[str]]:
+        changes,_ = await cls.pop_changes_pipeline(cls.aget_redis_client().pipeline(),room).execute()
+        return cls.to_changes(changes)
 
     @classmethod
-    def is_token_valid(cls,user_id:uuid.UUID,token:str,token_type:TokenType):
-        redis_client = cls.get_redis_client()
-        token_key = f"user:{user_id}:{token_type}"
-        return redis_client.sismember(token_key,token)
+    def to_changes(cls,changes:dict)->dict[str,list[str]]:
+        result = {"join":[],"leave":[]}
+        for user_id,change in changes.items():
+            result[change.decode()].append(user_id.decode())
+        return result
@@ -4,9 +4,11 @@ from celery import shared_task
 from celery.utils.log import  get_task_logger
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
+from celery.exceptions import MaxRetriesExceededError
 from firebase_admin import messaging
 
 from core import settings
+from share.push import MAX_MULTICAST_TOKENS, TRANSIENT_ERRORS, UNREGISTERED_ERRORS, get_transport
 from twilio.rest import Client
 
 logger = get_task_logger(__name__)
@@ -53,38 +55,85 @@ def send_email_task(email:str,otp_code:str):
         return 400
 
 
-@shared_task(bind=True)
-def send_push_notification(self, token, title, body):
-    try:
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=title,
-                body=body,
-            ),
-            token=token,
+@shared_task
+def send_push_notification(token, title, body):
+    """Single-token shortcut kept for old callers, delivered through send_push_batch."""
+    send_push_batch.delay(title, body, tokens=[token])
+
+
+@shared_task(bind=True, max_retries=getattr(settings, "PUSH_MAX_RETRIES", 5))
+def send_push_batch(self, title: str, body: str, tokens: list = None, user_ids: list = None, data: dict = None):
+    """
+    Deliver one notification to many devices with FCM multicast calls of up to 500 tokens.
+    Recipients are given as device tokens, user ids (resolved through their enabled
+    NotificationPreference) or both. Tokens FCM reports as unregistered are cleared,
+    transient failures are retried with exponential backoff.
+    """
+    from user.models import NotificationPreference
+
+    tokens = list(tokens or [])
+    if user_ids:
+        tokens += NotificationPreference.objects.filter(
+            user_id__in=user_ids, notifications_enabled=True, device_token__isnull=False
+        ).exclude(device_token="").values_list("device_token", flat=True)
+    tokens = list(dict.fromkeys(token for token in tokens if token))
+
+    transport = get_transport()
+    result = {"success": 0, "failure": 0, "pruned": 0, "retry": 0}
+    unregistered, retry = [], []
+    for start in range(0, len(tokens), MAX_MULTICAST_TOKENS):
+        chunk = tokens[start:start + MAX_MULTICAST_TOKENS]
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(title=title, body=body),
+            data=data,
+            tokens=chunk,
         )
-        response = messaging.send(message)
-        logger.info("Successfully sent message: %s", response)
-    except Exception as e:
-        logger.error("Failed to send push notification: %s", str(e))
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        try:
+            response = transport.send_multicast(message)
+        except TRANSIENT_ERRORS as e:
+            logger.warning("Multicast call failed, will retry %s tokens: %s", len(chunk), str(e))
+            retry += chunk
+            continue
+        for token, send_response in zip(chunk, response.responses):
+            if send_response.success:
+                result["success"] += 1
+            elif isinstance(send_response.exception, UNREGISTERED_ERRORS):
+                unregistered.append(token)
+            elif isinstance(send_response.exception, TRANSIENT_ERRORS):
+                retry.append(token)
+            else:
+                result["failure"] += 1
+                logger.error("Failed to send push notification: %s", str(send_response.exception))
+
+    if unregistered:
+        result["pruned"] = NotificationPreference.objects.filter(
+            device_token__in=unregistered
+        ).update(device_token=None)
+    if retry:
+        result["retry"] = len(retry)
+        backoff = getattr(settings, "PUSH_RETRY_BACKOFF", 2) * 2 ** self.request.retries
+        try:
+            self.retry(kwargs={"title": title, "body": body, "tokens": retry, "data": data}, countdown=backoff)
+        except MaxRetriesExceededError:
+            logger.error("Giving up on %s push tokens after %s retries", len(retry), self.request.retries)
+    logger.info("Push batch finished: %s", result)
+    return result
 
 
+@shared_task
+def flush_search_index_task():
+    """Send the rows queued by FieldAwareSignalProcessor to Elasticsearch in bulk batches."""
+    from share.indexing import SearchIndexService
+
+    batch_size = getattr(settings, "SEARCH_INDEX_BATCH_SIZE", 500)
+    flushed = 0
+    while True:
+        pending = SearchIndexService.pop_pending(batch_size)
+        if not pending:
+            break
+        count = sum(SearchIndexService.index(model, pks) for model, pks in pending.items())
+        flushed += count
+        if count < batch_size:
+            break
+    logger.info("Flushed %s rows to the search index.", flushed)
+    return flushed
@@ -0,0 +1,22 @@
+from rest_framework_simplejwt import tokens
+
+# "iat" is in whole seconds, so it can not tell a token issued just before
+# a logout everywhere from one issued right after it in the same second
+ISSUED_AT_MS_CLAIM = "iat_ms"
+
+
+class IssuedAtMsMixin:
+    def set_iat(self,claim:str="iat",at_time=None)->None:
+        super().set_iat(claim,at_time)
+        if claim == "iat":
+            at_time = at_time or self.current_time
+            self.payload[ISSUED_AT_MS_CLAIM] = int(at_time.timestamp()*1000)
+
+
+class AccessToken(IssuedAtMsMixin,tokens.AccessToken):
+    pass
+
+
+class RefreshToken(IssuedAtMsMixin,tokens.RefreshToken):
+    access_token_class = AccessToken
+    no_copy_claims = (*tokens.RefreshToken.no_copy_claims,ISSUED_AT_MS_CLAIM)
@@ -1,7 +1,8 @@
 from django.urls import path
 
-from share.views import SearchView
+from share.views import ChannelLayerStatsView, SearchView
 
 urlpatterns = [
-    path('search/<str:query>/',SearchView.as_view(),name='search-view')
+    path('search/<str:query>/',SearchView.as_view(),name='search-view'),
+    path('metrics/channel-layer/',ChannelLayerStatsView.as_view(),name='channel-layer-stats'),
 ]
\ No newline at end of file
@@ -1,32 +1,87 @@
+import hashlib
+import hmac
 import random
 import string
 from secrets import token_urlsafe
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
-from django.contrib.auth.hashers import make_password, check_password
 from django_redis import get_redis_connection
 from rest_framework.exceptions import ValidationError
+from share.async_redis import get_async_redis_connection
+
+# OTP kodi va uning maxfiy tokeni bitta atomik skriptda yoziladi (bitta round trip).
+# Yozilsa {1} qaytadi. Amaldagi kod bo'lsa hech narsa yozilmaydi va {0, qolgan vaqt} qaytadi
+# (TTL 0 - bir soniyadan kam qolgan, -1 - muddatsiz kalit ham "amaldagi" hisoblanadi)
+ISSUE_OTP_SCRIPT = """
+if ARGV[4] == '1' then
+    local ttl = redis.call('TTL', KEYS[1])
+    if ttl ~= -2 then
+        return {0, ttl}
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return {1}
+"""
+
+# Kod to'g'ri bo'lsa o'chiriladi (bir martalik), 1 qaytadi
+VERIFY_OTP_SCRIPT = """
+local stored = redis.call('GET', KEYS[1])
+if stored and stored == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
 
 redis_conn = get_redis_connection("default")
-def generate_otp(phone_number:str,expire_in:int=120,check_if_exists:bool=True):
+
+def otp_keys(phone_number:str)->tuple[str,str]:
+    return f"{phone_number}:otp",f"{phone_number}:otp_secret"
+
+def otp_digest(phone_number:str,otp_secret:str,otp_code:str)->str:
+    """Qisqa muddatli kod uchun parol xeshlovchi (PBKDF2) o'rniga kalitli HMAC"""
+    key = getattr(settings,"OTP_HMAC_KEY",None) or settings.SECRET_KEY
+    message = f"{phone_number}:{otp_secret}:{otp_code}"
+    return hmac.new(key.encode(),message.encode(),hashlib.sha256).hexdigest()
+
+def issue_otp_args(phone_number:str,expire_in:int,check_if_exists:bool)->tuple[str,str,list]:
     otp_code = "".join(random.choices(string.digits,k=6))
     secret_token = token_urlsafe()
-    redis_conn.set(f"{phone_number}:otp_secret",secret_token,ex=expire_in)
-    otp_hash = make_password(f"{secret_token}:{otp_code}")
-    key = f"{phone_number}:otp"
-    if check_if_exists:
-        if redis_conn.exists(key):
-            ttl = redis_conn.ttl(key)
-            raise ValidationError(
-                _("You have a valid OTP code. Please try again in {ttl} seconds.").format(ttl=ttl),400
-            )
-    else:
-        redis_conn.delete(key)
-
-    redis_conn.set(key,otp_hash,ex=expire_in)
+    args = [
+        *otp_keys(phone_number),
+        otp_digest(phone_number,secret_token,otp_code),secret_token,expire_in,int(check_if_exists),
+    ]
+    return otp_code,secret_token,args
+
+def raise_if_not_issued(result:list)->None:
+    issued,*ttl = result
+    if not issued:
+        raise ValidationError(
+            _("You have a valid OTP code. Please try again in {ttl} seconds.").format(ttl=max(ttl[0],1)),400
+        )
+
+def generate_otp(phone_number:str,expire_in:int=120,check_if_exists:bool=True):
+    otp_code,secret_token,args = issue_otp_args(phone_number,expire_in,check_if_exists)
+    raise_if_not_issued(redis_conn.eval(ISSUE_OTP_SCRIPT,2,*args))
     return otp_code,secret_token
 
 def check_otp(phone_number:str,otp_code:str,otp_secret:str):
-    stored_hash:bytes = redis_conn.get(f"{phone_number}:otp")
-    if not stored_hash or not check_password(f"{otp_secret}:{otp_code}",stored_hash.decode()):
+    result = redis_conn.eval(
+        VERIFY_OTP_SCRIPT,2,*otp_keys(phone_number),otp_digest(phone_number,otp_secret,otp_code)
+    )
+    if result != 1:
         raise ValidationError(_("Invalid OTP code."),400)
 
+# Event loop (consumerlar) uchun async variantlar: Redis'ga thread pool orqali emas, async client bilan murojaat qilinadi
+async def agenerate_otp(phone_number:str,expire_in:int=120,check_if_exists:bool=True):
+    otp_code,secret_token,args = issue_otp_args(phone_number,expire_in,check_if_exists)
+    raise_if_not_issued(await get_async_redis_connection("default").eval(ISSUE_OTP_SCRIPT,2,*args))
+    return otp_code,secret_token
+
+async def acheck_otp(phone_number:str,otp_code:str,otp_secret:str):
+    result = await get_async_redis_connection("default").eval(
+        VERIFY_OTP_SCRIPT,2,*otp_keys(phone_number),otp_digest(phone_number,otp_secret,otp_code)
+    )
+    if result != 1:
+        raise ValidationError(_("Invalid OTP code."),400)
@@ -1,6 +1,9 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 from rest_framework import generics,status,permissions
 from rest_framework.response import Response
 from .documents import UserIndex,GroupIndex,ChannelIndex
+from .layers import NodeFanoutChannelLayer
 
 class SearchView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -34,4 +37,15 @@ class SearchView(generics.GenericAPIView):
             'channels':[hit.to_dict() for hit in channel_results]
         }
 
-        return Response(results,status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(results,status=status.HTTP_200_OK)
+
+
+class ChannelLayerStatsView(generics.GenericAPIView):
+    """Channel layer shardlari bo'yicha navbat chuqurligi va xonalar soni (faqat adminlar uchun)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self,request,*args,**kwargs):
+        channel_layer = get_channel_layer()
+        if not isinstance(channel_layer,NodeFanoutChannelLayer):
+            return Response({"detail":"Channel layer does not report shard metrics."},status=status.HTTP_404_NOT_FOUND)
+        return Response(async_to_sync(channel_layer.shard_stats)(),status=status.HTTP_200_OK)
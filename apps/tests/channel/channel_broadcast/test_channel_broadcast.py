@@ -0,0 +1,88 @@
+import pytest
+from datetime import timedelta
+from unittest.mock import patch
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from channel.models import Channel, ChannelBroadcast, ChannelMembership, ChannelMessage
+from channel.tasks import run_channel_broadcast, resume_channel_broadcasts
+
+
+@pytest.mark.django_db
+class TestChannelBroadcast:
+    @pytest.fixture
+    def broadcast(self, user_factory, settings):
+        settings.PUSH_MULTICAST_BATCH_SIZE = 2
+        settings.CHANNEL_BROADCAST_CHUNKS_PER_RUN = 1
+        owner = user_factory.create()
+        channel = Channel.objects.create(name="News", owner=owner)
+        for member in user_factory.create_batch(5):
+            ChannelMembership.objects.create(channel=channel, user=member)
+        message = ChannelMessage.objects.create(channel=channel, sender=owner, text="Breaking")
+        return ChannelBroadcast.objects.create(message=message)
+
+    def member_ids(self, broadcast):
+        return [
+            str(user_id) for user_id in ChannelMembership.objects.filter(
+                channel=broadcast.message.channel
+            ).order_by("id").values_list("user_id", flat=True)
+        ]
+
+    @patch("channel.tasks.send_push_batch.delay")
+    def test_members_are_walked_in_keyset_chunks(self, mock_push, broadcast, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            run_channel_broadcast(str(broadcast.id))
+
+        broadcast.refresh_from_db()
+        assert broadcast.status == "done"
+        assert broadcast.processed_count == 5
+        assert broadcast.batches_sent == 3
+        sent = [user_id for call in mock_push.call_args_list for user_id in call.kwargs["user_ids"]]
+        assert sent == self.member_ids(broadcast)
+        assert mock_push.call_args.args == ("New Message in News", "Breaking")
+
+    @patch("channel.tasks.send_push_batch.delay")
+    def test_crashed_broadcast_resumes_from_cursor(self, mock_push, broadcast, django_capture_on_commit_callbacks):
+        memberships = list(
+            ChannelMembership.objects.filter(channel=broadcast.message.channel).order_by("id")
+        )
+        ChannelBroadcast.objects.filter(id=broadcast.id).update(
+            status="running",
+            cursor=memberships[1].id,
+            processed_count=2,
+            updated_at=timezone.now() - timedelta(hours=1),
+        )
+
+        with django_capture_on_commit_callbacks(execute=True):
+            resume_channel_broadcasts()
+
+        sent = [user_id for call in mock_push.call_args_list for user_id in call.kwargs["user_ids"]]
+        assert sent == self.member_ids(broadcast)[2:]
+        broadcast.refresh_from_db()
+        assert broadcast.status == "done"
+        assert broadcast.processed_count == 5
+
+    @patch("channel.tasks.send_push_batch.delay")
+    def test_finished_broadcast_is_not_resent(self, mock_push, broadcast, django_capture_on_commit_callbacks):
+        ChannelBroadcast.objects.filter(id=broadcast.id).update(status="done")
+        with django_capture_on_commit_callbacks(execute=True):
+            run_channel_broadcast(str(broadcast.id))
+        mock_push.assert_not_called()
+
+    @patch("channel.tasks.send_push_batch.delay")
+    def test_push_is_not_sent_when_cursor_update_fails(self, mock_push, broadcast, django_capture_on_commit_callbacks):
+        update = QuerySet.update
+
+        def failing_update(queryset, **kwargs):
+            if "cursor" in kwargs:
+                raise DatabaseError("commit failed")
+            return update(queryset, **kwargs)
+
+        with patch.object(QuerySet, "update", failing_update), django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(DatabaseError):
+                run_channel_broadcast(str(broadcast.id))
+
+        mock_push.assert_not_called()
+        broadcast.refresh_from_db()
+        assert broadcast.cursor is None
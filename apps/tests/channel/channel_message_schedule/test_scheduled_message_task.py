@@ -41,9 +41,12 @@ class TestSendChannelScheduledMessageTask:
             "member_without_notifications": member_without_notifications,
         }
 
-    @patch("channel.tasks.send_push_notification.delay")
-    def test_send_scheduled_messages(self, mock_send_push_notification, setup_data):
-        send_channel_scheduled_message()
+    @patch("channel.tasks.send_push_batch.delay")
+    def test_send_scheduled_messages(
+        self, mock_send_push_notification, setup_data, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            send_channel_scheduled_message()
 
         scheduled_message = ChannelScheduledMessage.objects.get(
             id=setup_data["scheduled_message"].id
@@ -52,10 +55,14 @@ class TestSendChannelScheduledMessageTask:
 
         assert ChannelMessage.objects.filter(channel=setup_data["channel"]).count() == 1
 
-        mock_send_push_notification.assert_called_once_with(
-            setup_data[
-                "member_with_notifications"
-            ].notification_preference.device_token,
+        mock_send_push_notification.assert_called_once()
+        args, kwargs = mock_send_push_notification.call_args
+        assert args == (
             f"New Message in {setup_data['channel'].name}",
             setup_data["scheduled_message"].text,
         )
+        # Tokenlarni send_push_batch o'zi bildirishnoma sozlamalaridan topadi
+        assert set(kwargs["user_ids"]) == {
+            str(setup_data["member_with_notifications"].id),
+            str(setup_data["member_without_notifications"].id),
+        }
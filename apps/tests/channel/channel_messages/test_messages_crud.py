@@ -39,7 +39,7 @@ class TestChannelMessageListCreateView:
             len(response.data["results"]) == 2
         ), "Expected two messages in the response"
 
-    @patch("share.tasks.send_push_notification.delay")
+    @patch("share.tasks.send_push_batch.delay")
     def test_create_message_as_owner(
         self,
         mock_send_push_notification,
@@ -48,6 +48,7 @@ class TestChannelMessageListCreateView:
         api_client,
         channel,
         user_factory,
+        django_capture_on_commit_callbacks,
     ):
         member = user_factory.create()
         ChannelMembership.objects.create(channel=channel, user=member)
@@ -62,17 +63,21 @@ class TestChannelMessageListCreateView:
         mock_redis_client.smembers.return_value = {access.encode()}
 
         data = {"text": "Hello, this is a new message"}
-        response = client.post(f"/api/channels/{channel.id}/messages/", data=data)
+        # Tarqatish ishi tranzaksiya commit bo'lgach navbatga qo'yiladi
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(f"/api/channels/{channel.id}/messages/", data=data)
         assert response.status_code == status.HTTP_201_CREATED
         assert (
             response.data["text"] == "Hello, this is a new message"
         ), "Text content mismatch"
 
         if not mock_send_push_notification.called:
-            print("send_push_notification.delay was not called.")
+            print("send_push_batch.delay was not called.")
 
         mock_send_push_notification.assert_called_once_with(
-            member.id, f"New Message in {channel.name}", "Hello, this is a new message"
+            f"New Message in {channel.name}",
+            "Hello, this is a new message",
+            user_ids=[str(member.id)],
         )
 
     def test_create_message_as_non_owner(
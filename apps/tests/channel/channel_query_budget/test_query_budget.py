@@ -0,0 +1,43 @@
+import pytest
+from unittest.mock import MagicMock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from channel.models import Channel, ChannelMembership, ChannelMessage
+from share.services import IS_TOKEN_REVOKED_SCRIPT, TokenService
+
+# Kanal habarlari tarixi uchun ruxsat etilgan maksimal so'rovlar soni
+REST_HISTORY_QUERY_BUDGET = 8
+
+
+@pytest.mark.django_db
+class TestChannelHistoryQueryBudget:
+    @pytest.mark.parametrize("message_count", [2, 10])
+    def test_rest_history_within_budget(
+        self, message_count, mocker, tokens, api_client, user_factory
+    ):
+        owner = user_factory.create()
+        member = user_factory.create()
+        channel = Channel.objects.create(name="Test Channel", owner=owner)
+        ChannelMembership.objects.create(channel=channel, user=member)
+        for index in range(message_count):
+            message = ChannelMessage.objects.create(channel=channel, sender=owner, text=f"message {index}")
+            message.likes.add(member)
+
+        mock_redis_client = MagicMock()
+        mocker.patch.object(TokenService, "get_redis_client", return_value=mock_redis_client)
+        access, _ = tokens(member)
+        mock_redis_client.eval.return_value = 0  # token bekor qilinmagan
+        client = api_client(access)
+
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(f"/api/channels/{channel.id}/messages/")
+
+        assert response.status_code == status.HTTP_200_OK
+        # Autentifikatsiya Redis'ga bitta skript bilan murojaat qiladi (token ro'yhati o'qilmaydi)
+        mock_redis_client.eval.assert_called_once()
+        assert mock_redis_client.eval.call_args.args[0] == IS_TOKEN_REVOKED_SCRIPT
+        mock_redis_client.smembers.assert_not_called()
+        assert len(response.data["results"]) == message_count
+        assert len(context.captured_queries) <= REST_HISTORY_QUERY_BUDGET
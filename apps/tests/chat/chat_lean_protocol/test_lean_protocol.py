@@ -0,0 +1,121 @@
+import pytest
+import jwt
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from channels.layers import get_channel_layer
+from core import settings
+from core.asgi import application
+
+
+@pytest.fixture
+def channel_layer(settings):
+    """Override the channel layer to use an in-memory channel layer for testing."""
+    settings.CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+    return get_channel_layer()
+
+
+async def receive_action(communicator, action):
+    """Skip roster updates until the expected action arrives."""
+    while True:
+        data = await communicator.receive_json_from()
+        if data.get("action") == action:
+            return data
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestChatLeanProtocol:
+    @database_sync_to_async
+    def create_chat(self, user_factory, chat_factory):
+        owner = user_factory.create()
+        participant = user_factory.create()
+        return chat_factory.create(owner=owner, user=participant), owner, participant
+
+    def token_payload(self, user_id):
+        return {
+            "user_id": str(user_id),
+            "exp": datetime.utcnow() + timedelta(minutes=10),
+        }
+
+    @patch("share.middleware.jwt.decode")
+    async def test_lean_and_legacy_clients_receive_their_format(
+        self, mock_jwt_decode, user_factory, chat_factory, channel_layer
+    ):
+        chat, owner, participant = await self.create_chat(user_factory, chat_factory)
+        owner_payload = self.token_payload(owner.id)
+        participant_payload = self.token_payload(participant.id)
+        mock_jwt_decode.side_effect = [owner_payload, participant_payload]
+
+        lean = WebsocketCommunicator(
+            application, f"/ws/chats/{chat.pk}/?token=owner&v=2"
+        )
+        connected, _ = await lean.connect()
+        assert connected
+        await receive_action(lean, "get_messages")
+
+        legacy = WebsocketCommunicator(
+            application, f"/ws/chats/{chat.pk}/?token=participant"
+        )
+        connected, _ = await legacy.connect()
+        assert connected
+        await receive_action(legacy, "get_messages")
+
+        await lean.send_json_to(
+            {
+                "action": "create_message",
+                "request_id": "1",
+                "pk": str(chat.pk),
+                "data": {"text": "Hello!"},
+            }
+        )
+
+        lean_message = (await receive_action(lean, "new_message"))["data"]
+        assert "chat" not in lean_message
+        assert "liked_by" not in lean_message
+        assert lean_message["chat_id"] == str(chat.pk)
+        assert lean_message["sender_id"] == str(owner.id)
+        assert lean_message["text"] == "Hello!"
+        assert lean_message["likes_count"] == 0
+
+        legacy_message = (await receive_action(legacy, "new_message"))["data"]
+        assert legacy_message["chat"]["id"] == str(chat.pk)
+        assert legacy_message["id"] == lean_message["id"]
+
+        await lean.disconnect()
+        await legacy.disconnect()
+
+    async def test_lean_client_receives_media_posted_over_rest(
+        self, user_factory, chat_factory, channel_layer, api_client, tokens, generate_test_image
+    ):
+        chat, owner, participant = await self.create_chat(user_factory, chat_factory)
+        participant_access, _ = tokens(participant)
+
+        lean = WebsocketCommunicator(
+            application, f"/ws/chats/{chat.pk}/?token={participant_access}&v=2"
+        )
+        connected, _ = await lean.connect()
+        assert connected
+        await receive_action(lean, "get_messages")
+
+        access, _ = tokens(owner)
+        response = await database_sync_to_async(api_client(access).post)(
+            f"/api/chats/{chat.pk}/messages/",
+            {"text": "Photo", "image": generate_test_image},
+            format="multipart",
+        )
+        assert response.status_code == 201
+
+        lean_message = (await receive_action(lean, "new_message"))["data"]
+        assert lean_message["id"] == str(response.data["id"])
+        assert lean_message["chat_id"] == str(chat.pk)
+        assert lean_message["text"] == "Photo"
+        assert lean_message["image"]
+        assert "chat" not in lean_message
+
+        await lean.disconnect()
@@ -47,6 +47,38 @@ class TestMessageListCreateView:
         assert len(response.data["results"]) == 1
         assert response.data["results"][0]["text"] == "Hello!"
 
+    def test_list_messages_of_requested_chat_only(
+        self, mocker, tokens, api_client, user_factory, chat_factory
+    ):
+        """Listing returns the messages of the chat in the URL, not of every chat."""
+        mocker.patch.object(TokenService, "get_redis_client", return_value=MagicMock())
+        user = user_factory.create()
+        chat = chat_factory.create(owner=user_factory.create(), user=user)
+        other_chat = chat_factory.create(owner=user, user=user_factory.create())
+        Message.objects.create(chat=chat, sender=user, text="Shu chat")
+        Message.objects.create(chat=other_chat, sender=user, text="Boshqa chat")
+        access, _ = tokens(user)
+
+        response = api_client(access).get(f"/api/chats/{chat.id}/messages/")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [message["text"] for message in response.data["results"]] == ["Shu chat"]
+
+    def test_list_messages_of_foreign_chat_is_empty(
+        self, mocker, tokens, api_client, user_factory, chat_factory
+    ):
+        """A user who is not a participant of the chat does not see its messages."""
+        mocker.patch.object(TokenService, "get_redis_client", return_value=MagicMock())
+        owner, user, stranger = user_factory.create_batch(3)
+        chat = chat_factory.create(owner=owner, user=user)
+        Message.objects.create(chat=chat, sender=owner, text="Maxfiy")
+        access, _ = tokens(stranger)
+
+        response = api_client(access).get(f"/api/chats/{chat.id}/messages/")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["results"] == []
+
     def test_create_message(
         self,
         mocker,
@@ -81,9 +113,7 @@ class TestMessageListCreateView:
             "image": test_image,
         }
 
-        with patch.object(
-            channel_layer, "group_send", new_callable=AsyncMock
-        ) as mock_group_send:
+        with patch("chat.views.group_send_many", new_callable=AsyncMock) as mock_group_send_many:
             response = client.post(
                 f"/api/chats/{chat.id}/messages/", payload, format="multipart"
             )
@@ -96,10 +126,13 @@ class TestMessageListCreateView:
             assert message.file is not None
             assert message.image is not None
 
-            mock_group_send.assert_called_once()
+            mock_group_send_many.assert_called_once()
 
-            called_args = mock_group_send.call_args[0][1]
-            assert str(called_args["message_id"]) == str(message.id)
+            (legacy_group, legacy_event), (lean_group, lean_event) = mock_group_send_many.call_args[0][1]
+            assert legacy_group == f"chat__{chat.id}"
+            assert lean_group == f"chat__{chat.id}__lean"
+            assert str(legacy_event["text"]["id"]) == str(message.id)
+            assert str(lean_event["text"]["id"]) == str(message.id)
 
     def test_create_message_without_auth(self, api_client, user_factory, chat_factory):
         """Test that a message cannot be created without authentication."""
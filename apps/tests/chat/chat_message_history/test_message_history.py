@@ -0,0 +1,126 @@
+import base64
+import json
+
+import pytest
+import jwt
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from channels.layers import get_channel_layer
+from core import settings
+from core.asgi import application
+from chat.models import Message
+from rest_framework.exceptions import ValidationError
+from share.paginations import MessageCursorPaginator
+
+
+@pytest.fixture
+def channel_layer(settings):
+    """Override the channel layer to use an in-memory channel layer for testing."""
+    settings.CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+    return get_channel_layer()
+
+
+def forged_cursor(message_id):
+    payload = json.dumps({"sent_at": "2024-01-01T00:00:00+00:00", "id": message_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("message_id", ["not-an-id", "1 OR 1=1", None, [1], {"id": 1}])
+@pytest.mark.parametrize("direction", ["before", "after"])
+def test_forged_cursor_id_is_a_validation_error(message_id, direction):
+    with pytest.raises(ValidationError):
+        MessageCursorPaginator.paginate(Message.objects.all(), **{direction: forged_cursor(message_id)})
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestChatMessageHistory:
+    @database_sync_to_async
+    def create_chat_with_messages(self, user_factory, chat_factory, count):
+        owner = user_factory.create()
+        participant = user_factory.create()
+        chat = chat_factory.create(owner=owner, user=participant)
+        for index in range(count):
+            Message.objects.create(chat=chat, sender=owner, text=f"message {index}")
+        return chat, owner
+
+    def generate_jwt_token(self, user_id):
+        payload = {
+            "user_id": str(user_id),
+            "exp": datetime.utcnow() + timedelta(minutes=10),
+        }
+        return payload, jwt.encode(payload, settings.SECRET_KEY, algorithm="HS256")
+
+    @patch("share.middleware.jwt.decode")
+    async def test_history_is_paginated_by_cursor(
+        self, mock_jwt_decode, user_factory, chat_factory, channel_layer
+    ):
+        chat, owner = await self.create_chat_with_messages(user_factory, chat_factory, 7)
+        payload, token = self.generate_jwt_token(owner.id)
+        mock_jwt_decode.return_value = payload
+
+        with patch.object(MessageCursorPaginator, "page_size", 3):
+            communicator = WebsocketCommunicator(
+                application, f"/ws/chats/{chat.pk}/?token={token}"
+            )
+            connected, _ = await communicator.connect()
+            assert connected
+
+            newest = await communicator.receive_json_from()
+            assert newest["action"] == "get_messages"
+            assert [m["text"] for m in newest["messages"]] == [
+                "message 4",
+                "message 5",
+                "message 6",
+            ]
+            assert newest["has_more"] is True
+            await communicator.receive_json_from()
+
+            await communicator.send_json_to(
+                {
+                    "action": "get_messages",
+                    "request_id": "1",
+                    "pk": str(chat.pk),
+                    "before": newest["cursors"]["before"],
+                }
+            )
+            older = await communicator.receive_json_from()
+            assert [m["text"] for m in older["messages"]] == [
+                "message 1",
+                "message 2",
+                "message 3",
+            ]
+            assert older["has_more"] is True
+
+            await communicator.send_json_to(
+                {
+                    "action": "get_messages",
+                    "request_id": "2",
+                    "pk": str(chat.pk),
+                    "after": older["cursors"]["after"],
+                    "limit": 2,
+                }
+            )
+            newer = await communicator.receive_json_from()
+            assert [m["text"] for m in newer["messages"]] == ["message 4", "message 5"]
+            assert newer["has_more"] is True
+
+            await communicator.send_json_to(
+                {
+                    "action": "get_messages",
+                    "request_id": "3",
+                    "pk": str(chat.pk),
+                    "before": "not-a-cursor",
+                }
+            )
+            invalid = await communicator.receive_json_from()
+            assert "errors" in invalid
+
+            await communicator.disconnect()
@@ -0,0 +1,98 @@
+import pytest
+from asgiref.sync import sync_to_async
+from unittest.mock import patch
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from share import middleware
+from share.cache import AuthCache
+from share.middleware import TokenAuthMiddleware, get_token
+from share.services import TokenService
+
+
+def test_get_token_tolerates_values_with_equal_signs():
+    scope = {"query_string": b"next=/chat?a=b&token=abc.def%3D&v=2&flag"}
+    assert get_token(scope) == "abc.def="
+    assert get_token({"query_string": b""}) is None
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestCachedTokenAuthMiddleware:
+    @pytest.fixture(autouse=True)
+    def listening(self):
+        AuthCache.start_listener()
+        assert AuthCache.listening.wait(2)
+
+    @pytest.fixture
+    def user(self, user_factory):
+        return user_factory.create()
+
+    def websocket_scope(self, token):
+        return {"type": "websocket", "query_string": f"token={token}".encode()}
+
+    async def run(self, scope):
+        inner_called = []
+        sent = []
+
+        async def inner(scope, receive, send):
+            inner_called.append(scope)
+
+        async def receive():
+            return {"type": "websocket.connect"}
+
+        async def send(message):
+            sent.append(message)
+
+        await TokenAuthMiddleware(inner)(scope, receive, send)
+        return inner_called, sent
+
+    async def test_warm_cache_skips_database(self, user):
+        token = str((await sync_to_async(RefreshToken.for_user)(user)).access_token)
+
+        with patch.object(middleware, "load_user", wraps=middleware.load_user) as cold_path, patch.object(
+            TokenService, "ais_token_revoked", wraps=TokenService.ais_token_revoked
+        ) as revocation_check:
+            for _ in range(3):
+                scope = self.websocket_scope(token)
+                inner_called, _ = await self.run(scope)
+                assert inner_called
+                assert str(scope["user"].id) == str(user.id)
+
+        assert cold_path.call_count == 1
+        assert revocation_check.call_count == 1
+
+    async def test_new_token_of_cached_user_is_checked_without_thread_hop(self, user):
+        first = str((await sync_to_async(RefreshToken.for_user)(user)).access_token)
+        second = str((await sync_to_async(RefreshToken.for_user)(user)).access_token)
+        await self.run(self.websocket_scope(first))
+
+        with patch.object(middleware, "database_sync_to_async") as thread_hop:
+            scope = self.websocket_scope(second)
+            inner_called, _ = await self.run(scope)
+
+        assert inner_called
+        assert str(scope["user"].id) == str(user.id)
+        thread_hop.assert_not_called()
+
+    async def test_revoked_token_is_rejected_before_routing(self, user):
+        access = (await sync_to_async(RefreshToken.for_user)(user)).access_token
+        await sync_to_async(TokenService.revoke_token)(access)
+
+        inner_called, sent = await self.run(self.websocket_scope(str(access)))
+
+        assert inner_called == []
+        assert sent == [{"type": "websocket.close", "code": 4401}]
+
+    async def test_invalid_token_is_rejected_before_routing(self):
+        inner_called, sent = await self.run(self.websocket_scope("not-a-jwt"))
+
+        assert inner_called == []
+        assert sent == [{"type": "websocket.close", "code": 4401}]
+
+    async def test_refresh_token_cannot_open_socket(self, user):
+        refresh = await sync_to_async(RefreshToken.for_user)(user)
+
+        inner_called, sent = await self.run(self.websocket_scope(str(refresh)))
+
+        assert inner_called == []
+        assert sent[0]["type"] == "websocket.close"
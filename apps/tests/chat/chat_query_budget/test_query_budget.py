@@ -0,0 +1,66 @@
+import pytest
+from unittest.mock import MagicMock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from chat.models import Message
+from chat.serializers import MessageSerializer
+from share.paginations import MessageCursorPaginator
+from share.services import IS_TOKEN_REVOKED_SCRIPT, TokenService
+
+# Tarix endpointlari uchun ruxsat etilgan maksimal so'rovlar soni
+REST_HISTORY_QUERY_BUDGET = 8
+WS_HISTORY_QUERY_BUDGET = 2
+
+
+@pytest.mark.django_db
+class TestChatHistoryQueryBudget:
+    @pytest.fixture
+    def chat_with_messages(self, user_factory, chat_factory):
+        def _chat_with_messages(count):
+            owner = user_factory.create()
+            user = user_factory.create()
+            chat = chat_factory.create(owner=owner, user=user)
+            for index in range(count):
+                message = Message.objects.create(chat=chat, sender=owner, text=f"message {index}")
+                message.liked_by.add(owner, user)
+            return chat, owner
+
+        return _chat_with_messages
+
+    def rest_history_queries(self, mocker, tokens, api_client, chat, user):
+        mock_redis_client = MagicMock()
+        mocker.patch.object(TokenService, "get_redis_client", return_value=mock_redis_client)
+        access, _ = tokens(user)
+        mock_redis_client.eval.return_value = 0  # token bekor qilinmagan
+        client = api_client(access)
+
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(f"/api/chats/{chat.id}/messages/")
+        assert response.status_code == status.HTTP_200_OK
+        # Autentifikatsiya Redis'ga bitta skript bilan murojaat qiladi (token ro'yhati o'qilmaydi)
+        mock_redis_client.eval.assert_called_once()
+        assert mock_redis_client.eval.call_args.args[0] == IS_TOKEN_REVOKED_SCRIPT
+        mock_redis_client.smembers.assert_not_called()
+        return len(context.captured_queries)
+
+    @pytest.mark.parametrize("message_count", [2, 10])
+    def test_rest_history_within_budget(
+        self, message_count, mocker, tokens, api_client, chat_with_messages
+    ):
+        chat, owner = chat_with_messages(message_count)
+        queries = self.rest_history_queries(mocker, tokens, api_client, chat, owner)
+        assert queries <= REST_HISTORY_QUERY_BUDGET, f"{queries} queries for {message_count} messages"
+
+    def test_ws_history_page_within_budget(self, chat_with_messages):
+        chat, _ = chat_with_messages(20)
+        queryset = Message.objects.for_serialization().filter(chat_id=chat.id)
+
+        with CaptureQueriesContext(connection) as context:
+            page = MessageCursorPaginator.paginate(queryset, limit=20)
+            data = MessageSerializer(page["messages"], many=True).data
+
+        assert len(data) == 20
+        assert all(message["likes_count"] == 2 for message in data)
+        assert len(context.captured_queries) <= WS_HISTORY_QUERY_BUDGET
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from unittest.mock import patch
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+
+from chat.consumers import ChatConsumer
+from chat.models import Chat, ChatParticipant
+from core.asgi import application
+from user.models import User
+
+
+@database_sync_to_async
+def create_user(phone_number):
+    return User.objects.create(phone_number=phone_number, is_verified=True, is_active=True)
+
+
+@database_sync_to_async
+def create_chat(owner, user):
+    return Chat.objects.create(owner=owner, user=user)
+
+
+@pytest.fixture
+def channel_layer(settings):
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    return get_channel_layer()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestChatConnectPipeline:
+    async def test_unauthenticated_connect_does_not_touch_database(self, channel_layer):
+        owner = await create_user("+998900000001")
+        peer = await create_user("+998900000002")
+        chat = await create_chat(owner, peer)
+
+        with patch.object(ChatConsumer, "open_chat") as open_chat:
+            communicator = WebsocketCommunicator(application, f"/ws/chats/{chat.id}/")
+            connected, _ = await communicator.connect()
+
+        assert not connected
+        open_chat.assert_not_called()
+
+    async def test_non_participant_is_rejected(self, channel_layer, tokens):
+        owner = await create_user("+998900000003")
+        peer = await create_user("+998900000004")
+        stranger = await create_user("+998900000005")
+        chat = await create_chat(owner, peer)
+        access, _ = tokens(stranger)
+
+        communicator = WebsocketCommunicator(application, f"/ws/chats/{chat.id}/?token={access}")
+        connected, _ = await communicator.connect()
+
+        assert not connected
+        assert not await database_sync_to_async(ChatParticipant.objects.filter(user=stranger).exists)()
+
+    async def test_connect_sends_history_and_participants(self, channel_layer, tokens, settings):
+        settings.ROSTER_DELTA_WINDOW = 0.01
+        owner = await create_user("+998900000006")
+        peer = await create_user("+998900000007")
+        chat = await create_chat(owner, peer)
+        access, _ = tokens(owner)
+
+        communicator = WebsocketCommunicator(application, f"/ws/chats/{chat.id}/?token={access}")
+        connected, _ = await communicator.connect()
+        assert connected
+
+        history = await communicator.receive_json_from()
+        participants = await communicator.receive_json_from()
+        await communicator.disconnect()
+        await asyncio.sleep(0.05)  # roster oynasi yopilishini kutamiz
+
+        assert history["action"] == "get_messages"
+        assert history["messages"] == []
+        assert participants["action"] == "get_participants"
+        assert [user["id"] for user in participants["users"]] == [str(owner.id)]
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+from unittest.mock import patch
+from django.utils import timezone
+
+from channel.models import Channel, ChannelScheduledMessage
+from chat.models import ScheduledMessage
+from share.scheduler import MessageScheduler
+
+
+@pytest.fixture
+def scheduler():
+    redis_client = MessageScheduler.get_redis_client()
+    redis_client.delete(MessageScheduler.DUE_KEY, MessageScheduler.WAKEUP_KEY)
+    yield MessageScheduler
+    redis_client.delete(MessageScheduler.DUE_KEY, MessageScheduler.WAKEUP_KEY)
+
+
+@pytest.mark.django_db
+class TestMessageScheduler:
+    def test_only_due_items_are_popped_once(self, scheduler, settings):
+        settings.SCHEDULER_MAX_SLEEP = 600
+        now = timezone.now()
+        scheduler.schedule("chat", 1, now - timezone.timedelta(seconds=5))
+        scheduler.schedule("group", "a", now - timezone.timedelta(seconds=1))
+        scheduler.schedule("chat", 2, now + timezone.timedelta(minutes=5))
+
+        assert scheduler.pop_due(now.timestamp()) == ["chat:1", "group:a"]
+        assert scheduler.pop_due(now.timestamp()) == []
+        assert 290 < scheduler.seconds_until_next_due() <= 300
+
+    def test_earlier_item_wakes_the_loop(self, scheduler):
+        redis_client = scheduler.get_redis_client()
+        scheduler.schedule("chat", 1, timezone.now() + timezone.timedelta(minutes=5))
+        redis_client.delete(scheduler.WAKEUP_KEY)
+
+        scheduler.schedule("chat", 2, timezone.now() + timezone.timedelta(minutes=10))
+        assert redis_client.llen(scheduler.WAKEUP_KEY) == 0
+
+        scheduler.schedule("chat", 3, (timezone.now() + timezone.timedelta(seconds=1)).isoformat())
+        assert redis_client.llen(scheduler.WAKEUP_KEY) == 1
+
+    @patch("channel.tasks.send_channel_scheduled_message.delay")
+    @patch("chat.tasks.send_scheduled_message.delay")
+    def test_rebuild_and_dispatch_by_kind(
+        self, mock_chat_task, mock_channel_task, scheduler, user_factory, chat_factory
+    ):
+        owner = user_factory.create()
+        chat = chat_factory.create(owner=owner, user=user_factory.create())
+        channel = Channel.objects.create(name="News", owner=owner)
+        past = timezone.now() - timezone.timedelta(minutes=1)
+        due = [
+            ScheduledMessage.objects.create(chat=chat, sender=owner, text=f"{i}", scheduled_time=past)
+            for i in range(2)
+        ]
+        ScheduledMessage.objects.create(chat=chat, sender=owner, text="sent", scheduled_time=past, sent=True)
+        channel_due = ChannelScheduledMessage.objects.create(
+            channel=channel, sender=owner, text="channel", scheduled_time=past
+        )
+        ChannelScheduledMessage.objects.create(
+            channel=channel, sender=owner, text="later", scheduled_time=timezone.now() + timezone.timedelta(hours=1)
+        )
+
+        assert scheduler.rebuild() == 4
+        assert scheduler.dispatch_due(time.time()) == 3
+
+        assert sorted(mock_chat_task.call_args.kwargs["ids"]) == sorted(str(message.id) for message in due)
+        mock_channel_task.assert_called_once_with(ids=[str(channel_due.id)])
+
+    @patch("chat.tasks.send_scheduled_message.delay")
+    def test_loop_dispatches_when_item_becomes_due(self, mock_chat_task, scheduler, settings):
+        settings.SCHEDULER_MAX_SLEEP = 0.05
+        scheduler.schedule("chat", 7, timezone.now() + timezone.timedelta(seconds=0.2))
+        started = time.monotonic()
+
+        scheduler.run_forever(should_stop=lambda: mock_chat_task.called or time.monotonic() - started > 2)
+
+        mock_chat_task.assert_called_once_with(ids=["7"])
@@ -1,10 +1,9 @@
 import pytest
-import uuid
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from django.utils import timezone
 from chat.models import ScheduledMessage, Message
 from chat.tasks import send_scheduled_message
-from chat.serializers import MessageSerializer
+from chat.serializers import MessageSerializer, LeanMessageSerializer
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -34,37 +33,83 @@ class TestSendScheduledMessageTask:
             sent=False,
         )
 
-    @patch("chat.tasks.Message.objects.create")
     @patch("chat.tasks.get_channel_layer")
-    def test_send_scheduled_message(
-        self, mock_get_channel_layer, mock_message_create, scheduled_message
-    ):
-        mock_message = MagicMock(spec=Message)
-        mock_message_create.return_value = mock_message
-        uuid_num = uuid.uuid4()
-        mock_message.id = uuid_num
-        mock_message.text = scheduled_message.text
-        mock_message.sent_at = timezone.now()
-
+    def test_send_scheduled_message(self, mock_get_channel_layer, scheduled_message):
         mock_channel_layer = MagicMock()
+        mock_channel_layer.group_send = AsyncMock()
         mock_get_channel_layer.return_value = mock_channel_layer
 
-        send_scheduled_message()
+        assert send_scheduled_message() == 1
 
-        mock_message_create.assert_called_once()
-        created_message_id = mock_message_create.return_value.id
-        assert created_message_id == uuid_num
+        message = Message.objects.get(chat=scheduled_message.chat)
+        assert message.text == scheduled_message.text
+        assert str(message.sender_id) == str(scheduled_message.sender_id)
 
         scheduled_message.refresh_from_db()
         assert scheduled_message.sent is True
 
-        serializer = MessageSerializer(mock_message)
+        serializer = MessageSerializer([message], many=True)
+        lean_serializer = LeanMessageSerializer([message], many=True)
 
-        mock_channel_layer.group_send.assert_called_once_with(
+        assert mock_channel_layer.group_send.call_count == 2
+        mock_channel_layer.group_send.assert_any_call(
             f"chat__{scheduled_message.chat.id}",
-            {"type": "chat_message", "text": serializer.data},
+            {"type": "chat_messages", "room": f"chat__{scheduled_message.chat.id}", "messages": serializer.data},
+        )
+        mock_channel_layer.group_send.assert_any_call(
+            f"chat__{scheduled_message.chat.id}__lean",
+            {"type": "chat_messages", "room": f"chat__{scheduled_message.chat.id}", "messages": lean_serializer.data},
         )
 
+    @patch("chat.tasks.get_channel_layer")
+    def test_send_scheduled_messages_batched_per_chat(
+        self, mock_get_channel_layer, scheduled_message, chat, owner
+    ):
+        ScheduledMessage.objects.create(
+            chat=chat,
+            sender=owner,
+            text="Second scheduled message",
+            scheduled_time=timezone.now() - timezone.timedelta(seconds=30),
+            sent=False,
+        )
+        mock_channel_layer = MagicMock()
+        mock_channel_layer.group_send = AsyncMock()
+        mock_get_channel_layer.return_value = mock_channel_layer
+
+        assert send_scheduled_message() == 2
+
+        assert Message.objects.filter(chat=chat).count() == 2
+        assert not ScheduledMessage.objects.filter(sent=False).exists()
+        # Bitta chat uchun har bir protokolga bitta partiya hodisasi
+        assert mock_channel_layer.group_send.call_count == 2
+        event = mock_channel_layer.group_send.call_args_list[0].args[1]
+        assert [message["text"] for message in event["messages"]] == [
+            "Scheduled message text",
+            "Second scheduled message",
+        ]
+
+        # Qayta ishga tushirilganda habarlar ikkinchi marta yuborilmaydi
+        assert send_scheduled_message() == 0
+        assert Message.objects.filter(chat=chat).count() == 2
+
+    @patch("chat.tasks.get_channel_layer")
+    def test_send_scheduled_message_by_ids(
+        self, mock_get_channel_layer, scheduled_message, chat, owner
+    ):
+        later = ScheduledMessage.objects.create(
+            chat=chat,
+            sender=owner,
+            text="Not handed over",
+            scheduled_time=timezone.now() - timezone.timedelta(seconds=30),
+            sent=False,
+        )
+        mock_get_channel_layer.return_value.group_send = AsyncMock()
+
+        assert send_scheduled_message(ids=[str(scheduled_message.id)]) == 1
+
+        later.refresh_from_db()
+        assert later.sent is False
+
     @patch("chat.tasks.get_task_logger")
     def test_send_scheduled_message_no_messages(self, mock_get_task_logger):
         ScheduledMessage.objects.all().delete()
@@ -4,7 +4,7 @@ from faker import Faker
 from io import BytesIO
 from PIL import Image
 from rest_framework.test import APIClient
-from rest_framework_simplejwt.tokens import RefreshToken
+from share.tokens import RefreshToken
 from django.core.files.uploadedfile import SimpleUploadedFile
 from core import settings
 from pytest_factoryboy import register
@@ -91,3 +91,23 @@ def fake_uuid():
 def set_env_vars(monkeypatch):
     """Automatically override ENABLE_ES for all tests."""
     monkeypatch.setenv("ENABLE_ES", "False")
+
+
+@pytest.fixture(autouse=True)
+def clear_auth_cache():
+    """Tests must not see access token decisions or users cached by earlier tests."""
+    from share.cache import AuthCache
+
+    AuthCache.clear()
+    yield
+    AuthCache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_device_activity_cache():
+    """Requests of earlier tests must not dedupe device activity of this one."""
+    from user.services import DeviceActivityService
+
+    DeviceActivityService.seen.clear()
+    yield
+    DeviceActivityService.seen.clear()
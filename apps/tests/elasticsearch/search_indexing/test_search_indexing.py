@@ -0,0 +1,119 @@
+import uuid
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from django.apps import apps
+
+from channel.models import Channel
+from share.indexing import FieldAwareSignalProcessor, SearchIndexService
+from share.tasks import flush_search_index_task
+from user.models import User
+
+
+def make_document(model, fields):
+    """Stand-in for a registered django_elasticsearch_dsl document (tests run with ENABLE_ES=False)"""
+    doc = MagicMock()
+    doc.get_queryset.side_effect = lambda: model.objects.all()
+
+    class Document:
+        _fields = {name: SimpleNamespace(_path=[name]) for name in fields}
+        django = SimpleNamespace(model=model, ignore_signals=False)
+
+        def __new__(cls):
+            return doc
+
+    return Document
+
+
+@pytest.fixture
+def documents(mocker):
+    documents = {
+        User: make_document(User, ["phone_number", "first_name", "last_name"]),
+        Channel: make_document(Channel, ["name"]),
+    }
+    mocker.patch.object(
+        SearchIndexService, "get_documents", side_effect=lambda model: {documents[model]} if model in documents else set()
+    )
+    return documents
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    SearchIndexService.get_redis_client().delete(SearchIndexService.QUEUE_KEY)
+    yield
+    SearchIndexService.get_redis_client().delete(SearchIndexService.QUEUE_KEY)
+
+
+def queued():
+    return {member.decode() for member in SearchIndexService.get_redis_client().smembers(SearchIndexService.QUEUE_KEY)}
+
+
+def test_processor_is_installed():
+    assert isinstance(apps.get_app_config("django_elasticsearch_dsl").signal_processor, FieldAwareSignalProcessor)
+
+
+def test_only_indexed_fields_are_relevant(documents):
+    assert not SearchIndexService.is_relevant(User, ["is_online", "last_seen"])
+    assert not SearchIndexService.is_relevant(User, ["last_login"])
+    assert SearchIndexService.is_relevant(User, ["first_name", "updated_at"])
+    assert SearchIndexService.is_relevant(User)
+    assert not SearchIndexService.is_relevant(Channel, ["description"])
+    assert SearchIndexService.is_relevant(Channel, ["name"])
+
+
+def test_prepare_method_makes_every_save_relevant(documents):
+    documents[User].prepare_first_name = lambda self, instance: instance.get_full_name()
+
+    assert SearchIndexService.is_relevant(User, ["is_online"])
+
+
+@pytest.mark.django_db
+def test_presence_save_is_not_queued(documents, user_factory, django_capture_on_commit_callbacks):
+    user = user_factory.create()
+    SearchIndexService.get_redis_client().delete(SearchIndexService.QUEUE_KEY)
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        user.is_online = True
+        user.save(update_fields=["is_online", "last_seen"])
+
+    assert callbacks == []
+    assert queued() == set()
+
+
+@pytest.mark.django_db
+def test_indexed_change_is_queued_and_flushed_in_bulk(documents, user_factory, django_capture_on_commit_callbacks):
+    users = user_factory.create_batch(3)
+    SearchIndexService.get_redis_client().delete(SearchIndexService.QUEUE_KEY)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        for user in users:
+            user.first_name = "Renamed"
+            user.save(update_fields=["first_name"])
+            user.save(update_fields=["first_name"])
+    # Indeksga so'rov saqlash paytida emas, flush'da yuboriladi
+    documents[User]().update.assert_not_called()
+    assert queued() == {f"user.user:{user.pk}" for user in users}
+
+    assert flush_search_index_task() == 3
+
+    update = documents[User]().update
+    update.assert_called_once()
+    objects = update.call_args.args[0]
+    assert {str(user.pk) for user in objects} == {str(user.pk) for user in users}
+    assert update.call_args.kwargs == {"refresh": False}
+    assert queued() == set()
+
+
+@pytest.mark.django_db
+def test_missing_rows_are_deleted_from_index(documents, django_capture_on_commit_callbacks):
+    pk = uuid.uuid4()
+    with django_capture_on_commit_callbacks(execute=True):
+        SearchIndexService.enqueue(User(pk=pk))
+
+    flush_search_index_task()
+
+    update = documents[User]().update
+    update.assert_called_once()
+    assert [user.pk for user in update.call_args.args[0]] == [str(pk)]
+    assert update.call_args.kwargs == {"refresh": False, "action": "delete", "raise_on_error": False}
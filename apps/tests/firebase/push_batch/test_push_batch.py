@@ -0,0 +1,46 @@
+import pytest
+from unittest.mock import patch
+
+from share.push import FakeTransport
+from share.tasks import send_push_batch
+from user.models import NotificationPreference
+
+
+@pytest.fixture
+def fake_transport(settings):
+    settings.PUSH_TRANSPORT = "share.push.FakeTransport"
+
+
+@pytest.mark.django_db
+class TestSendPushBatch:
+    def test_users_are_resolved_and_unregistered_tokens_pruned(self, user_factory, fake_transport):
+        active, stale, disabled = user_factory.create_batch(3)
+        NotificationPreference.objects.create(user=active, notifications_enabled=True, device_token="token-1")
+        NotificationPreference.objects.create(user=stale, notifications_enabled=True, device_token="unregistered-1")
+        NotificationPreference.objects.create(user=disabled, notifications_enabled=False, device_token="token-2")
+
+        result = send_push_batch.apply(
+            args=("Title", "Body"), kwargs={"user_ids": [str(active.id), str(stale.id), str(disabled.id)]}
+        ).get()
+
+        assert result == {"success": 1, "failure": 0, "pruned": 1, "retry": 0}
+        assert NotificationPreference.objects.get(user=stale).device_token is None
+        assert NotificationPreference.objects.get(user=active).device_token == "token-1"
+
+    def test_tokens_are_sent_in_multicast_chunks(self, fake_transport):
+        tokens = [f"token-{i}" for i in range(1201)]
+        with patch.object(FakeTransport, "send_multicast", autospec=True, side_effect=FakeTransport.send_multicast) as send:
+            result = send_push_batch.apply(args=("Title", "Body"), kwargs={"tokens": tokens}).get()
+
+        assert result["success"] == 1201
+        assert [len(call.args[1].tokens) for call in send.call_args_list] == [500, 500, 201]
+
+    def test_transient_failures_are_retried_only_for_failed_tokens(self, fake_transport):
+        with patch.object(send_push_batch, "retry", side_effect=RuntimeError("retry")) as retry:
+            with pytest.raises(RuntimeError):
+                send_push_batch.apply(
+                    args=("Title", "Body"), kwargs={"tokens": ["token-1", "unavailable-1"]}, throw=True
+                )
+
+        assert retry.call_args.kwargs["kwargs"]["tokens"] == ["unavailable-1"]
+        assert retry.call_args.kwargs["countdown"] > 0
@@ -0,0 +1,192 @@
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock, patch
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from core.asgi import application
+from group.consumers import GroupConsumer
+from group.models import GroupPermission
+from group.services import GroupAccessService
+from share.services import TokenService
+
+
+@pytest.fixture(autouse=True)
+def clear_group_access_cache():
+    GroupAccessService.cache.clear()
+    yield
+    GroupAccessService.cache.clear()
+
+
+@pytest.fixture
+def channel_layer(settings):
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    return get_channel_layer()
+
+
+@pytest.mark.django_db
+class TestGroupAccessSnapshot:
+    def test_snapshot_in_one_query(self, user_factory, group_factory):
+        group = group_factory.create(is_private=True)
+        GroupPermission.objects.create(group=group, can_send_messages=False)
+        member = user_factory.create()
+        group.members.add(member)
+
+        with CaptureQueriesContext(connection) as context:
+            loaded = GroupAccessService.get_group(group.id, member.id)
+            access = GroupAccessService.snapshot(loaded, member.id)
+            owner_name = loaded.owner.phone_number
+
+        assert owner_name == group.owner.phone_number
+        assert len(context.captured_queries) == 1
+        assert access == {
+            "is_private": True,
+            "is_member": True,
+            "can_send_messages": False,
+            "can_send_media": True,
+        }
+        assert GroupAccessService.get_cached_access(group.id, member.id) == access
+
+    def test_owner_and_stranger(self, user_factory, group_factory):
+        group = group_factory.create()
+        stranger = user_factory.create()
+
+        assert GroupAccessService.get_access(group.id, group.owner.id)["is_member"]
+        # GroupPermission qatori yo'q: model standart qiymatlari
+        assert GroupAccessService.get_access(group.id, stranger.id) == {
+            "is_private": False,
+            "is_member": False,
+            "can_send_messages": True,
+            "can_send_media": True,
+        }
+
+    def test_save_message_is_single_insert(self, group_factory):
+        group = group_factory.create()
+        consumer = GroupConsumer()
+
+        with CaptureQueriesContext(connection) as context:
+            message = GroupConsumer.__dict__["save_message"].func(consumer, group, group.owner, {"text": "Salom"})
+            GroupConsumer.__dict__["serialize_message_versions"].func(consumer, message)
+
+        assert [query["sql"].split()[0] for query in context.captured_queries] == ["INSERT"]
+
+    def test_permission_patch_invalidates_cache(
+        self, mocker, tokens, api_client, group_factory, user_factory, django_capture_on_commit_callbacks
+    ):
+        group = group_factory.create()
+        GroupPermission.objects.create(group=group)
+        member = user_factory.create()
+        group.members.add(member)
+        GroupAccessService.get_access(group.id, member.id)
+        mocker.patch.object(TokenService, "get_redis_client", return_value=MagicMock())
+        access, _ = tokens(group.owner)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client(access).patch(
+                f"/api/groups/{group.id}/permissions/", {"can_send_messages": False}, format="json"
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert GroupAccessService.get_cached_access(group.id, member.id) is None
+        assert GroupAccessService.get_access(group.id, member.id)["can_send_messages"] is False
+
+    def test_membership_changes_notify_on_commit(
+        self, mocker, group_factory, user_factory, django_capture_on_commit_callbacks
+    ):
+        group = group_factory.create()
+        member = user_factory.create()
+        notify_changed = mocker.patch.object(GroupAccessService, "notify_changed")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            group.members.add(member)
+        with django_capture_on_commit_callbacks(execute=True):
+            member.user_groups.remove(group)
+        with django_capture_on_commit_callbacks(execute=True):
+            group.name = "Yangi nom"
+            group.save(update_fields=["name"])
+
+        assert [call.args for call in notify_changed.call_args_list] == [(group.pk,), (group.pk,)]
+
+    def test_changes_are_not_sent_before_commit(self, mocker, group_factory, django_capture_on_commit_callbacks):
+        group = group_factory.create()
+        notify_changed = mocker.patch.object(GroupAccessService, "notify_changed")
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            GroupPermission.objects.create(group=group, can_send_media=False)
+
+        notify_changed.assert_not_called()
+        assert len(callbacks) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestGroupConsumerAccessCache:
+    async def connect(self, group, user, tokens):
+        access, _ = await database_sync_to_async(tokens)(user)
+        communicator = WebsocketCommunicator(application, f"/ws/groups/{group.id}/?token={access}")
+        connected, _ = await communicator.connect()
+        assert connected
+        await communicator.receive_json_from()  # get_messages
+        await communicator.receive_json_from()  # get_participants
+        return communicator
+
+    async def send(self, communicator, group, text):
+        await communicator.send_json_to(
+            {"action": "create_message", "request_id": "1", "pk": str(group.id), "data": {"text": text}}
+        )
+        return await communicator.receive_json_from(timeout=2)
+
+    async def test_send_path_does_not_reload_access(self, channel_layer, tokens, group_factory):
+        group = await database_sync_to_async(group_factory.create)()
+        await database_sync_to_async(GroupPermission.objects.create)(group=group)
+        communicator = await self.connect(group, group.owner, tokens)
+
+        with patch.object(GroupAccessService, "get_group", wraps=GroupAccessService.get_group) as get_group:
+            for index in range(3):
+                data = await self.send(communicator, group, f"Salom {index}")
+                assert data["action"] == "new_message"
+
+        get_group.assert_not_called()
+        await communicator.disconnect()
+
+    async def test_access_change_event_drops_snapshot(self, channel_layer, tokens, group_factory, user_factory):
+        group = await database_sync_to_async(group_factory.create)()
+        permission = await database_sync_to_async(GroupPermission.objects.create)(group=group)
+        member = await database_sync_to_async(user_factory.create)()
+        await database_sync_to_async(group.members.add)(member)
+        communicator = await self.connect(group, member, tokens)
+        assert (await self.send(communicator, group, "Birinchi"))["action"] == "new_message"
+
+        # group.signals tranzaksiyadan keyin group_access_changed yuboradi
+        permission.can_send_messages = False
+        await database_sync_to_async(permission.save)()
+        await asyncio.sleep(0.05)
+
+        data = await self.send(communicator, group, "Ikkinchi")
+        assert data == {"detail": "Sizning habar yuborish huquqingiz yo'q."}
+        await communicator.disconnect()
+
+    async def test_connection_snapshot_expires(
+        self, channel_layer, settings, monkeypatch, tokens, group_factory, user_factory
+    ):
+        settings.GROUP_ACCESS_CACHE_TTL = 0.5
+        monkeypatch.setattr(GroupAccessService.cache, "ttl", 0.5)
+        group = await database_sync_to_async(group_factory.create)()
+        await database_sync_to_async(GroupPermission.objects.create)(group=group)
+        member = await database_sync_to_async(user_factory.create)()
+        await database_sync_to_async(group.members.add)(member)
+        communicator = await self.connect(group, member, tokens)
+
+        # Signalsiz o'zgarish (queryset.update): snapshot faqat TTL tugagach yangilanadi
+        await database_sync_to_async(GroupPermission.objects.filter(group=group).update)(can_send_messages=False)
+        assert (await self.send(communicator, group, "Birinchi"))["action"] == "new_message"
+
+        await asyncio.sleep(0.6)
+        data = await self.send(communicator, group, "Ikkinchi")
+        assert data == {"detail": "Sizning habar yuborish huquqingiz yo'q."}
+        await communicator.disconnect()
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+
+from chat.models import Chat
+from core.asgi import application
+from share.layers import NodeFanoutChannelLayer
+
+
+@pytest_asyncio.fixture
+async def layer():
+    layer = NodeFanoutChannelLayer(hosts=[settings.REDIS_URL], prefix="test-fanout")
+    yield layer
+    await layer.flush()
+
+
+async def receive(layer, channel):
+    return await asyncio.wait_for(layer.receive(channel), timeout=2)
+
+
+@pytest.mark.asyncio
+class TestNodeFanoutChannelLayer:
+    async def test_group_send_is_one_publish_for_all_local_members(self, layer):
+        channels = [await layer.new_channel() for _ in range(3)]
+        for channel in channels:
+            await layer.group_add("group__big", channel)
+
+        connection = layer.connection(0)
+        # Pub/sub obunachilari soni: jarayon xonaga bir marta obuna bo'ladi
+        assert await connection.execute_command("PUBSUB", "NUMSUB", layer.fanout_name("group__big")) == [
+            layer.fanout_name("group__big").encode(), 1
+        ]
+        await layer.group_send("group__big", {"type": "group.message", "text": "Salom"})
+
+        for channel in channels:
+            assert await receive(layer, channel) == {"type": "group.message", "text": "Salom"}
+        # Guruh a'zolari Redis'da saqlanmaydi
+        assert await connection.keys("test-fanout*group*") == []
+
+    async def test_discarded_member_stops_receiving(self, layer):
+        first, second = await layer.new_channel(), await layer.new_channel()
+        await layer.group_add("chat__room", first)
+        await layer.group_add("chat__room", second)
+        await layer.group_discard("chat__room", first)
+
+        await layer.group_send("chat__room", {"type": "chat.message", "text": "1"})
+        assert await receive(layer, second) == {"type": "chat.message", "text": "1"}
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(first), timeout=0.3)
+
+        await layer.group_discard("chat__room", second)
+        assert layer.loop_layer().get_listener(0).subscribed == set()
+
+    async def test_direct_send_still_uses_the_queue(self, layer):
+        channel = await layer.new_channel()
+        await layer.send(channel, {"type": "direct", "value": 1})
+        assert await receive(layer, channel) == {"type": "direct", "value": 1}
+
+    async def test_foreign_channel_cannot_join_group(self, layer):
+        with pytest.raises(RuntimeError):
+            await layer.group_add("chat__room", "specific.other-process!abc")
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_chat_consumers_on_fanout_layer(settings, tokens, user_factory):
+    settings.CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "share.layers.NodeFanoutChannelLayer",
+            "CONFIG": {"hosts": [settings.REDIS_URL], "prefix": "test-fanout"},
+        }
+    }
+    settings.ROSTER_DELTA_WINDOW = 0.01
+    owner = await database_sync_to_async(user_factory.create)()
+    peer = await database_sync_to_async(user_factory.create)()
+    chat = await database_sync_to_async(Chat.objects.create)(owner=owner, user=peer)
+
+    communicators = []
+    for user in (owner, peer):
+        access, _ = await database_sync_to_async(tokens)(user)
+        communicator = WebsocketCommunicator(application, f"/ws/chats/{chat.id}/?token={access}")
+        connected, _ = await communicator.connect()
+        assert connected
+        await communicator.receive_json_from()  # get_messages
+        await communicator.receive_json_from()  # get_participants
+        communicators.append(communicator)
+
+    await communicators[0].send_json_to(
+        {"action": "create_message", "request_id": "1", "pk": str(chat.id), "data": {"text": "Salom"}}
+    )
+    for communicator in communicators:
+        while True:
+            frame = await communicator.receive_json_from(timeout=2)
+            if frame["action"] == "new_message":
+                break
+        assert frame["data"]["text"] == "Salom"
+
+    for communicator in communicators:
+        await communicator.disconnect()
+    await asyncio.sleep(0.05)
+    await get_channel_layer().flush()
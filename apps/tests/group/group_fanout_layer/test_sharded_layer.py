@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from unittest.mock import MagicMock
+from channels.exceptions import ChannelFull
+from django.conf import settings
+from rest_framework import status
+
+from share.layers import NodeFanoutChannelLayer
+from share.services import TokenService
+
+SHARDS = [f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/{db}" for db in (3, 4)]
+
+
+@pytest_asyncio.fixture
+async def layer():
+    layer = NodeFanoutChannelLayer(
+        hosts=[{"address": address, "max_connections": 10} for address in SHARDS],
+        prefix="test-shard",
+        capacity=2,
+    )
+    yield layer
+    await layer.flush()
+
+
+async def receive(layer, channel):
+    return await asyncio.wait_for(layer.receive(channel), timeout=2)
+
+
+def groups_on_both_shards(layer):
+    groups = {}
+    for i in range(100):
+        groups.setdefault(layer.consistent_hash(f"chat__{i}"), f"chat__{i}")
+        if len(groups) == 2:
+            return [groups[0], groups[1]]
+    raise AssertionError("no group for every shard")
+
+
+@pytest.mark.asyncio
+class TestShardedChannelLayer:
+    async def test_rooms_on_every_shard_are_delivered(self, layer):
+        channel = await layer.new_channel()
+        groups = groups_on_both_shards(layer)
+        for group in groups:
+            await layer.group_add(group, channel)
+
+        for shard, group in enumerate(groups):
+            assert await layer.connection(shard).pubsub_numsub(layer.fanout_name(group)) == [
+                (layer.fanout_name(group).encode(), 1)
+            ]
+        await layer.group_send_many([(group, {"type": "chat.message", "room": group}) for group in groups])
+
+        received = [await receive(layer, channel), await receive(layer, channel)]
+        assert sorted(message["room"] for message in received) == sorted(groups)
+
+    async def test_pipelined_send_respects_capacity(self, layer):
+        channel = await layer.new_channel()
+        await layer.send(channel, {"type": "direct", "value": 1})
+        await layer.send(channel, {"type": "direct", "value": 2})
+        with pytest.raises(ChannelFull):
+            await layer.send(channel, {"type": "direct", "value": 3})
+
+        assert await receive(layer, channel) == {"type": "direct", "value": 1}
+        assert await receive(layer, channel) == {"type": "direct", "value": 2}
+
+    async def test_process_queue_is_read_from_its_shard(self, layer):
+        # Stock send hashed the full channel name, receive hashes the process part only
+        channels = [await layer.new_channel() for _ in range(10)]
+        for value, channel in enumerate(channels):
+            await layer.send(channel, {"type": "direct", "value": value})
+            assert await receive(layer, channel) == {"type": "direct", "value": value}
+
+    async def test_shard_stats(self, layer):
+        layer.prefix = "test-shard-stats"
+        channel = await layer.new_channel()
+        await layer.group_add(groups_on_both_shards(layer)[1], channel)
+        await layer.send("plain.channel", {"type": "direct"})
+
+        stats = await layer.shard_stats()
+
+        assert [shard["address"] for shard in stats["shards"]] == SHARDS
+        # Ikkala shard bitta serverning bazalari, pub/sub kanallari esa server bo'yicha umumiy
+        assert [shard["rooms"] for shard in stats["shards"]] == [1, 1]
+        assert sum(shard["queued_messages"] for shard in stats["shards"]) == 1
+        assert stats["process"] == {"rooms": 1, "members": 1, "buffered_messages": 0}
+
+    async def test_password_is_not_reported(self):
+        layer = NodeFanoutChannelLayer(hosts=["redis://:secret@redis.local:6379/2"])
+        assert layer.redacted_address(0) == "redis://redis.local:6379/2"
+
+
+@pytest.mark.django_db
+class TestChannelLayerStatsView:
+    url = "/api/metrics/channel-layer/"
+
+    @pytest.fixture(autouse=True)
+    def redis_client(self, mocker):
+        mock_redis_client = MagicMock()
+        mocker.patch.object(TokenService, "get_redis_client", return_value=mock_redis_client)
+        return mock_redis_client
+
+    def test_admin_gets_shard_stats(self, api_client, tokens, user_factory, redis_client, settings):
+        settings.CHANNEL_LAYERS = {
+            "default": {
+                "BACKEND": "share.layers.NodeFanoutChannelLayer",
+                "CONFIG": {"hosts": SHARDS, "prefix": "test-shard"},
+            }
+        }
+        admin = user_factory.create(is_staff=True)
+        access, _ = tokens(admin)
+        redis_client.smembers.return_value = {access.encode()}
+
+        response = api_client(access).get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [shard["shard"] for shard in response.data["shards"]] == [0, 1]
+
+    def test_other_layers_have_no_stats(self, api_client, tokens, user_factory, redis_client, settings):
+        settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+        admin = user_factory.create(is_staff=True)
+        access, _ = tokens(admin)
+        redis_client.smembers.return_value = {access.encode()}
+
+        response = api_client(access).get(self.url)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_regular_user_is_forbidden(self, api_client, tokens, user_factory, redis_client):
+        user = user_factory.create()
+        access, _ = tokens(user)
+        redis_client.smembers.return_value = {access.encode()}
+
+        response = api_client(access).get(self.url)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
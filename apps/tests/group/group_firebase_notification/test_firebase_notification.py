@@ -100,7 +100,7 @@ class TestGroupConsumer:
     @pytest.mark.asyncio
     @patch("redis.asyncio.client.Redis")
     @patch("share.middleware.jwt.decode")
-    @patch("share.tasks.send_push_notification.delay")
+    @patch("group.tasks.send_push_batch.delay")
     async def test_chat_connection(
         self,
         mock_send_push_notification,
@@ -150,9 +150,9 @@ class TestGroupConsumer:
         assert data["data"]["text"] == "Hello, group!"
 
         mock_send_push_notification.assert_called_once_with(
-            token="fake_device_token",
-            title="New Message in Group",
-            body="Hello, group!",
+            "New Message in Group",
+            "Hello, group!",
+            tokens=["fake_device_token"],
         )
 
         await communicator.disconnect()
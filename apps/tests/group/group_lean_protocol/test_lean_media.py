@@ -0,0 +1,64 @@
+import pytest
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from channels.layers import get_channel_layer
+from core.asgi import application
+from group.models import GroupParticipant, GroupPermission
+
+
+@pytest.fixture
+def channel_layer(settings):
+    """Override the channel layer to use an in-memory channel layer for testing."""
+    settings.CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+    return get_channel_layer()
+
+
+async def receive_action(communicator, action):
+    """Skip roster updates until the expected action arrives."""
+    while True:
+        data = await communicator.receive_json_from()
+        if data.get("action") == action:
+            return data
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestGroupLeanMedia:
+    @database_sync_to_async
+    def create_group(self, user_factory, group_factory):
+        owner = user_factory.create()
+        member = user_factory.create()
+        group = group_factory.create(owner=owner, is_private=False)
+        GroupPermission.objects.create(group=group, can_send_media=True)
+        GroupParticipant.objects.get_or_create(group=group, user=member)
+        return group, owner, member
+
+    async def test_lean_member_receives_media_posted_over_rest(
+        self, user_factory, group_factory, channel_layer, api_client, tokens, generate_test_image
+    ):
+        group, owner, member = await self.create_group(user_factory, group_factory)
+        member_access, _ = tokens(member)
+
+        lean = WebsocketCommunicator(application, f"/ws/groups/{group.pk}/?token={member_access}&v=2")
+        connected, _ = await lean.connect()
+        assert connected
+
+        access, _ = tokens(owner)
+        response = await database_sync_to_async(api_client(access).post)(
+            f"/api/groups/{group.pk}/messages/",
+            {"text": "Photo", "image": generate_test_image},
+            format="multipart",
+        )
+        assert response.status_code == 201
+
+        lean_message = (await receive_action(lean, "new_message"))["data"]
+        assert lean_message["id"] == str(response.data["id"])
+        assert lean_message["text"] == "Photo"
+        assert lean_message["image"]
+        assert "group" not in lean_message
+
+        await lean.disconnect()
@@ -0,0 +1,109 @@
+import base64
+import json
+
+import pytest
+import jwt
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from channels.layers import get_channel_layer
+from core import settings
+from core.asgi import application
+from group.models import GroupMessage
+from rest_framework.exceptions import ValidationError
+from share.paginations import MessageCursorPaginator
+
+
+@pytest.fixture
+def channel_layer(settings):
+    """Override the channel layer to use an in-memory channel layer for testing."""
+    settings.CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+    return get_channel_layer()
+
+
+def forged_cursor(message_id):
+    payload = json.dumps({"sent_at": "2024-01-01T00:00:00+00:00", "id": message_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("message_id", ["not-an-id", "1 OR 1=1", None, [1], {"id": 1}])
+@pytest.mark.parametrize("direction", ["before", "after"])
+def test_forged_cursor_id_is_a_validation_error(message_id, direction):
+    with pytest.raises(ValidationError):
+        MessageCursorPaginator.paginate(GroupMessage.objects.all(), **{direction: forged_cursor(message_id)})
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestGroupMessageHistory:
+    @database_sync_to_async
+    def create_group_with_messages(self, group_factory, count):
+        group = group_factory.create()
+        for index in range(count):
+            GroupMessage.objects.create(group=group, sender=group.owner, text=f"message {index}")
+        return group
+
+    @database_sync_to_async
+    def create_message(self, group, text):
+        return GroupMessage.objects.create(group=group, sender=group.owner, text=text)
+
+    def generate_jwt_token(self, user_id):
+        payload = {
+            "user_id": str(user_id),
+            "exp": datetime.utcnow() + timedelta(minutes=10),
+        }
+        return payload, jwt.encode(payload, settings.SECRET_KEY, algorithm="HS256")
+
+    @patch("share.middleware.jwt.decode")
+    async def test_connect_sends_newest_page_and_since_returns_delta(
+        self, mock_jwt_decode, group_factory, channel_layer
+    ):
+        group = await self.create_group_with_messages(group_factory, 5)
+        payload, token = self.generate_jwt_token(group.owner_id)
+        mock_jwt_decode.return_value = payload
+
+        with patch.object(MessageCursorPaginator, "page_size", 2):
+            communicator = WebsocketCommunicator(
+                application, f"/ws/groups/{group.pk}/?token={token}"
+            )
+            connected, _ = await communicator.connect()
+            assert connected
+
+            newest = await communicator.receive_json_from()
+            assert newest["action"] == "get_messages"
+            assert [m["text"] for m in newest["messages"]] == ["message 3", "message 4"]
+            assert newest["has_more"] is True
+            await communicator.receive_json_from()
+
+            await communicator.send_json_to(
+                {
+                    "action": "get_group_messages",
+                    "request_id": "1",
+                    "pk": str(group.pk),
+                    "before": newest["cursors"]["before"],
+                }
+            )
+            older = await communicator.receive_json_from()
+            assert older["action"] == "get_group_messages"
+            assert [m["text"] for m in older["messages"]] == ["message 1", "message 2"]
+
+            await self.create_message(group, "missed message")
+            await communicator.send_json_to(
+                {
+                    "action": "get_messages",
+                    "request_id": "2",
+                    "pk": str(group.pk),
+                    "since": newest["cursors"]["after"],
+                }
+            )
+            delta = await communicator.receive_json_from()
+            assert [m["text"] for m in delta["messages"]] == ["missed message"]
+            assert delta["has_more"] is False
+
+            await communicator.disconnect()
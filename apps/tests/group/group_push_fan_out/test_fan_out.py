@@ -0,0 +1,45 @@
+import pytest
+from unittest.mock import patch
+
+from group.models import GroupMessage
+from group.tasks import fan_out_group_message
+from share.services import PresenceService
+from user.models import NotificationPreference
+
+
+@pytest.mark.django_db
+class TestGroupPushFanOut:
+    def create_member(self, user_factory, group, enabled=True, token="token"):
+        user = user_factory.create()
+        group.members.add(user)
+        NotificationPreference.objects.create(
+            user=user, notifications_enabled=enabled, device_token=token
+        )
+        return user
+
+    @patch("group.tasks.send_push_batch.delay")
+    def test_only_offline_members_with_notifications_are_batched(
+        self, mock_multicast, user_factory, group_factory, settings, django_assert_max_num_queries
+    ):
+        settings.PUSH_MULTICAST_BATCH_SIZE = 2
+        sender = user_factory.create()
+        group = group_factory.create(owner=sender)
+        group.members.add(sender)
+        NotificationPreference.objects.create(user=sender, notifications_enabled=True, device_token="sender")
+        offline_tokens = [f"offline-{i}" for i in range(3)]
+        for token in offline_tokens:
+            self.create_member(user_factory, group, token=token)
+        online = self.create_member(user_factory, group, token="online")
+        PresenceService.connect(online.id, "tab")
+        self.create_member(user_factory, group, enabled=False, token="disabled")
+        self.create_member(user_factory, group, token="")
+        message = GroupMessage.objects.create(group=group, sender=sender, text="Salom")
+
+        with django_assert_max_num_queries(2):
+            batches = fan_out_group_message(str(message.id))
+
+        assert batches == 2
+        sent_tokens = [token for call in mock_multicast.call_args_list for token in call.kwargs["tokens"]]
+        assert sorted(sent_tokens) == offline_tokens
+        assert all(len(call.kwargs["tokens"]) <= 2 for call in mock_multicast.call_args_list)
+        assert mock_multicast.call_args.args == ("New Message in Group", "Salom")
@@ -0,0 +1,65 @@
+import pytest
+from unittest.mock import MagicMock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from group.models import GroupMessage, GroupPermission
+from group.serializers import GroupMessageSerializer
+from share.paginations import MessageCursorPaginator
+from share.services import IS_TOKEN_REVOKED_SCRIPT, TokenService
+
+# Tarix endpointlari uchun ruxsat etilgan maksimal so'rovlar soni
+REST_HISTORY_QUERY_BUDGET = 8
+WS_HISTORY_QUERY_BUDGET = 2
+
+
+@pytest.mark.django_db
+class TestGroupHistoryQueryBudget:
+    @pytest.fixture
+    def group_with_messages(self, user_factory, group_factory):
+        def _group_with_messages(count):
+            group = group_factory.create()
+            GroupPermission.objects.create(group=group)
+            member = user_factory.create()
+            group.members.add(member)
+            for index in range(count):
+                message = GroupMessage.objects.create(group=group, sender=member, text=f"message {index}")
+                message.liked_by.add(group.owner, member)
+            return group
+
+        return _group_with_messages
+
+    @pytest.mark.parametrize("message_count", [2, 10])
+    def test_rest_history_within_budget(
+        self, message_count, mocker, tokens, api_client, group_with_messages
+    ):
+        group = group_with_messages(message_count)
+        mock_redis_client = MagicMock()
+        mocker.patch.object(TokenService, "get_redis_client", return_value=mock_redis_client)
+        access, _ = tokens(group.owner)
+        mock_redis_client.eval.return_value = 0  # token bekor qilinmagan
+        client = api_client(access)
+
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(f"/api/groups/{group.id}/messages/")
+
+        assert response.status_code == status.HTTP_200_OK
+        # Autentifikatsiya Redis'ga bitta skript bilan murojaat qiladi (token ro'yhati o'qilmaydi)
+        mock_redis_client.eval.assert_called_once()
+        assert mock_redis_client.eval.call_args.args[0] == IS_TOKEN_REVOKED_SCRIPT
+        mock_redis_client.smembers.assert_not_called()
+        assert len(response.data) == message_count
+        assert len(context.captured_queries) <= REST_HISTORY_QUERY_BUDGET
+
+    def test_ws_history_page_within_budget(self, group_with_messages):
+        group = group_with_messages(20)
+        queryset = GroupMessage.objects.for_serialization().filter(group_id=group.id)
+
+        with CaptureQueriesContext(connection) as context:
+            page = MessageCursorPaginator.paginate(queryset, limit=20)
+            data = GroupMessageSerializer(page["messages"], many=True).data
+
+        assert len(data) == 20
+        assert all(message["likes_count"] == 2 for message in data)
+        assert len(context.captured_queries) <= WS_HISTORY_QUERY_BUDGET
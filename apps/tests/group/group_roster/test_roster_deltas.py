@@ -0,0 +1,167 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+
+from core.asgi import application
+from group.models import Group, GroupParticipant, GroupPermission
+
+
+@pytest.fixture
+def channel_layer(settings):
+    """Override the channel layer to use an in-memory channel layer for testing."""
+    settings.CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+    settings.ROSTER_DELTA_WINDOW = 0.5
+    return get_channel_layer()
+
+
+async def receive_action(communicator, action):
+    """Skip unrelated frames until the expected action arrives."""
+    while True:
+        data = await communicator.receive_json_from(timeout=2)
+        if data.get("action") == action:
+            return data
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestGroupRoster:
+    @database_sync_to_async
+    def create_group(self, user_factory, group_factory, members_count):
+        owner = user_factory.create()
+        members = user_factory.create_batch(members_count)
+        group = group_factory.create(owner=owner, is_private=False)
+        group.members.add(owner, *members)
+        GroupPermission.objects.create(group=group)
+        return group, owner, members
+
+    def token_payload(self, user_id):
+        return {
+            "user_id": str(user_id),
+            "exp": datetime.utcnow() + timedelta(minutes=10),
+        }
+
+    async def connect(self, group, token):
+        communicator = WebsocketCommunicator(application, f"/ws/groups/{group.pk}/?token={token}")
+        connected, _ = await communicator.connect()
+        assert connected
+        await receive_action(communicator, "get_messages")
+        return communicator
+
+    @patch("share.middleware.jwt.decode")
+    async def test_joins_are_coalesced_into_one_delta(
+        self, mock_jwt_decode, user_factory, group_factory, channel_layer
+    ):
+        group, owner, members = await self.create_group(user_factory, group_factory, 2)
+        mock_jwt_decode.side_effect = [self.token_payload(user.id) for user in (owner, *members)]
+
+        owner_socket = await self.connect(group, "owner")
+        roster = await receive_action(owner_socket, "get_participants")
+        assert len(roster["users"]) == 3
+
+        member_sockets = [await self.connect(group, f"member{i}") for i in range(2)]
+
+        delta = await receive_action(owner_socket, "participants_changed")
+        assert {user["id"] for user in delta["joined"]} == {str(member.id) for member in members}
+        assert delta["left"] == []
+        assert await owner_socket.receive_nothing(timeout=0.3)
+
+        for communicator in (owner_socket, *member_sockets):
+            await communicator.disconnect()
+        await asyncio.sleep(0.6)  # chiqishlar oynasi yopilishini kutamiz
+
+    @patch("share.middleware.jwt.decode")
+    async def test_roster_is_paginated_on_request(
+        self, mock_jwt_decode, user_factory, group_factory, channel_layer
+    ):
+        group, owner, _ = await self.create_group(user_factory, group_factory, 4)
+        mock_jwt_decode.return_value = self.token_payload(owner.id)
+        communicator = await self.connect(group, "owner")
+        await receive_action(communicator, "get_participants")
+
+        seen = []
+        cursor = None
+        while True:
+            await communicator.send_json_to(
+                {"action": "get_participants", "request_id": "1", "after": cursor, "limit": 2}
+            )
+            page = await receive_action(communicator, "get_participants")
+            seen += [user["id"] for user in page["users"]]
+            cursor = page["next"]
+            if not page["has_more"]:
+                break
+
+        assert len(seen) == len(set(seen)) == 5
+        await communicator.disconnect()
+        await asyncio.sleep(0.6)
+
+    @patch("share.middleware.jwt.decode")
+    async def test_leave_is_announced_when_last_tab_closes(
+        self, mock_jwt_decode, user_factory, group_factory, channel_layer
+    ):
+        group, owner, (member,) = await self.create_group(user_factory, group_factory, 1)
+        mock_jwt_decode.side_effect = [self.token_payload(user.id) for user in (owner, member, member)]
+
+        owner_socket = await self.connect(group, "owner")
+        await asyncio.sleep(0.6)  # egasining qo'shilish oynasi yopilishini kutamiz
+        first_tab = await self.connect(group, "member")
+        second_tab = await self.connect(group, "member")
+        delta = await receive_action(owner_socket, "participants_changed")
+        assert [user["id"] for user in delta["joined"]] == [str(member.id)]
+
+        await first_tab.disconnect()
+        assert await owner_socket.receive_nothing(timeout=0.7)
+        assert await database_sync_to_async(GroupParticipant.objects.filter(group=group, user=member).exists)()
+
+        await second_tab.disconnect()
+        delta = await receive_action(owner_socket, "participants_changed")
+        assert delta["left"] == [str(member.id)]
+        assert not await database_sync_to_async(GroupParticipant.objects.filter(group=group, user=member).exists)()
+
+        await owner_socket.disconnect()
+
+    @patch("share.middleware.jwt.decode")
+    async def test_disconnect_flushes_pending_changes(
+        self, mock_jwt_decode, user_factory, group_factory, channel_layer
+    ):
+        group, owner, (member,) = await self.create_group(user_factory, group_factory, 1)
+        mock_jwt_decode.side_effect = [self.token_payload(user.id) for user in (owner, member)]
+
+        owner_socket = await self.connect(group, "owner")
+        await asyncio.sleep(0.6)
+        member_socket = await self.connect(group, "member")
+        await member_socket.disconnect()
+
+        # A'zo ochgan oyna uzilishda darhol yuboriladi, oxirgi o'zgarish - chiqish
+        delta = await asyncio.wait_for(receive_action(owner_socket, "participants_changed"), timeout=0.3)
+        assert delta["joined"] == []
+        assert delta["left"] == [str(member.id)]
+
+        await owner_socket.disconnect()
+
+    @patch("share.middleware.jwt.decode")
+    async def test_rejected_socket_does_not_announce_leave(
+        self, mock_jwt_decode, user_factory, group_factory, channel_layer
+    ):
+        group, owner, _ = await self.create_group(user_factory, group_factory, 0)
+        outsider = await database_sync_to_async(user_factory.create)()
+        await database_sync_to_async(Group.objects.filter(pk=group.pk).update)(is_private=True)
+        mock_jwt_decode.side_effect = [self.token_payload(user.id) for user in (owner, outsider)]
+
+        owner_socket = await self.connect(group, "owner")
+        await receive_action(owner_socket, "get_participants")
+        await asyncio.sleep(0.6)
+
+        communicator = WebsocketCommunicator(application, f"/ws/groups/{group.pk}/?token=outsider")
+        connected, _ = await communicator.connect()
+        assert not connected
+        assert await owner_socket.receive_nothing(timeout=0.7)
+
+        await owner_socket.disconnect()
@@ -1,11 +1,16 @@
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
 from django.utils import timezone
 from group.models import GroupScheduledMessage, GroupMessage
 from group.tasks import send_group_scheduled_message
-from group.serializers import GroupMessageSerializer
+from group.serializers import GroupMessageSerializer, LeanGroupMessageSerializer
 from django.contrib.auth import get_user_model
 
+from core.asgi import application
+
 User = get_user_model()
 
 
@@ -29,33 +34,52 @@ class TestSendGroupScheduledMessageTask:
             sent=False,
         )
 
-    @patch("group.tasks.GroupMessage.objects.create")
     @patch("group.tasks.get_channel_layer")
-    def test_send_group_scheduled_message(
-        self, mock_get_channel_layer, mock_message_create, scheduled_message
-    ):
-        mock_message = MagicMock(spec=GroupMessage)
-        mock_message_create.return_value = mock_message
-        mock_message.text = scheduled_message.text
-        mock_message.sent_at = timezone.now()
-
+    def test_send_group_scheduled_message(self, mock_get_channel_layer, scheduled_message):
         mock_channel_layer = MagicMock()
+        mock_channel_layer.group_send = AsyncMock()
         mock_get_channel_layer.return_value = mock_channel_layer
 
-        send_group_scheduled_message()
+        assert send_group_scheduled_message() == 1
 
-        mock_message_create.assert_called_once()
-        created_message = mock_message_create.return_value
-        assert created_message.text == scheduled_message.text
+        group_message = GroupMessage.objects.get(group=scheduled_message.group)
+        assert group_message.text == scheduled_message.text
 
         scheduled_message.refresh_from_db()
         assert scheduled_message.sent is True
 
-        serializer = GroupMessageSerializer(mock_message)
-        mock_channel_layer.group_send.assert_called_once_with(
+        serializer = GroupMessageSerializer([group_message], many=True)
+        lean_serializer = LeanGroupMessageSerializer([group_message], many=True)
+        assert mock_channel_layer.group_send.call_count == 2
+        mock_channel_layer.group_send.assert_any_call(
             f"group__{scheduled_message.group.id}",
-            {"type": "group_message", "text": serializer.data},
+            {"type": "group_messages", "room": f"group__{scheduled_message.group.id}", "messages": serializer.data},
+        )
+        mock_channel_layer.group_send.assert_any_call(
+            f"group__{scheduled_message.group.id}__lean",
+            {"type": "group_messages", "room": f"group__{scheduled_message.group.id}", "messages": lean_serializer.data},
+        )
+
+    @patch("group.tasks.get_channel_layer")
+    def test_send_group_scheduled_messages_batched_per_group(
+        self, mock_get_channel_layer, scheduled_message, group, user
+    ):
+        GroupScheduledMessage.objects.create(
+            group=group,
+            sender=user,
+            text="Second group message",
+            scheduled_time=timezone.now() - timezone.timedelta(seconds=30),
+            sent=False,
         )
+        mock_channel_layer = MagicMock()
+        mock_channel_layer.group_send = AsyncMock()
+        mock_get_channel_layer.return_value = mock_channel_layer
+
+        assert send_group_scheduled_message() == 2
+
+        assert GroupMessage.objects.filter(group=group).count() == 2
+        assert mock_channel_layer.group_send.call_count == 2
+        assert send_group_scheduled_message() == 0
 
     @patch("group.tasks.get_task_logger")
     def test_send_group_scheduled_message_no_messages(self, mock_get_task_logger):
@@ -65,3 +89,34 @@ class TestSendGroupScheduledMessageTask:
         send_group_scheduled_message()
 
         mock_logger.info.assert_not_called()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestGroupConsumerScheduleMessage:
+    @pytest.fixture
+    def channel_layer(self, settings):
+        settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+        return get_channel_layer()
+
+    async def test_schedule_message_saves_row(self, channel_layer, tokens, group_factory):
+        group = await database_sync_to_async(group_factory.create)()
+        access, _ = await database_sync_to_async(tokens)(group.owner)
+        communicator = WebsocketCommunicator(application, f"/ws/groups/{group.id}/?token={access}")
+        connected, _ = await communicator.connect()
+        assert connected
+
+        scheduled_time = timezone.now() + timezone.timedelta(minutes=5)
+        await communicator.send_json_to({
+            "action": "schedule_message",
+            "request_id": "1",
+            "data": {"text": "Keyinroq", "scheduled_time": scheduled_time.isoformat()},
+        })
+        await communicator.send_json_to({"action": "heartbeat", "request_id": "2"})
+        while (await communicator.receive_json_from(timeout=2)).get("action") != "heartbeat":
+            pass
+
+        scheduled = await database_sync_to_async(list)(GroupScheduledMessage.objects.filter(group=group))
+        assert [message.text for message in scheduled] == ["Keyinroq"]
+        assert str(scheduled[0].sender_id) == str(group.owner.id)
+        await communicator.disconnect()
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+from django.contrib.auth.hashers import make_password
+from rest_framework import status
+from rest_framework.exceptions import Throttled
+
+from share.hashing import PasswordHashService
+
+
+@pytest.fixture
+def hash_pool(settings):
+    settings.PASSWORD_HASH_WORKERS = 1
+    PasswordHashService.shutdown()
+    yield PasswordHashService
+    PasswordHashService.shutdown()
+
+
+def test_hashing_runs_in_another_process(hash_pool):
+    assert hash_pool.submit(os.getpid).result(timeout=30) != os.getpid()
+
+    encoded = hash_pool.make_password("valid-otp-secret")
+
+    assert hash_pool.check_password("valid-otp-secret", encoded) is True
+    assert hash_pool.check_password("invalid-password", encoded) is False
+    assert hash_pool.pending() == 0
+
+
+@pytest.mark.asyncio
+async def test_async_variants(hash_pool):
+    encoded = await hash_pool.amake_password("valid-otp-secret")
+
+    assert await hash_pool.acheck_password("valid-otp-secret", encoded) is True
+
+
+def test_full_queue_is_refused(settings):
+    settings.PASSWORD_HASH_WORKERS = 0
+    settings.PASSWORD_HASH_MAX_PENDING = 0
+
+    with pytest.raises(Throttled):
+        PasswordHashService.make_password("valid-otp-secret")
+    assert PasswordHashService.pending() == 0
+
+
+@pytest.mark.django_db
+def test_2fa_verify_degrades_with_429(settings, api_client, user_factory):
+    settings.PASSWORD_HASH_MAX_PENDING = 0
+    user = user_factory.create(is_2fa_enabled=True, otp_secret=make_password("valid-otp-secret"))
+
+    response = api_client().post(
+        "/api/users/2fa/verify/", {"user_id": user.id, "password": "valid-otp-secret"}, format="json"
+    )
+
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert "Retry-After" in response.headers
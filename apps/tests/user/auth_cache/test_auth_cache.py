@@ -0,0 +1,101 @@
+import time
+
+import pytest
+from django_redis import get_redis_connection
+from rest_framework import status
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from share.cache import AuthCache, LocalTTLCache
+from share.services import TokenService
+
+PROFILE_URL = "/api/users/profile/"
+LOGOUT_URL = "/api/users/logout/"
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture
+def listening():
+    AuthCache.start_listener()
+    assert AuthCache.listening.wait(2)
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalTTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_local_cache_entries_expire():
+    cache = LocalTTLCache(maxsize=10, ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.django_db
+def test_hot_token_skips_redis_and_database(mocker, listening, api_client, user_factory, tokens):
+    user = user_factory.create()
+    access, _ = tokens(user)
+    client = api_client(access)
+    is_token_revoked = mocker.spy(TokenService, "is_token_revoked")
+    get_user = mocker.spy(JWTAuthentication, "get_user")
+
+    for _ in range(3):
+        assert client.get(PROFILE_URL).status_code == status.HTTP_200_OK
+
+    assert is_token_revoked.call_count == 1
+    assert get_user.call_count == 1
+
+
+@pytest.mark.django_db
+def test_logout_invalidates_cached_token(listening, api_client, user_factory, tokens):
+    user = user_factory.create()
+    access, _ = tokens(user)
+    client = api_client(access)
+
+    assert client.get(PROFILE_URL).status_code == status.HTTP_200_OK
+    assert client.post(LOGOUT_URL).status_code == status.HTTP_200_OK
+
+    assert client.get(PROFILE_URL).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_invalidation_from_another_process(listening, user_factory):
+    user = user_factory.create()
+    AuthCache.remember_token(user.id, "jti-1")
+    AuthCache.remember_user(user)
+
+    get_redis_connection("default").publish(AuthCache.INVALIDATION_CHANNEL, str(user.id))
+
+    assert wait_until(lambda: AuthCache.is_token_valid(user.id, "jti-1") is None)
+    assert AuthCache.get_user(user.id) is None
+
+
+@pytest.mark.django_db
+def test_user_change_invalidates_cached_user(listening, user_factory):
+    user = user_factory.create()
+    AuthCache.remember_user(user)
+
+    user.last_login = None
+    user.save(update_fields=["last_login"])
+    assert AuthCache.get_user(user.id) is not None
+
+    user.is_active = False
+    user.save()
+    assert AuthCache.get_user(user.id) is None
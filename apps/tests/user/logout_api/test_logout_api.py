@@ -28,8 +28,8 @@ LOGOUT_URL = "/api/users/logout/"
 
 
 @pytest.mark.django_db
-@patch.object(TokenService, "add_token_to_redis")
-def test_logout(mock_add_token, api_client, user_factory, mocker, tokens):
+@patch.object(TokenService, "revoke_user_tokens")
+def test_logout(mock_revoke_user_tokens, api_client, user_factory, mocker, tokens):
     user = user_factory.create()
 
     mock_redis_client = MagicMock()
@@ -46,7 +46,8 @@ def test_logout(mock_add_token, api_client, user_factory, mocker, tokens):
 
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == {"detail": "Successfully logged out"}
-    assert mock_add_token.call_count == 2
+    mock_revoke_user_tokens.assert_called_once()
+    assert str(mock_revoke_user_tokens.call_args.args[0]) == str(user.id)
 
 @pytest.mark.django_db
 def test_logout_unauthenticated(api_client):
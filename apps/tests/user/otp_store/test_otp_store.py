@@ -0,0 +1,76 @@
+import pytest
+from django_redis import get_redis_connection
+from rest_framework.exceptions import ValidationError
+
+from share import utils
+from share.utils import check_otp, generate_otp, otp_keys
+
+PHONE_NUMBER = "+998900000123"
+
+
+@pytest.fixture(autouse=True)
+def clean_keys():
+    redis_client = get_redis_connection("default")
+    redis_client.delete(*otp_keys(PHONE_NUMBER))
+    yield redis_client
+    redis_client.delete(*otp_keys(PHONE_NUMBER))
+
+
+def test_issue_is_one_round_trip_and_stores_no_plain_code(mocker, clean_keys):
+    evaluate = mocker.spy(utils.redis_conn, "eval")
+
+    otp_code, otp_secret = generate_otp(PHONE_NUMBER, expire_in=60)
+
+    assert evaluate.call_count == 1
+    otp_key, secret_key = otp_keys(PHONE_NUMBER)
+    assert clean_keys.get(secret_key).decode() == otp_secret
+    stored = clean_keys.get(otp_key).decode()
+    assert otp_code not in stored and len(stored) == 64
+    assert 0 < clean_keys.ttl(otp_key) <= 60
+
+
+def test_rejected_issue_keeps_the_current_secret(clean_keys):
+    _, otp_secret = generate_otp(PHONE_NUMBER)
+
+    with pytest.raises(ValidationError):
+        generate_otp(PHONE_NUMBER)
+
+    assert clean_keys.get(otp_keys(PHONE_NUMBER)[1]).decode() == otp_secret
+
+
+def test_reissue_replaces_the_code():
+    first_code, first_secret = generate_otp(PHONE_NUMBER)
+    second_code, second_secret = generate_otp(PHONE_NUMBER, check_if_exists=False)
+
+    with pytest.raises(ValidationError):
+        check_otp(PHONE_NUMBER, first_code, first_secret)
+    check_otp(PHONE_NUMBER, second_code, second_secret)
+
+
+def test_code_can_only_be_used_once(clean_keys):
+    otp_code, otp_secret = generate_otp(PHONE_NUMBER)
+
+    with pytest.raises(ValidationError):
+        check_otp(PHONE_NUMBER, otp_code, "wrong-secret")
+    check_otp(PHONE_NUMBER, otp_code, otp_secret)
+
+    with pytest.raises(ValidationError):
+        check_otp(PHONE_NUMBER, otp_code, otp_secret)
+    assert clean_keys.exists(*otp_keys(PHONE_NUMBER)) == 0
+
+
+@pytest.mark.parametrize("ttl", [0, -1])
+def test_code_about_to_expire_is_not_reissued(clean_keys, ttl):
+    _, otp_secret = generate_otp(PHONE_NUMBER)
+    if ttl == -1:
+        clean_keys.persist(otp_keys(PHONE_NUMBER)[0])
+    else:
+        # Bir soniyadan kam qolgan: TTL 0 qaytaradi, lekin kod hali amalda
+        clean_keys.pexpire(otp_keys(PHONE_NUMBER)[0], 300)
+    assert clean_keys.ttl(otp_keys(PHONE_NUMBER)[0]) == ttl
+
+    with pytest.raises(ValidationError) as error:
+        generate_otp(PHONE_NUMBER)
+
+    assert "try again in 1 seconds" in str(error.value.detail)
+    assert clean_keys.get(otp_keys(PHONE_NUMBER)[1]).decode() == otp_secret
@@ -11,7 +11,7 @@ def signup_data(request, user_factory, mocker):
 
     def valid_data():
         redis_conn = mocker.Mock()
-        redis_conn.exists.return_value = False
+        redis_conn.eval.return_value = [1]
         redis_conn.get.return_value = b"123111"
         return 201, redis_conn, req_json
 
@@ -0,0 +1,105 @@
+import datetime
+import time
+from unittest import mock
+
+import pytest
+from django.conf import settings
+from django_redis import get_redis_connection
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from share.services import TokenService
+from user.services import UserService
+
+PROFILE_URL = "/api/users/profile/"
+LOGOUT_URL = "/api/users/logout/"
+REFRESH_URL = "/api/token/refresh/"
+
+
+@pytest.mark.django_db
+def test_logout_current_session_only(api_client, user_factory, tokens):
+    user = user_factory.create()
+    access, refresh = tokens(user)
+    other_access, _ = tokens(user)
+
+    response = api_client(access).post(LOGOUT_URL, {"all": False, "refresh": str(refresh)}, format="json")
+    assert response.status_code == status.HTTP_200_OK
+
+    assert api_client(access).get(PROFILE_URL).status_code == status.HTTP_401_UNAUTHORIZED
+    assert api_client().post(REFRESH_URL, {"refresh": str(refresh)}).status_code == status.HTTP_401_UNAUTHORIZED
+    assert api_client(other_access).get(PROFILE_URL).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_logout_everywhere(api_client, user_factory, tokens):
+    user = user_factory.create()
+    access, refresh = tokens(user)
+    other_access, other_refresh = tokens(user)
+
+    assert api_client(access).post(LOGOUT_URL).status_code == status.HTTP_200_OK
+
+    assert api_client(other_access).get(PROFILE_URL).status_code == status.HTTP_401_UNAUTHORIZED
+    response = api_client().post(REFRESH_URL, {"refresh": str(other_refresh)})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_tokens_issued_after_logout_are_valid(api_client, user_factory, tokens):
+    user = user_factory.create()
+    get_redis_connection("default").set(TokenService.revoked_before_key(user.id), TokenService.now_ms() - 10000)
+    access, refresh = tokens(user)
+
+    assert api_client(access).get(PROFILE_URL).status_code == status.HTTP_200_OK
+    assert api_client().post(REFRESH_URL, {"refresh": str(refresh)}).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_revocation_entries_expire_with_tokens(user_factory):
+    user = user_factory.create()
+    refresh = RefreshToken.for_user(user)
+    access = refresh.access_token
+    redis_client = get_redis_connection("default")
+
+    TokenService.revoke_token(access)
+    TokenService.revoke_user_tokens(user.id)
+
+    access_ttl = redis_client.ttl(TokenService.revoked_token_key(access["jti"]))
+    assert 0 < access_ttl <= settings.SIMPLE_JWT["ACCESS_TOKEN_LIFETIME"].total_seconds()
+    user_ttl = redis_client.ttl(TokenService.revoked_before_key(user.id))
+    assert 0 < user_ttl <= settings.SIMPLE_JWT["REFRESH_TOKEN_LIFETIME"].total_seconds()
+    assert TokenService.is_token_revoked(access)
+    assert TokenService.is_token_revoked(refresh)
+
+
+def token_issued_at(user, timestamp):
+    issued_at = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+    with mock.patch("rest_framework_simplejwt.tokens.aware_utcnow", return_value=issued_at):
+        return UserService.create_tokens(user)
+
+
+@pytest.mark.django_db
+def test_login_in_the_same_second_as_logout_everywhere(api_client, user_factory):
+    user = user_factory.create()
+    second = int(time.time()) - 1
+    before = token_issued_at(user, second + 0.2)
+    with mock.patch("share.services.time.time", return_value=second + 0.5):
+        TokenService.revoke_user_tokens(user.id)
+    after = token_issued_at(user, second + 0.7)
+
+    assert api_client(before["access"]).get(PROFILE_URL).status_code == status.HTTP_401_UNAUTHORIZED
+    assert api_client().post(REFRESH_URL, {"refresh": before["refresh"]}).status_code == status.HTTP_401_UNAUTHORIZED
+    assert api_client(after["access"]).get(PROFILE_URL).status_code == status.HTTP_200_OK
+    response = api_client().post(REFRESH_URL, {"refresh": after["refresh"]})
+    assert response.status_code == status.HTTP_200_OK
+    assert api_client(response.json()["access"]).get(PROFILE_URL).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_logout_everywhere_then_login_again(api_client, user_factory):
+    user = user_factory.create()
+    access = UserService.create_tokens(user)["access"]
+
+    assert api_client(access).post(LOGOUT_URL).status_code == status.HTTP_200_OK
+    access = UserService.create_tokens(user)["access"]
+
+    assert api_client(access).get(PROFILE_URL).status_code == status.HTTP_200_OK
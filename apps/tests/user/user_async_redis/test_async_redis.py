@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from share.async_redis import close_async_redis_connections, get_async_redis_connection
+from share.services import PresenceService, RosterService, TokenService
+from share.utils import acheck_otp, agenerate_otp
+
+
+def test_every_event_loop_gets_its_own_client():
+    async def clients():
+        try:
+            return get_async_redis_connection(), get_async_redis_connection()
+        finally:
+            await close_async_redis_connections()
+
+    first, same = asyncio.run(clients())
+    other, _ = asyncio.run(clients())
+
+    assert first is same
+    assert other is not first
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestAsyncRedisServices:
+    async def test_presence_matches_the_sync_api(self, user_factory):
+        user = await sync_to_async(user_factory.create)()
+
+        assert await PresenceService.aconnect(user.id, "tab-1") is True
+        assert await PresenceService.aconnect(user.id, "tab-2") is False
+        assert await sync_to_async(PresenceService.is_online)(user.id) is True
+        assert await PresenceService.adisconnect(user.id, "tab-1") is False
+        assert await PresenceService.adisconnect(user.id, "tab-2") is True
+
+        presence = await PresenceService.aget_presence(user.id)
+        assert presence["is_online"] is False
+        assert presence == await sync_to_async(PresenceService.get_presence)(user.id)
+        assert await PresenceService.aget_presence_many([user.id]) == {str(user.id): presence}
+
+    async def test_token_revocation(self, user_factory):
+        user = await sync_to_async(user_factory.create)()
+        access = (await sync_to_async(RefreshToken.for_user)(user)).access_token
+
+        assert await TokenService.ais_token_revoked(access) is False
+        await TokenService.arevoke_token(access)
+        assert await TokenService.ais_token_revoked(access) is True
+        assert await sync_to_async(TokenService.is_token_revoked)(access) is True
+
+    async def test_roster_changes(self, user_factory):
+        user = await sync_to_async(user_factory.create)()
+
+        assert await RosterService.arecord("chat__async", user.id, "join") is True
+        assert await RosterService.arecord("chat__async", user.id, "leave") is False
+        assert await RosterService.apop_changes("chat__async") == {"join": [], "leave": [str(user.id)]}
+
+    async def test_otp(self):
+        otp_code, secret = await agenerate_otp("+998900000099", check_if_exists=False)
+
+        with pytest.raises(ValidationError):
+            await agenerate_otp("+998900000099")
+        with pytest.raises(ValidationError):
+            await acheck_otp("+998900000099", "abcdef", secret)
+        await acheck_otp("+998900000099", otp_code, secret)
@@ -0,0 +1,110 @@
+import datetime
+
+import pytest
+from unittest.mock import MagicMock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from share.services import TokenService
+from user.models import DeviceInfo, User
+from user.services import DeviceActivityService
+from user.tasks import flush_device_activity_task
+
+
+@pytest.fixture
+def profile_client(mocker, tokens, api_client):
+    mocker.patch.object(TokenService, "get_redis_client", return_value=MagicMock())
+
+    def _profile_client(user):
+        access, _ = tokens(user)
+        return api_client(access)
+
+    return _profile_client
+
+
+@pytest.fixture(autouse=True)
+def empty_buffer():
+    keys = (DeviceActivityService.BUFFER_KEY, DeviceActivityService.PROCESSING_KEY)
+    DeviceActivityService.get_redis_client().delete(*keys)
+    yield
+    DeviceActivityService.get_redis_client().delete(*keys)
+
+
+@pytest.mark.django_db
+def test_request_writes_nothing_to_the_database(profile_client, user_factory):
+    user = user_factory.create()
+    client = profile_client(user)
+    client.get("/api/users/profile/")  # auth keshi isiydi
+
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get("/api/users/profile/", HTTP_USER_AGENT="Phone").status_code == 200
+
+    assert not [query for query in queries if not query["sql"].lstrip().upper().startswith("SELECT")]
+    assert not [query for query in queries if "device_info" in query["sql"]]
+
+
+def test_same_device_is_buffered_once():
+    assert DeviceActivityService.record("user-1", "10.0.0.1", "Phone") is True
+    assert DeviceActivityService.record("user-1", "10.0.0.1", "Phone") is False
+    assert DeviceActivityService.record("user-1", "10.0.0.2", "Phone") is True
+
+    assert len(DeviceActivityService.claim_activity()) == 2
+    DeviceActivityService.ack_activity()
+    assert DeviceActivityService.claim_activity() == []
+
+
+@pytest.mark.django_db
+def test_flush_creates_and_updates_devices_in_bulk(user_factory):
+    user, other = user_factory.create(), user_factory.create()
+    known = DeviceInfo.objects.create(user=user, device_name="Laptop", ip_address="10.0.0.1")
+    DeviceActivityService.record(user.id, "10.0.0.1", "Laptop")
+    DeviceActivityService.record(user.id, "10.0.0.2", "Phone")
+    DeviceActivityService.record(other.id, "10.0.0.3", "Tablet")
+    DeviceActivityService.record("00000000-0000-0000-0000-000000000000", "10.0.0.4", "Deleted user")
+
+    with CaptureQueriesContext(connection) as queries:
+        assert flush_device_activity_task() == 4
+
+    # foydalanuvchilar, qurilmalar, last_login, DeviceInfo update va insert
+    assert len(queries) <= 5
+    known.refresh_from_db()
+    assert known.last_login is not None
+    assert set(DeviceInfo.objects.values_list("ip_address", flat=True)) == {"10.0.0.1", "10.0.0.2", "10.0.0.3"}
+    user.refresh_from_db()
+    assert user.last_login >= datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(minutes=1)
+
+
+@pytest.mark.django_db
+def test_failed_flush_keeps_activity_for_the_next_run(mocker, user_factory, django_capture_on_commit_callbacks):
+    user = user_factory.create()
+    DeviceActivityService.record(user.id, "10.0.0.1", "Phone")
+    mocker.patch.object(DeviceActivityService, "save", side_effect=RuntimeError("db down"))
+
+    with pytest.raises(RuntimeError), django_capture_on_commit_callbacks(execute=True):
+        flush_device_activity_task()
+
+    # Qayta ishlash paytida kelgan yozuv yangi buferga tushadi
+    DeviceActivityService.record(user.id, "10.0.0.2", "Laptop")
+    mocker.stopall()
+    with django_capture_on_commit_callbacks(execute=True):
+        assert flush_device_activity_task() == 1
+    with django_capture_on_commit_callbacks(execute=True):
+        assert flush_device_activity_task() == 1
+
+    assert set(DeviceInfo.objects.values_list("ip_address", flat=True)) == {"10.0.0.1", "10.0.0.2"}
+    assert not DeviceActivityService.get_redis_client().exists(
+        DeviceActivityService.BUFFER_KEY, DeviceActivityService.PROCESSING_KEY
+    )
+
+
+@pytest.mark.django_db
+def test_flush_does_not_duplicate_devices_created_meanwhile(user_factory):
+    user = user_factory.create()
+    DeviceActivityService.record(user.id, "10.0.0.1", "Phone")
+    activity = DeviceActivityService.claim_activity()
+    DeviceInfo.objects.create(user=user, device_name="Phone", ip_address="10.0.0.1")
+
+    DeviceActivityService.save(activity, batch_size=500)
+
+    assert DeviceInfo.objects.filter(user=user).count() == 1
+    assert User.objects.get(id=user.id).last_login is not None
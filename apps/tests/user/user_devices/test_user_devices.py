@@ -3,6 +3,7 @@ from django.utils.timezone import now
 from unittest.mock import MagicMock
 from share.services import TokenService
 from user.models import DeviceInfo
+from user.tasks import flush_device_activity_task
 
 
 @pytest.mark.django_db
@@ -28,6 +29,9 @@ def test_track_login_activity_middleware(mocker, tokens, api_client, user_factor
     )
 
     assert response.status_code == 200
+    # Qurilma so'rov davomida emas, buferdan yoziladi
+    assert not DeviceInfo.objects.filter(user=user).exists()
+    flush_device_activity_task()
 
     device_info = DeviceInfo.objects.filter(
         user=user, ip_address="194.23.54.23"
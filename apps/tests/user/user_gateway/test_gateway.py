@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+
+from channel.models import Channel, ChannelMessage, ChannelType
+from channel.tasks import publish_channel_messages
+from chat.models import Chat, Message
+from core.asgi import application
+from group.models import GroupPermission
+from group.services import GroupAccessService
+
+
+@pytest.fixture
+def channel_layer(settings):
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    return get_channel_layer()
+
+
+@pytest.fixture(autouse=True)
+def clear_group_access_cache():
+    GroupAccessService.cache.clear()
+    yield
+    GroupAccessService.cache.clear()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestGatewayConsumer:
+    async def connect(self, user, tokens, version=1):
+        access, _ = await database_sync_to_async(tokens)(user)
+        communicator = WebsocketCommunicator(application, f"/ws/gateway/?token={access}&v={version}")
+        connected, _ = await communicator.connect()
+        assert connected
+        return communicator
+
+    async def request(self, communicator, action, request_id="1", **data):
+        await communicator.send_json_to({"action": action, "request_id": request_id, **data})
+        return await communicator.receive_json_from(timeout=2)
+
+    async def test_unauthenticated_is_rejected(self, channel_layer):
+        communicator = WebsocketCommunicator(application, "/ws/gateway/")
+        connected, _ = await communicator.connect()
+        assert not connected
+
+    async def test_subscribe_checks_access_per_room(self, channel_layer, tokens, user_factory, group_factory):
+        user = await database_sync_to_async(user_factory.create)()
+        peer = await database_sync_to_async(user_factory.create)()
+        stranger = await database_sync_to_async(user_factory.create)()
+        chat = await database_sync_to_async(Chat.objects.create)(owner=user, user=peer)
+        foreign_chat = await database_sync_to_async(Chat.objects.create)(owner=peer, user=stranger)
+        public_group = await database_sync_to_async(group_factory.create)(is_private=False)
+        private_group = await database_sync_to_async(group_factory.create)(is_private=True)
+        channel = await database_sync_to_async(Channel.objects.create)(
+            name="News", owner=peer, channel_type=ChannelType.PUBLIC.value
+        )
+        communicator = await self.connect(user, tokens)
+
+        rooms = [
+            {"kind": "chat", "id": str(chat.id)},
+            {"kind": "chat", "id": str(foreign_chat.id)},
+            {"kind": "group", "id": str(public_group.id)},
+            {"kind": "group", "id": str(private_group.id)},
+            {"kind": "channel", "id": str(channel.id)},
+        ]
+        response = await self.request(communicator, "subscribe", rooms=rooms)
+
+        assert response["response_status"] == 200
+        assert response["data"]["subscribed"] == [rooms[0], rooms[2], rooms[4]]
+        assert response["data"]["denied"] == [rooms[1], rooms[3]]
+
+        response = await self.request(communicator, "subscribe", rooms=[{"kind": "chat", "id": "not-a-uuid"}])
+        assert response["response_status"] == 400
+        await communicator.disconnect()
+
+    async def test_events_of_many_rooms_arrive_on_one_socket(self, channel_layer, tokens, user_factory, group_factory):
+        user = await database_sync_to_async(user_factory.create)()
+        peer = await database_sync_to_async(user_factory.create)()
+        chat = await database_sync_to_async(Chat.objects.create)(owner=user, user=peer)
+        group = await database_sync_to_async(group_factory.create)(owner=peer)
+        await database_sync_to_async(GroupPermission.objects.create)(group=group)
+        await database_sync_to_async(group.members.add)(user)
+        channel = await database_sync_to_async(Channel.objects.create)(name="News", owner=peer)
+        chat_room = {"kind": "chat", "id": str(chat.id)}
+        group_room = {"kind": "group", "id": str(group.id)}
+        channel_room = {"kind": "channel", "id": str(channel.id)}
+        communicator = await self.connect(user, tokens, version=2)
+        await self.request(communicator, "subscribe", rooms=[chat_room, group_room, channel_room])
+
+        response = await self.request(communicator, "create_message", room=chat_room, data={"text": "Salom"})
+        assert response["response_status"] == 201
+        frame = await communicator.receive_json_from(timeout=2)
+        assert frame["action"] == "new_message"
+        assert frame["room"] == chat_room
+        assert frame["data"]["text"] == "Salom"
+        assert frame["data"]["chat_id"] == str(chat.id)
+
+        response = await self.request(communicator, "create_message", room=group_room, data={"text": "Guruh"})
+        assert response["response_status"] == 201
+        frame = await communicator.receive_json_from(timeout=2)
+        assert frame["room"] == group_room
+        assert frame["data"]["group_id"] == str(group.id)
+
+        def create_channel_message():
+            message = ChannelMessage.objects.create(channel=channel, sender=peer, text="Yangilik")
+            publish_channel_messages([message])
+
+        await database_sync_to_async(create_channel_message)()
+        frame = await communicator.receive_json_from(timeout=2)
+        assert frame["room"] == channel_room
+        assert frame["data"]["text"] == "Yangilik"
+
+        await self.request(communicator, "unsubscribe", rooms=[chat_room])
+        await self.request(communicator, "create_message", room=group_room, data={"text": "Yana"})
+        await communicator.receive_json_from(timeout=2)
+        response = await self.request(communicator, "create_message", room=chat_room, data={"text": "Yopiq"})
+        assert response["response_status"] == 400
+        assert await communicator.receive_nothing(timeout=0.1)
+        await communicator.disconnect()
+
+    async def test_history_is_loaded_on_demand(self, channel_layer, tokens, user_factory):
+        user = await database_sync_to_async(user_factory.create)()
+        peer = await database_sync_to_async(user_factory.create)()
+        chat = await database_sync_to_async(Chat.objects.create)(owner=user, user=peer)
+        for index in range(3):
+            await database_sync_to_async(Message.objects.create)(chat=chat, sender=peer, text=f"message {index}")
+        room = {"kind": "chat", "id": str(chat.id)}
+        communicator = await self.connect(user, tokens)
+        # Ulanishda hech qanday tarix yuborilmaydi
+        assert await communicator.receive_nothing(timeout=0.1)
+
+        response = await self.request(communicator, "get_messages", room=room, limit=2)
+        assert response["response_status"] == 400
+
+        await self.request(communicator, "subscribe", rooms=[room])
+        response = await self.request(communicator, "get_messages", room=room, limit=2)
+        assert response["response_status"] == 200
+        assert [message["text"] for message in response["data"]["messages"]] == ["message 1", "message 2"]
+        assert response["data"]["has_more"] is True
+        await communicator.disconnect()
+
+    async def test_losing_group_access_unsubscribes(self, channel_layer, tokens, user_factory, group_factory):
+        user = await database_sync_to_async(user_factory.create)()
+        group = await database_sync_to_async(group_factory.create)(is_private=True)
+        await database_sync_to_async(group.members.add)(user)
+        room = {"kind": "group", "id": str(group.id)}
+        communicator = await self.connect(user, tokens)
+        await self.request(communicator, "subscribe", rooms=[room])
+
+        # group.signals a'zolik o'zgarishini gateway ulanishlariga yetkazadi
+        await database_sync_to_async(group.members.remove)(user)
+
+        frame = await communicator.receive_json_from(timeout=2)
+        assert frame == {"action": "unsubscribed", "room": room}
+        await asyncio.sleep(0.01)
+        await communicator.disconnect()
@@ -0,0 +1,153 @@
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from rest_framework import status
+
+from core.asgi import application
+from share.broadcast import presence_group_name
+from share.services import TokenService, PresenceService
+from user.tasks import expire_presence_task
+
+
+@pytest.fixture
+def channel_layer(settings):
+    """Override the channel layer to use an in-memory channel layer for testing."""
+    settings.CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+    settings.PRESENCE_DIFF_WINDOW = 0.05
+    return get_channel_layer()
+
+
+@pytest.mark.django_db
+def test_bulk_presence_mixes_redis_and_database(mocker, tokens, user_factory, api_client):
+    last_seen_time = datetime(2024, 10, 28, 12, 0, tzinfo=timezone.utc)
+    requester = user_factory.create()
+    online = user_factory.create()
+    stored = user_factory.create(is_online=False, last_seen=last_seen_time)
+    PresenceService.connect(online.id, "tab")
+
+    mock_redis_client = MagicMock()
+    mocker.patch.object(TokenService, "get_redis_client", return_value=mock_redis_client)
+    access, _ = tokens(requester)
+    mock_redis_client.smembers.return_value = {access.encode()}
+
+    response = api_client(access).post(
+        "/api/users/status/",
+        {"user_ids": [str(online.id), str(stored.id)]},
+        format="json",
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data[str(online.id)]["is_online"] is True
+    assert response.data[str(stored.id)] == {"is_online": False, "last_seen": last_seen_time}
+
+
+@pytest.mark.django_db
+def test_bulk_presence_rejects_too_many_ids(mocker, tokens, user_factory, api_client, settings):
+    requester = user_factory.create()
+    mock_redis_client = MagicMock()
+    mocker.patch.object(TokenService, "get_redis_client", return_value=mock_redis_client)
+    access, _ = tokens(requester)
+    mock_redis_client.smembers.return_value = {access.encode()}
+
+    user_ids = [str(requester.id)] * 501
+    response = api_client(access).post("/api/users/status/", {"user_ids": user_ids}, format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_http_request_then_socket_publishes_online(mocker, tokens, user_factory, api_client, channel_layer):
+    user = user_factory.create()
+    mocker.patch.object(TokenService, "get_redis_client", return_value=MagicMock())
+    access, _ = tokens(user)
+    watcher = async_to_sync(channel_layer.new_channel)()
+    async_to_sync(channel_layer.group_add)(presence_group_name(user.id), watcher)
+
+    # Ilova avval REST API ga murojaat qiladi, keyin WebSocket ochadi
+    assert api_client(access).get("/api/users/profile/").status_code == status.HTTP_200_OK
+    event = async_to_sync(channel_layer.receive)(watcher)
+    assert event["type"] == "presence_changed"
+    assert event["user_id"] == str(user.id)
+    assert event["is_online"] is True
+
+    # HTTP ulanishi hali tirik: socket na onlayn, na oflayn o'tishi emas
+    assert PresenceService.connect(user.id, "socket") is False
+    assert PresenceService.disconnect(user.id, "socket") is False
+    assert PresenceService.is_online(user.id)
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestPresenceSubscription:
+    def token_payload(self, user_id):
+        return {
+            "user_id": str(user_id),
+            "exp": datetime.utcnow() + timedelta(minutes=10),
+        }
+
+    @patch("share.middleware.jwt.decode")
+    async def test_coalesced_diffs(self, mock_jwt_decode, user_factory, channel_layer):
+        watcher = await database_sync_to_async(user_factory.create)()
+        contact = await database_sync_to_async(user_factory.create)()
+        mock_jwt_decode.return_value = self.token_payload(watcher.id)
+
+        communicator = WebsocketCommunicator(application, "/ws/presence/?token=watcher")
+        connected, _ = await communicator.connect()
+        assert connected
+
+        await communicator.send_json_to(
+            {"action": "subscribe", "request_id": "1", "user_ids": [str(contact.id)]}
+        )
+        snapshot = await communicator.receive_json_from()
+        assert snapshot["data"]["presence"][str(contact.id)]["is_online"] is False
+
+        # Oyna ichidagi online -> offline -> online bitta o'zgarishga aylanadi
+        for is_online in (True, False, True):
+            await channel_layer.group_send(
+                f"presence__{contact.id}",
+                {"type": "presence_changed", "user_id": str(contact.id),
+                 "is_online": is_online, "last_seen": None},
+            )
+        diff = await communicator.receive_json_from(timeout=1)
+        assert diff == {
+            "action": "presence",
+            "changes": {str(contact.id): {"is_online": True, "last_seen": None}},
+        }
+        assert await communicator.receive_nothing(timeout=0.2)
+        await communicator.disconnect()
+
+    @patch("share.middleware.jwt.decode")
+    async def test_crashed_connection_is_published_offline(self, mock_jwt_decode, user_factory, channel_layer):
+        watcher = await database_sync_to_async(user_factory.create)()
+        contact = await database_sync_to_async(user_factory.create)()
+        mock_jwt_decode.return_value = self.token_payload(watcher.id)
+        await PresenceService.aconnect(contact.id, "crashed-worker")
+
+        communicator = WebsocketCommunicator(application, "/ws/presence/?token=watcher")
+        connected, _ = await communicator.connect()
+        assert connected
+        await communicator.send_json_to(
+            {"action": "subscribe", "request_id": "1", "user_ids": [str(contact.id)]}
+        )
+        snapshot = await communicator.receive_json_from()
+        assert snapshot["data"]["presence"][str(contact.id)]["is_online"] is True
+
+        # Worker disconnect'siz qulagan: ulanish muddati o'tadi, sweep oflayn holatni e'lon qiladi
+        redis_client = PresenceService.aget_redis_client()
+        await redis_client.zadd(PresenceService.connections_key(contact.id), {"crashed-worker": time.time() - 1})
+        await redis_client.zadd(PresenceService.EXPIRY_KEY, {str(contact.id): time.time() - 1})
+        assert await database_sync_to_async(expire_presence_task)() == 1
+
+        diff = await communicator.receive_json_from(timeout=1)
+        assert diff["action"] == "presence"
+        assert diff["changes"][str(contact.id)]["is_online"] is False
+        await communicator.disconnect()
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from share.consumers import PresenceConsumerMixin
+from share.services import PresenceService
+from user.models import User
+from user.tasks import expire_presence_task, flush_presence_task
+
+
+def expire_connection(user_id, connection_id):
+    """Ulanishni worker qulagandagidek (disconnect'siz) muddati o'tgan qilish"""
+    redis_client = PresenceService.get_redis_client()
+    redis_client.zadd(PresenceService.connections_key(user_id), {connection_id: time.time() - 1})
+    redis_client.zadd(PresenceService.EXPIRY_KEY, {str(user_id): time.time() - 1})
+
+
+@pytest.mark.django_db
+class TestPresenceService:
+    def test_user_stays_online_until_last_connection_closes(self, user_factory):
+        user = user_factory.create()
+
+        PresenceService.connect(user.id, "tab-1")
+        PresenceService.connect(user.id, "tab-2")
+        PresenceService.disconnect(user.id, "tab-1")
+        assert PresenceService.is_online(user.id) is True
+
+        PresenceService.disconnect(user.id, "tab-2")
+        presence = PresenceService.get_presence(user.id)
+        assert presence["is_online"] is False
+        assert presence["last_seen"] is not None
+
+    def test_expired_connection_is_offline(self, user_factory):
+        user = user_factory.create()
+        PresenceService.connect(user.id, "dead-worker")
+        # Heartbeat muddati o'tgan ulanish hisoblanmaydi
+        PresenceService.get_redis_client().zadd(
+            PresenceService.connections_key(user.id), {"dead-worker": time.time() - 1}
+        )
+        assert PresenceService.is_online(user.id) is False
+
+    def test_unknown_user_has_no_presence(self, user_factory):
+        user = user_factory.create()
+        assert PresenceService.get_presence(user.id) is None
+
+    def test_flush_writes_presence_in_batch(self, user_factory, django_assert_max_num_queries):
+        online, offline = user_factory.create(is_online=False), user_factory.create(is_online=True)
+        PresenceService.connect(online.id, "tab")
+        PresenceService.connect(offline.id, "tab")
+        PresenceService.disconnect(offline.id, "tab")
+
+        with django_assert_max_num_queries(3):
+            flush_presence_task()
+
+        online.refresh_from_db()
+        offline.refresh_from_db()
+        assert online.is_online is True
+        assert offline.is_online is False
+        assert offline.last_seen is not None
+        assert PresenceService.pop_dirty(10) == []
+
+    def test_expired_connections_are_swept_offline(self, user_factory):
+        crashed, closed, online = user_factory.create_batch(3)
+        for user in (crashed, closed, online):
+            PresenceService.connect(user.id, "tab")
+        PresenceService.disconnect(closed.id, "tab")
+        flush_presence_task()
+        expire_connection(crashed.id, "tab")
+
+        assert expire_presence_task() == 1
+        flush_presence_task()
+
+        crashed.refresh_from_db()
+        online.refresh_from_db()
+        assert crashed.is_online is False
+        assert online.is_online is True
+        assert expire_presence_task() == 0
+
+    def test_failed_flush_keeps_users_dirty(self, user_factory, mocker):
+        user = user_factory.create()
+        PresenceService.connect(user.id, "tab")
+        mocker.patch.object(User.objects, "bulk_update", side_effect=RuntimeError("db down"))
+
+        with pytest.raises(RuntimeError):
+            flush_presence_task()
+
+        assert [state["user_id"] for state in PresenceService.pop_dirty(10)] == [str(user.id)]
+
+
+class PresenceProbe(PresenceConsumerMixin):
+    def __init__(self, user):
+        self.user = user
+        self.channel_name = "probe"
+        self.channel_layer = AsyncMock()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_idle_connection_is_refreshed_by_the_server(user_factory, settings):
+    settings.PRESENCE_TTL = 1
+    user = await asyncio.to_thread(user_factory.create)
+    probe = PresenceProbe(user)
+    key = PresenceService.connections_key(user.id)
+
+    await probe.update_user_status(is_online=True)
+    first_expiry = await PresenceService.aget_redis_client().zscore(key, "probe")
+    await asyncio.sleep(1.5)
+
+    assert await PresenceService.ais_online(user.id) is True
+    assert await PresenceService.aget_redis_client().zscore(key, "probe") > first_expiry
+
+    task = probe.presence_task
+    await probe.update_user_status(is_online=False)
+    await asyncio.sleep(0)
+    assert task.cancelled() and probe.presence_task is None
@@ -8,9 +8,10 @@ from rest_framework import authentication
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.request import Request
 from rest_framework_simplejwt.authentication import JWTAuthentication,AuthUser,Token
+from rest_framework_simplejwt.settings import api_settings
 from core.settings import config
 from user.models import User
-from share.enums import TokenType
+from share.cache import AuthCache
 from share.services import TokenService
 
 class XApiKeyAuthentication(authentication.BaseAuthentication):
@@ -35,14 +36,23 @@ class CustomJWTAuthentication(JWTAuthentication):
         return user, access_token
 
     def is_valid_access_token(self,path: str, user: User, access_token: Token)-> bool:
-        valid_access_tokens = TokenService.get_valid_tokens(user_id=user.id,token_type=TokenType.ACCESS)
-        if (
-            valid_access_tokens
-            and str(access_token).encode() not in valid_access_tokens
-        ):
+        # Takrorlanadigan so'rovlarda qaror jarayon ichidagi keshdan olinadi (Redis'ga bormaydi)
+        jti = access_token.get(api_settings.JTI_CLAIM)
+        if AuthCache.is_token_valid(user.id,jti):
+            return True
+        if TokenService.is_token_revoked(access_token):
             raise AuthenticationFailed(_("Could not validate credentials"))
+        AuthCache.remember_token(user.id,jti)
         return True
 
+    def get_user(self, validated_token: Token) -> AuthUser:
+        """Foydalanuvchi obyekti keshda bo'lsa bazaga so'rov yuborilmaydi"""
+        user = AuthCache.get_user(validated_token.get(api_settings.USER_ID_CLAIM))
+        if user is None:
+            user = super().get_user(validated_token)
+            AuthCache.remember_user(user)
+        return user
+
 class CustomBasicAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         auth_header = request.headers.get('Authorization')
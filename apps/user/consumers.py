@@ -0,0 +1,282 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from djangochannelsrestframework.generics import GenericAsyncAPIConsumer
+from djangochannelsrestframework.observer.generics import action
+from rest_framework.exceptions import ValidationError
+
+from chat.models import Chat, Message
+from group.models import Group, GroupMessage
+from group.services import GroupAccessService
+from group.tasks import fan_out_group_message
+from share.broadcast import get_protocol_version, group_send_many, lean_group_name, presence_group_name, protocol_group_name
+from share.consumers import PresenceConsumerMixin
+from share.gateway import GatewayService, parse_room_name, room_name
+from user.models import User
+from user.serializers import BulkPresenceRequestSerializer, UserPresenceResponseSerializer
+from user.services import UserService
+
+
+# PresenceConsumer kuzatilayotgan foydalanuvchilarning onlayn/oflayn o'zgarishlarini yuboradi.
+# O'zgarishlar qisqa oyna (PRESENCE_DIFF_WINDOW) davomida yig'ilib, bitta xabar bilan jo'natiladi.
+class PresenceConsumer(GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
+    queryset = User.objects.all()
+    serializer_class = UserPresenceResponseSerializer
+
+    async def connect(self):
+        self.user = self.scope.get("user",AnonymousUser())
+        if not self.user.is_authenticated:
+            return await self.close()
+        self.watched = set() #Kuzatilayotgan foydalanuvchilar
+        self.pending = {} #Hali yuborilmagan o'zgarishlar
+        self.last_sent = {} #Mijozga oxirgi yuborilgan holat
+        self.flush_handle = None
+        await self.accept()
+
+    async def disconnect(self, code):
+        if getattr(self,"flush_handle",None):
+            self.flush_handle.cancel()
+        for user_id in getattr(self,"watched",set()):
+            await self.channel_layer.group_discard(presence_group_name(user_id),self.channel_name)
+        await super().disconnect(code)
+
+    @action()
+    async def subscribe(self,user_ids,**kwargs):
+        """Foydalanuvchilarni kuzatishga qo'shish va ularning joriy holatini qaytarish"""
+        serializer = BulkPresenceRequestSerializer(data={"user_ids":user_ids})
+        if not serializer.is_valid():
+            return {"errors":serializer.errors},400
+        user_ids = {str(user_id) for user_id in serializer.validated_data["user_ids"]}
+        if len(self.watched | user_ids) > settings.PRESENCE_BULK_MAX_USERS:
+            return {"errors":[f"At most {settings.PRESENCE_BULK_MAX_USERS} users can be watched."]},400
+
+        for user_id in user_ids-self.watched:
+            await self.channel_layer.group_add(presence_group_name(user_id),self.channel_name)
+        self.watched |= user_ids
+
+        presence = await self.get_presence(list(user_ids))
+        for user_id,state in presence.items():
+            self.last_sent[user_id] = state["is_online"]
+        return {"presence":presence},200
+
+    @action()
+    async def unsubscribe(self,user_ids,**kwargs):
+        user_ids = {str(user_id) for user_id in user_ids} & self.watched
+        for user_id in user_ids:
+            await self.channel_layer.group_discard(presence_group_name(user_id),self.channel_name)
+            self.pending.pop(user_id,None)
+            self.last_sent.pop(user_id,None)
+        self.watched -= user_ids
+        return {"watched":len(self.watched)},200
+
+    @database_sync_to_async
+    def get_presence(self,user_ids):
+        presence = UserService.get_presence_many(user_ids)
+        return {
+            user_id:UserPresenceResponseSerializer(state).data
+            for user_id,state in presence.items()
+        }
+
+    async def presence_changed(self,event):
+        """Channel layer'dan kelgan o'zgarishni navbatga qo'yish"""
+        if event["user_id"] not in self.watched:
+            return
+        self.pending[event["user_id"]] = {
+            "is_online":event["is_online"],
+            "last_seen":event["last_seen"],
+        }
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.ensure_future(self.flush_changes())
+
+    async def flush_changes(self):
+        """Oyna ichida yig'ilgan o'zgarishlardan faqat haqiqiy farqlarni yuborish"""
+        await asyncio.sleep(settings.PRESENCE_DIFF_WINDOW)
+        self.flush_handle = None
+        pending,self.pending = self.pending,{}
+        changes = {
+            user_id:state for user_id,state in pending.items()
+            if self.last_sent.get(user_id) != state["is_online"]
+        }
+        if not changes:
+            return
+        for user_id,state in changes.items():
+            self.last_sent[user_id] = state["is_online"]
+        await self.send_json({"action":"presence","changes":changes})
+
+
+# GatewayConsumer foydalanuvchining barcha chat, guruh va kanallarini bitta ulanishda olib yuradi.
+# Ulanishda bazaga murojaat yo'q: xonalar subscribe/unsubscribe orqali qo'shiladi, channel layer
+# guruhlariga faqat kerak bo'lganda (dangasa) a'zo bo'linadi, tarix esa get_messages bilan so'raladi.
+# Hodisalar xona konsumerlari bilan bir xil guruhlardan keladi va {"room":{"kind","id"}} bilan belgilanadi.
+class GatewayConsumer(PresenceConsumerMixin,GenericAsyncAPIConsumer,AsyncJsonWebsocketConsumer):
+    queryset = User.objects.all()
+
+    async def connect(self):
+        self.user = self.scope.get("user",AnonymousUser())
+        if not self.user.is_authenticated:
+            return await self.close()
+        self.protocol_version = get_protocol_version(self.scope) #?v=2 bo'lsa lean format
+        self.rooms = set() #Obuna bo'lingan xonalar (channel layer guruh nomlari)
+        await self.accept()
+        await self.update_user_status(is_online=True)
+
+    async def disconnect(self, code):
+        for room in getattr(self,"rooms",set()):
+            await self.channel_layer.group_discard(self.get_group_name(room),self.channel_name)
+        if hasattr(self,"rooms"):
+            await self.update_user_status(is_online=False)
+        await super().disconnect(code)
+
+    def get_group_name(self,room:str)->str:
+        return protocol_group_name(room,self.protocol_version)
+
+    @action()
+    async def subscribe(self,rooms,**kwargs):
+        """Xonalarga obuna bo'lish: ruxsat barcha xonalar uchun bitta thread hop'da tekshiriladi"""
+        try:
+            requested = GatewayService.parse_rooms(rooms)
+        except ValidationError as e:
+            return {"errors":e.detail},400
+        new_rooms = [(kind,room_id) for kind,room_id in requested if room_name(kind,room_id) not in self.rooms]
+        if len(self.rooms)+len(new_rooms) > GatewayService.get_max_rooms():
+            return {"errors":[f"At most {GatewayService.get_max_rooms()} rooms can be subscribed."]},400
+
+        allowed = await database_sync_to_async(GatewayService.get_allowed_rooms)(self.user,new_rooms) if new_rooms else set()
+        for kind,room_id in new_rooms:
+            if (kind,room_id) in allowed:
+                room = room_name(kind,room_id)
+                await self.channel_layer.group_add(self.get_group_name(room),self.channel_name)
+                self.rooms.add(room)
+        return {
+            "subscribed":[{"kind":kind,"id":room_id} for kind,room_id in requested if room_name(kind,room_id) in self.rooms],
+            "denied":[{"kind":kind,"id":room_id} for kind,room_id in new_rooms if (kind,room_id) not in allowed],
+        },200
+
+    @action()
+    async def unsubscribe(self,rooms,**kwargs):
+        try:
+            requested = GatewayService.parse_rooms(rooms)
+        except ValidationError as e:
+            return {"errors":e.detail},400
+        for kind,room_id in requested:
+            await self.leave_room(room_name(kind,room_id))
+        return {"rooms":len(self.rooms)},200
+
+    async def leave_room(self,room:str):
+        if room in self.rooms:
+            self.rooms.discard(room)
+            await self.channel_layer.group_discard(self.get_group_name(room),self.channel_name)
+
+    def get_subscribed_room(self,room)->tuple[str,str]:
+        """Frame'dagi xonani tekshirish: faqat obuna bo'lingan xonalar bilan ishlanadi"""
+        kind,room_id = GatewayService.parse_rooms([room])[0]
+        if room_name(kind,room_id) not in self.rooms:
+            raise ValidationError({"room":["Subscribe to the room first."]})
+        return kind,room_id
+
+    @action()
+    async def get_messages(self,room,before=None,after=None,limit=None,**kwargs):
+        """Xonadagi habarlarning bitta sahifasi (before/after - kursorlar)"""
+        try:
+            kind,room_id = self.get_subscribed_room(room)
+            page = await database_sync_to_async(GatewayService.get_history)(
+                kind,room_id,self.user,self.protocol_version,before=before,after=after,limit=limit
+            )
+        except ValidationError as e:
+            return {"errors":e.detail},400
+        return {"room":{"kind":kind,"id":room_id},**page},200
+
+    @action()
+    async def create_message(self,room,data,**kwargs):
+        """Chat yoki guruhga habar yuborish (kanallarga habar REST orqali yuboriladi)"""
+        try:
+            kind,room_id = self.get_subscribed_room(room)
+        except ValidationError as e:
+            return {"errors":e.detail},400
+        if kind=="channel":
+            return {"errors":["Channel messages are created over the REST API."]},400
+        if kind=="group":
+            access = await database_sync_to_async(GroupAccessService.get_access)(room_id,self.user.id) or {}
+            if not access.get("is_member"):
+                return {"errors":["You are not a member of this group. Please join first."]},403
+            if not access.get("can_send_messages"):
+                return {"errors":["Sizning habar yuborish huquqingiz yo'q."]},403
+
+        message,versions = await self.save_message(kind,room_id,data)
+        group_name = room_name(kind,room_id)
+        event_type = f"{kind}_message"
+        await group_send_many(self.channel_layer,[
+            (group_name,{"type":event_type,"room":group_name,"text":versions[0]}),
+            (lean_group_name(group_name),{"type":event_type,"room":group_name,"text":versions[1]}),
+        ])
+        if kind=="group":
+            await sync_to_async(fan_out_group_message.delay)(str(message.id))
+        return {"id":str(message.id)},201
+
+    @database_sync_to_async
+    def save_message(self,kind,room_id,data):
+        valid_keys = {"text","image","file"}
+        message_data = {key:data.get(key) for key in valid_keys if data.get(key)}
+        if kind=="chat":
+            chat = Chat.objects.select_related("owner","user").get(pk=room_id)
+            message = Message.objects.create(chat=chat,sender=self.user,**message_data)
+        else:
+            group = Group.objects.select_related("owner").get(pk=room_id)
+            message = GroupMessage.objects.create(group=group,sender=self.user,**message_data)
+        # Yangi habarda like yo'q: seriyalashda qo'shimcha so'rovlar shart emas
+        message.likes_count = 0
+        message._prefetched_objects_cache = {"liked_by":User.objects.none()}
+        return message,GatewayService.serialize_message_versions(kind,message)
+
+    async def relay(self,event,action_name,data):
+        """Xona hodisasini mijozga xona belgisi bilan yuborish"""
+        room = event.get("room")
+        if room not in self.rooms:
+            return
+        await self.send_json({"action":action_name,"room":parse_room_name(room),"data":data})
+
+    async def chat_message(self,event):
+        await self.relay(event,"new_message",event["text"])
+
+    async def chat_messages(self,event):
+        for message in event["messages"]:
+            await self.relay(event,"new_message",message)
+
+    async def group_message(self,event):
+        await self.relay(event,"new_message",event["text"])
+
+    async def group_messages(self,event):
+        for message in event["messages"]:
+            await self.relay(event,"new_message",message)
+
+    async def channel_messages(self,event):
+        for message in event["messages"]:
+            await self.relay(event,"new_message",message)
+
+    async def message_liked(self,event):
+        await self.relay(event,"message_liked",event["message"])
+
+    async def message_unliked(self,event):
+        await self.relay(event,"message_unliked",event["message"])
+
+    async def participants_changed(self,event):
+        user_id = str(self.user.id)
+        joined = [user for user in event["joined"] if user["id"]!=user_id]
+        left = [left_id for left_id in event["left"] if left_id!=user_id]
+        if joined or left:
+            await self.relay(event,"participants_changed",{"joined":joined,"left":left})
+
+    async def group_access_changed(self,event):
+        """Guruh a'zoligi yoki huquqlari o'zgardi: ruxsat qolmagan bo'lsa obunani bekor qilish"""
+        GroupAccessService.forget_group(event["group_id"])
+        room = event.get("room")
+        if room not in self.rooms:
+            return
+        allowed = await database_sync_to_async(GatewayService.get_allowed_rooms)(self.user,[("group",event["group_id"])])
+        if not allowed:
+            await self.leave_room(room)
+            await self.send_json({"action":"unsubscribed","room":parse_room_name(room)})
@@ -1,10 +1,16 @@
-from user.models import DeviceInfo
-from django.utils import timezone
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from share.broadcast import presence_event, presence_group_name
+from share.services import PresenceService
+from user.services import DeviceActivityService
 
 
 class TrackLoginActivityMiddleware:
     """
     Middleware to track the login IP address and device information of users.
+    Nothing is written to the database here: activity is buffered in Redis and
+    saved in batches by flush_device_activity_task.
     """
     def __init__(self,get_response):
         self.get_response = get_response
@@ -12,22 +18,17 @@ class TrackLoginActivityMiddleware:
     def __call__(self, request):
         response = self.get_response(request)
         if request.user.is_authenticated:
-            ip_address = self.get_client_ip(request)
-            user_agent = request.headers.get("user-agent","unknown device")
-            request.user.is_online = True
-            request.user.last_seen = timezone.now()
-            request.user.last_login = timezone.now()
-            request.user.save(update_fields=["is_online","last_seen","last_login"])
-
-            if not DeviceInfo.objects.filter(
-                user=request.user,ip_address=ip_address
-            ).exists():
-                DeviceInfo.objects.create(
-                    user=request.user,
-                    device_name=user_agent,
-                    ip_address=ip_address,
-                    last_login=timezone.now()
+            # is_online/last_seen Redis'da saqlanadi, bazaga flush_presence_task yozadi.
+            # HTTP faollik ham ulanish sifatida sanaladi: foydalanuvchi shu so'rov bilan onlayn bo'lsa
+            # obunachilarga shu yerda xabar beriladi (keyingi WebSocket ulanishi holatni o'zgartirmaydi)
+            if PresenceService.touch(request.user.id):
+                async_to_sync(get_channel_layer().group_send)(
+                    presence_group_name(request.user.id),presence_event(request.user.id,True)
                 )
+            # last_login va qurilmalar flush_device_activity_task orqali yoziladi
+            DeviceActivityService.record(
+                request.user.id,self.get_client_ip(request),request.headers.get("user-agent","unknown device")
+            )
         return response
 
     def get_client_ip(self,request):
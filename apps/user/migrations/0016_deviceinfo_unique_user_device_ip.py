@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+def remove_duplicate_devices(apps, schema_editor):
+    """Keep the first device of every (user, ip_address), like the old middleware did"""
+    DeviceInfo = apps.get_model('user', 'DeviceInfo')
+    seen = set()
+    duplicates = []
+    for device_id, user_id, ip_address in DeviceInfo.objects.order_by('created_at').values_list(
+        'id', 'user_id', 'ip_address'
+    ).iterator():
+        if (user_id, ip_address) in seen:
+            duplicates.append(device_id)
+        else:
+            seen.add((user_id, ip_address))
+    for start in range(0, len(duplicates), 500):
+        DeviceInfo.objects.filter(id__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0015_alter_notificationpreference_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_devices, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='deviceinfo',
+            constraint=models.UniqueConstraint(fields=('user', 'ip_address'), name='unique_user_device_ip'),
+        ),
+    ]
@@ -65,6 +65,10 @@ class DeviceInfo(models.Model):
         verbose_name = 'Device Info'
         verbose_name_plural = 'Devices Info'
         ordering = ['-created_at']
+        constraints = [
+            # Buferdan yozishda bulk_create(ignore_conflicts=True) takror qurilma yaratmaydi
+            models.UniqueConstraint(fields=['user','ip_address'],name='unique_user_device_ip'),
+        ]
 
     def __str__(self):
         return f"User:{self.user} Device:{self.device_name}"
@@ -1,5 +1,6 @@
 import re
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import check_password
 from django.core.validators import MinLengthValidator
@@ -7,7 +8,11 @@ from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from rest_framework.generics import get_object_or_404
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from share.tokens import RefreshToken
 
+from share.services import TokenService
 from share.tasks import send_email_task, send_sms_task
 from share.utils import generate_otp, check_otp
 from user.models import UserAvatar, DeviceInfo, Contact, NotificationPreference
@@ -54,7 +59,7 @@ class VerifyOTPSerializer(serializers.Serializer):
         check_otp(phone_number, otp_code, otp_secret)
         user = get_object_or_404(User, phone_number=phone_number)
         user.is_verified = True
-        user.save()
+        user.save(update_fields=["is_verified","updated_at"])
         return user
 
 class LoginSerializer(serializers.Serializer):
@@ -162,8 +167,37 @@ class UserPresenceResponseSerializer(serializers.ModelSerializer):
         model = User
         fields = ['is_online','last_seen']
 
+class BulkPresenceRequestSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=getattr(settings,"PRESENCE_BULK_MAX_USERS",500)
+    )
+
 class NotificationPreferenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = NotificationPreference
         fields = ['id','notifications_enabled','device_token']
-        read_only_fields = ['id']
\ No newline at end of file
+        read_only_fields = ['id']
+class LogoutSerializer(serializers.Serializer):
+    all = serializers.BooleanField(default=True)
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self,refresh):
+        try:
+            return RefreshToken(refresh)
+        except TokenError:
+            raise ValidationError(_("Invalid refresh token"))
+
+class MillisecondTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Tokenlar iat_ms bilan chiqariladi, shunda logout bilan bir soniyada olingan token ham ishlaydi"""
+    token_class = RefreshToken
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Bekor qilingan (logout) refresh token bilan yangi access token olib bo'lmaydi"""
+    token_class = RefreshToken
+
+    def validate(self,attrs):
+        if TokenService.is_token_revoked(self.token_class(attrs["refresh"])):
+            raise InvalidToken(_("Token is revoked"))
+        return super().validate(attrs)
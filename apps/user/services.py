@@ -1,13 +1,30 @@
+import datetime
+import json
+import time
 from typing import Union
+from redis import Redis
 from rest_framework.exceptions import ValidationError
 from django.conf import settings
 from django.contrib.auth import authenticate
 from django.utils import timezone
-from rest_framework_simplejwt.tokens import RefreshToken
+from django_redis import get_redis_connection
+from share.tokens import RefreshToken
 
-from share.enums import TokenType
-from share.services import TokenService
-from user.models import User
+from share.cache import LocalTTLCache
+from share.services import PresenceService
+from user.models import User, DeviceInfo
+
+# Buferni qayta ishlash kalitiga ko'chirish (RENAME). Oldingi flush yiqilib qolgan
+# yozuvlar bo'lsa, avval o'sha qayta ishlanadi
+CLAIM_ACTIVITY_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
 
 class UserService:
     @classmethod
@@ -25,24 +42,116 @@ class UserService:
             refresh = RefreshToken.for_user(user)
             access = str(getattr(refresh,"access_token"))
             refresh = str(refresh)
-        valid_access_tokens = TokenService.get_valid_tokens(
-            user_id=user.id, token_type=TokenType.ACCESS
-        )
-        if valid_access_tokens:
-            TokenService.add_token_to_redis(
-                user.id,
-                access,
-                TokenType.ACCESS,
-                settings.SIMPLE_JWT.get("ACCESS_TOKEN_LIFETIME")
-            )
-        valid_refresh_tokens = TokenService.get_valid_tokens(
-            user_id=user.id,token_type=TokenType.REFRESH
+        return {"access":access,"refresh":refresh}
+
+    @classmethod
+    def get_presence_many(cls,user_ids:list)->dict[str,dict]:
+        """
+        Presence of many users: one Redis pipeline, plus one indexed query
+        for the users Redis has no record of. Unknown ids are left out.
+        """
+        presence = PresenceService.get_presence_many(user_ids)
+        missing = [user_id for user_id in user_ids if str(user_id) not in presence]
+        if missing:
+            for user_id,is_online,last_seen in User.objects.filter(id__in=missing).values_list(
+                "id","is_online","last_seen"
+            ):
+                presence[str(user_id)] = {"is_online":is_online,"last_seen":last_seen}
+        return presence
+
+class DeviceActivityService:
+    """
+    Foydalanuvchi qurilmalari va oxirgi kirish vaqti (write-behind).
+    So'rov bazaga murojaat qilmaydi: (user, ip, user-agent) jarayon keshida DEVICE_ACTIVITY_DEDUPE_TTL
+    soniya davomida bir marta Redis hash'iga yoziladi (oxirgi vaqt saqlanadi).
+    flush_device_activity_task hash'ni PROCESSING_KEY ga ko'chirib, bazaga partiyalab yozadi:
+    last_login bulk_update bilan, yangi qurilmalar bulk_create(ignore_conflicts=True) bilan.
+    PROCESSING_KEY faqat yozuv commit bo'lgach o'chiriladi, yiqilgan flush keyingisida takrorlanadi.
+    """
+    BUFFER_KEY = "devices:activity"
+    PROCESSING_KEY = "devices:activity:processing"
+    seen = LocalTTLCache(
+        maxsize=getattr(settings,"DEVICE_ACTIVITY_CACHE_MAX_SIZE",10000),
+        ttl=getattr(settings,"DEVICE_ACTIVITY_DEDUPE_TTL",60),
+    )
+
+    @classmethod
+    def get_redis_client(cls)->Redis:
+        return get_redis_connection("default")
+
+    @classmethod
+    def record(cls,user_id,ip_address:str,user_agent:str)->bool:
+        """So'rovdagi faollikni buferga yozish, takroriy bo'lsa False (Redis'ga ham murojaat qilinmaydi)"""
+        ip_address = (ip_address or "")[:DeviceInfo._meta.get_field("ip_address").max_length]
+        user_agent = user_agent[:DeviceInfo._meta.get_field("device_name").max_length]
+        key = (str(user_id),ip_address,user_agent)
+        if cls.seen.get(key):
+            return False
+        cls.seen.set(key,True)
+        cls.get_redis_client().hset(cls.BUFFER_KEY,json.dumps(key),time.time())
+        return True
+
+    @classmethod
+    def claim_activity(cls)->list[dict]:
+        """
+        Buferni atomar ravishda PROCESSING_KEY ga ko'chirib, yozuvlarini olish.
+        Yangi so'rovlar bo'sh buferga yozadi; ack_activity() chaqirilmaguncha yozuvlar saqlanib qoladi.
+        """
+        activity = cls.get_redis_client().eval(CLAIM_ACTIVITY_SCRIPT,2,cls.BUFFER_KEY,cls.PROCESSING_KEY)
+        result = []
+        for key,timestamp in zip(activity[::2],activity[1::2]):
+            user_id,ip_address,user_agent = json.loads(key)
+            result.append({
+                "user_id":user_id,
+                "ip_address":ip_address,
+                "user_agent":user_agent,
+                "seen_at":datetime.datetime.fromtimestamp(float(timestamp),tz=datetime.timezone.utc),
+            })
+        return result
+
+    @classmethod
+    def ack_activity(cls)->None:
+        """Bazaga yozilgan (commit bo'lgan) yozuvlarni o'chirish"""
+        cls.get_redis_client().delete(cls.PROCESSING_KEY)
+
+    @classmethod
+    def save(cls,activity:list[dict],batch_size:int)->None:
+        """Bir partiya: foydalanuvchilar va qurilmalar uchun bittadan so'rov, keyin bulk yozish"""
+        # Buferlangan paytda o'chirilgan foydalanuvchilar tashlab yuboriladi
+        user_ids = {
+            str(user_id) for user_id in
+            User.objects.filter(id__in={item["user_id"] for item in activity}).values_list("id",flat=True)
+        }
+        last_login = {}
+        devices = {}
+        for item in sorted(activity,key=lambda item:item["seen_at"]):
+            if item["user_id"] not in user_ids:
+                continue
+            last_login[item["user_id"]] = item["seen_at"]
+            devices[(item["user_id"],item["ip_address"])] = item
+        User.objects.bulk_update(
+            [User(id=user_id,last_login=seen_at) for user_id,seen_at in last_login.items()],
+            ["last_login"],batch_size=batch_size,
         )
-        if valid_refresh_tokens:
-            TokenService.add_token_to_redis(
-                user.id,
-                refresh,
-                TokenType.REFRESH,
-                settings.SIMPLE_JWT.get("REFRESH_TOKEN_LIFETIME")
-            )
-        return {"access":access,"refresh":refresh}
\ No newline at end of file
+        existing = {
+            (str(device.user_id),device.ip_address):device
+            for device in DeviceInfo.objects.filter(
+                user_id__in=last_login,ip_address__in={ip_address for _,ip_address in devices}
+            ).only("id","user_id","ip_address")
+        }
+        updated = []
+        created = []
+        for key,item in devices.items():
+            device = existing.get(key)
+            if device is not None:
+                device.last_login = item["seen_at"]
+                updated.append(device)
+            else:
+                created.append(DeviceInfo(
+                    user_id=item["user_id"],
+                    ip_address=item["ip_address"],
+                    device_name=item["user_agent"],
+                    last_login=item["seen_at"],
+                ))
+        DeviceInfo.objects.bulk_update(updated,["last_login"],batch_size=batch_size)
+        DeviceInfo.objects.bulk_create(created,batch_size=batch_size,ignore_conflicts=True)
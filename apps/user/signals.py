@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from share.cache import AuthCache
+from user.models import User
+
+# Har so'rovda yoki presence flush'da yoziladigan maydonlar keshni eskirtirmaydi
+NON_AUTH_FIELDS = {"last_login","is_online","last_seen"}
+
+
+@receiver(post_save,sender=User)
+def invalidate_cached_user(sender,instance,created,update_fields=None,**kwargs):
+    """O'zgargan foydalanuvchini barcha jarayonlarning auth keshidan chiqarish"""
+    if created or (update_fields and set(update_fields) <= NON_AUTH_FIELDS):
+        return
+    AuthCache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete,sender=User)
+def invalidate_deleted_user(sender,instance,**kwargs):
+    AuthCache.invalidate_user(instance.pk)
@@ -0,0 +1,77 @@
+from asgiref.sync import async_to_sync
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from share.broadcast import group_send_many, presence_event, presence_group_name
+from share.services import PresenceService
+from .models import User
+from .services import DeviceActivityService
+
+logger = get_task_logger(__name__)
+
+@shared_task
+def flush_presence_task():
+    """
+    Redis'dagi o'zgargan onlayn holatlarni bazaga partiyalab yozish.
+    Har bir partiya bitta bulk_update bilan saqlanadi.
+    """
+    batch_size = getattr(settings,"PRESENCE_FLUSH_BATCH_SIZE",500)
+    flushed = 0
+    while True:
+        states = PresenceService.pop_dirty(batch_size)
+        if not states:
+            break
+        users = [
+            User(id=state["user_id"],is_online=state["is_online"],last_seen=state["last_seen"])
+            for state in states
+        ]
+        try:
+            User.objects.bulk_update(users,["is_online","last_seen"],batch_size=batch_size)
+        except Exception:
+            # Yozilmagan foydalanuvchilar keyingi flush uchun qaytariladi
+            PresenceService.mark_dirty([state["user_id"] for state in states])
+            raise
+        flushed += len(users)
+        if len(states) < batch_size:
+            break
+    logger.info("Flushed presence for %s users.",flushed)
+    return flushed
+
+@shared_task
+def expire_presence_task():
+    """
+    Ulanishi uzilmasdan muddati o'tgan (worker qulagan, tarmoq uzilgan) foydalanuvchilarni
+    o'zgarganlar ro'yhatiga qo'shish, flush_presence_task ularni bazada oflayn qiladi.
+    Kuzatuvchilarga (PresenceConsumer) oflayn holat darhol yuboriladi.
+    """
+    batch_size = getattr(settings,"PRESENCE_FLUSH_BATCH_SIZE",500)
+    channel_layer = get_channel_layer()
+    expired = 0
+    while True:
+        user_ids = PresenceService.expire(batch_size)
+        if user_ids:
+            async_to_sync(group_send_many)(channel_layer,[
+                (presence_group_name(user_id),presence_event(user_id,False)) for user_id in user_ids
+            ])
+        expired += len(user_ids)
+        if len(user_ids) < batch_size:
+            break
+    logger.info("Expired presence of %s users.",expired)
+    return expired
+
+@shared_task
+def flush_device_activity_task():
+    """
+    Middleware buferlagan qurilma faolligini bazaga yozish (last_login va DeviceInfo).
+    """
+    batch_size = getattr(settings,"DEVICE_ACTIVITY_FLUSH_BATCH_SIZE",500)
+    activity = DeviceActivityService.claim_activity()
+    for start in range(0,len(activity),batch_size):
+        DeviceActivityService.save(activity[start:start+batch_size],batch_size)
+    # Yozuv yiqilsa qayta ishlash kaliti qoladi va keyingi flush uni takrorlaydi
+    transaction.on_commit(DeviceActivityService.ack_activity)
+    logger.info("Flushed %s device activity records.",len(activity))
+    return len(activity)
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from user.views import SignUpView, VerifyView, LoginView, UserProfileView, UserAvatarUploadView, \
     UserAvatarRetrieveDeleteView, DeviceListView, LogoutView, ContactApiView, ContactSycnApiView, Enable2FAView, \
-    Verify2FAView, UserPresenceApiView, NotificationPreferenceApiView
+    Verify2FAView, UserPresenceApiView, NotificationPreferenceApiView, BulkUserPresenceApiView
 
 router = DefaultRouter()
 router.register(r'',ContactApiView,basename='contact')
@@ -18,6 +18,7 @@ urlpatterns = [
     path('logout/',LogoutView.as_view(),name='user-logout'),
     path('2fa/',Enable2FAView.as_view(),name='user-2fa'),
     path('2fa/verify/',Verify2FAView.as_view(),name='user-2fa-verify'),
+    path('status/',BulkUserPresenceApiView.as_view(),name='user-status-bulk'),
     path('<uuid:pk>/status/',UserPresenceApiView.as_view(),name='user-status'),
     path('notifications/',NotificationPreferenceApiView.as_view(),name='user-notification'),
     path('contacts/sync/',ContactSycnApiView.as_view(),name='contact-sync'),
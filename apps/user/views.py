@@ -1,8 +1,6 @@
 from functools import partial
 
-from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.contrib.auth.hashers import make_password, check_password
 from django_redis import get_redis_connection
 from drf_spectacular.utils import extend_schema_view
 from rest_framework import status
@@ -15,14 +13,15 @@ from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from sentry_sdk.integrations.beam import raise_exception
 
-from share.enums import TokenType
-from share.services import TokenService
+from share.hashing import PasswordHashService
+from share.services import TokenService, PresenceService
 from user.models import UserAvatar, DeviceInfo, Contact, NotificationPreference
 from user.paginations import CustomPagination
 from user.permissions import IsUserVerify, IsContactUser
 from user.serializers import SignUpSerializer, SignUpResponseSerializer, VerifyOTPSerializer, LoginSerializer, \
     UserProfileSerializer, UserAvatarSerializer, DeviceInfoSerializer, ContactSerializer, ContactSyncSerializer, \
-    Request2FASerializer, Verify2FARequestSerializer, UserPresenceResponseSerializer, NotificationPreferenceSerializer
+    Request2FASerializer, Verify2FARequestSerializer, UserPresenceResponseSerializer, NotificationPreferenceSerializer, \
+    BulkPresenceRequestSerializer, LogoutSerializer
 from user.services import UserService
 User = get_user_model()
 
@@ -89,7 +88,6 @@ class UserProfileView(RetrieveUpdateAPIView):
     http_method_names = ['get','patch']
 
     def retrieve(self, request, *args, **kwargs):
-        print(TokenService.get_valid_tokens(request.user.id,TokenType.ACCESS))
         serializer = self.get_serializer(instance=request.user)
         return Response(data=serializer.data)
 
@@ -125,13 +123,21 @@ class DeviceListView(ListAPIView):
 
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated,]
+    serializer_class = LogoutSerializer
+
     def post(self,request,*args,**kwargs):
-        user = request.user
-        TokenService.delete_tokens(user.id,TokenType.ACCESS)
-        TokenService.delete_tokens(user.id,TokenType.REFRESH)
-        TokenService.add_token_to_redis(user.id,"fake_token",TokenType.ACCESS,settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'])
-        TokenService.add_token_to_redis(user.id,"fake_token",TokenType.REFRESH,settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'])
-        # UserService.create_tokens(user=request.user,access="fake_token",refresh="fake_token")
+        """
+        Tizimdan chiqish. all=true (standart) - barcha qurilmalardagi tokenlar bekor qilinadi,
+        all=false - faqat joriy access token va yuborilgan refresh token bekor qilinadi.
+        """
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if serializer.validated_data["all"]:
+            TokenService.revoke_user_tokens(request.user.id)
+        else:
+            TokenService.revoke_token(request.auth)
+            if serializer.validated_data.get("refresh"):
+                TokenService.revoke_token(serializer.validated_data["refresh"])
         return Response(data={"detail":"Successfully logged out"})
 
 class ContactApiView(ModelViewSet):
@@ -179,13 +185,14 @@ class Enable2FAView(CreateAPIView):
         user = request.user
         if type:
             user.is_2fa_enabled=True
-            user.otp_secret = make_password(otp_secret)
-            user.save()
+            # Xeshlash alohida jarayonlar pulida, navbat to'lsa 429 qaytadi
+            user.otp_secret = PasswordHashService.make_password(otp_secret)
+            user.save(update_fields=["is_2fa_enabled","otp_secret","updated_at"])
             return Response({"detail":"2FA enabled."},)
         else:
             user.is_2fa_enabled=False
             user.otp_secret=None
-            user.save()
+            user.save(update_fields=["is_2fa_enabled","otp_secret","updated_at"])
             return Response({"detail":"2FA disabled."})
 
 class Verify2FAView(CreateAPIView):
@@ -200,7 +207,7 @@ class Verify2FAView(CreateAPIView):
         user = User.objects.filter(id=user_id).first()
         if not user:
             return Response({"detail":"Invalid user"},status=status.HTTP_400_BAD_REQUEST)
-        if check_password(password,user.otp_secret):
+        if PasswordHashService.check_password(password,user.otp_secret):
             tokens = UserService.create_tokens(user)
             return Response(tokens)
         return Response({"detail":"Invalid password"},status=status.HTTP_400_BAD_REQUEST)
@@ -211,12 +218,27 @@ class UserPresenceApiView(RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        data = {
+        # Redis'dagi holat ustuvor, u yerda yozuv bo'lmasa bazadagi qiymat qaytariladi
+        data = PresenceService.get_presence(instance.id) or {
             "is_online":instance.is_online,
             "last_seen":instance.last_seen
         }
         return Response(data)
 
+class BulkUserPresenceApiView(APIView):
+    """
+    Ko'p foydalanuvchilarning onlayn holatini bitta so'rovda qaytaradi
+    (kontaktlar va chatlar ro'yxati uchun).
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = BulkPresenceRequestSerializer
+
+    def post(self,request,*args,**kwargs):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        presence = UserService.get_presence_many(serializer.validated_data["user_ids"])
+        return Response(presence)
+
 class NotificationPreferenceApiView(RetrieveUpdateAPIView):
     queryset = NotificationPreference.objects.all()
     serializer_class = NotificationPreferenceSerializer
@@ -2,8 +2,11 @@ from django.urls import path
 
 from chat.consumers import ChatConsumer
 from group.consumers import GroupConsumer
+from user.consumers import GatewayConsumer, PresenceConsumer
 
 websocket_urlpatterns = [
     path("ws/chats/<uuid:pk>/",ChatConsumer.as_asgi()),
     path("ws/groups/<uuid:pk>/",GroupConsumer.as_asgi()),
+    path("ws/presence/",PresenceConsumer.as_asgi()),
+    path("ws/gateway/",GatewayConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -10,7 +10,7 @@ import logging
 from django.conf import settings
 from sentry_sdk.integrations.django import DjangoIntegration
 from sentry_sdk.integrations.logging import LoggingIntegration
-from decouple import config
+from decouple import config, Csv
 from pathlib import Path
 
 
@@ -218,7 +218,7 @@ SIMPLE_JWT = {
     "USER_ID_CLAIM": "user_id",
     "USER_AUTHENTICATION_RULE": "rest_framework_simplejwt.authentication.default_user_authentication_rule",
 
-    "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
+    "AUTH_TOKEN_CLASSES": ("share.tokens.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
     "TOKEN_USER_CLASS": "rest_framework_simplejwt.models.TokenUser",
 
@@ -228,8 +228,8 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "user.serializers.MillisecondTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "user.serializers.RevocableTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -259,6 +259,10 @@ REDIS_HOST = config('REDIS_HOST',default='localhost')
 REDIS_PORT = config('REDIS_PORT',default='6379')
 REDIS_DB = config('REDIS_DB',default='1')
 REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
+# Consumerlar uchun async Redis client (share.async_redis): har bir event loop uchun bitta pool,
+# bo'sh ulanish bo'lmasa ASYNC_REDIS_POOL_TIMEOUT soniya kutiladi
+ASYNC_REDIS_MAX_CONNECTIONS = config('ASYNC_REDIS_MAX_CONNECTIONS',default=50,cast=int)
+ASYNC_REDIS_POOL_TIMEOUT = config('ASYNC_REDIS_POOL_TIMEOUT',default=5,cast=float)
 
 # CACHES
 # -----------------------------------------------------------------------------------------
@@ -279,15 +283,125 @@ SESSION_CACHE_ALIAS = "default"
 
 # CHANNELS
 # -----------------------------------------------------------------------------------------
+# Channel layer kesh, sessiya, Celery va OTP bilan bitta Redis DB da raqobatlashmasligi uchun
+# o'z Redis instance(lar)ida va o'z connection pool'larida ishlaydi. Bir nechta host vergul bilan
+# beriladi (CHANNEL_LAYER_HOSTS=redis://a:6379/0,redis://b:6379/0): xonalar va jarayon navbatlari
+# ular orasida consistent hash bilan taqsimlanadi.
+CHANNEL_LAYER_HOSTS = config(
+    "CHANNEL_LAYER_HOSTS",default=f"redis://{REDIS_HOST}:{REDIS_PORT}/{config('CHANNEL_LAYER_REDIS_DB',default='2')}",cast=Csv()
+)
+CHANNEL_LAYER_MAX_CONNECTIONS = config("CHANNEL_LAYER_MAX_CONNECTIONS",default=100,cast=int)
+# NodeFanoutChannelLayer guruh hodisasini har bir jarayonga bitta PUBLISH bilan yuboradi,
+# jarayon ichida esa xona a'zolariga xotirada tarqatadi (channels_redis.core.RedisChannelLayer o'rniga)
 CHANNEL_LAYERS = {
     'default':{
-        'BACKEND':'channels_redis.core.RedisChannelLayer',
+        'BACKEND':config("CHANNEL_LAYER_BACKEND",default="share.layers.NodeFanoutChannelLayer"),
         'CONFIG':{
-            "hosts":[REDIS_URL]
+            "hosts":[
+                {"address":host,"max_connections":CHANNEL_LAYER_MAX_CONNECTIONS}
+                for host in CHANNEL_LAYER_HOSTS
+            ],
+            "prefix":config("CHANNEL_LAYER_PREFIX",default="asgi"),
+            "capacity":config("CHANNEL_LAYER_CAPACITY",default=100,cast=int),
+            "expiry":config("CHANNEL_LAYER_EXPIRY",default=60,cast=int),
         }
     }
 }
 
+# MESSAGE HISTORY
+# -----------------------------------------------------------------------------------------
+MESSAGE_HISTORY_PAGE_SIZE = config("MESSAGE_HISTORY_PAGE_SIZE",default=50,cast=int)
+MESSAGE_HISTORY_MAX_PAGE_SIZE = config("MESSAGE_HISTORY_MAX_PAGE_SIZE",default=100,cast=int)
+
+# ROSTER
+# -----------------------------------------------------------------------------------------
+ROSTER_PAGE_SIZE = config("ROSTER_PAGE_SIZE",default=100,cast=int)
+ROSTER_MAX_PAGE_SIZE = config("ROSTER_MAX_PAGE_SIZE",default=500,cast=int)
+ROSTER_DELTA_WINDOW = config("ROSTER_DELTA_WINDOW",default=0.5,cast=float)
+
+# GATEWAY
+# -----------------------------------------------------------------------------------------
+# Bitta gateway ulanishi obuna bo'lishi mumkin bo'lgan xonalar (chat, guruh, kanal) soni
+GATEWAY_MAX_ROOMS = config("GATEWAY_MAX_ROOMS",default=500,cast=int)
+
+# GROUP ACCESS
+# -----------------------------------------------------------------------------------------
+# Guruh a'zoligi va huquqlari snapshoti (jarayon keshi), o'zgarishlar channel layer orqali tozalanadi
+GROUP_ACCESS_CACHE_TTL = config("GROUP_ACCESS_CACHE_TTL",default=60.0,cast=float)
+GROUP_ACCESS_CACHE_MAX_SIZE = config("GROUP_ACCESS_CACHE_MAX_SIZE",default=10000,cast=int)
+
+# OTP
+# -----------------------------------------------------------------------------------------
+# OTP kodlari HMAC-SHA256 bilan saqlanadi, kalit berilmasa SECRET_KEY ishlatiladi
+OTP_HMAC_KEY = config("OTP_HMAC_KEY",default="")
+
+# PASSWORD HASHING
+# -----------------------------------------------------------------------------------------
+# 2FA parollari (PBKDF2) alohida jarayonlar pulida xeshlanadi (share.hashing), 0 - shu jarayonda.
+# Navbatda PASSWORD_HASH_MAX_PENDING ta so'rov bo'lsa yangilariga 429 qaytariladi
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS",default=2,cast=int)
+PASSWORD_HASH_MAX_PENDING = config("PASSWORD_HASH_MAX_PENDING",default=32,cast=int)
+PASSWORD_HASH_TIMEOUT = config("PASSWORD_HASH_TIMEOUT",default=10,cast=float)
+
+# PUSH NOTIFICATIONS
+# -----------------------------------------------------------------------------------------
+# FCM bitta multicast so'rovida ko'pi bilan 500 ta token qabul qiladi
+PUSH_MULTICAST_BATCH_SIZE = config("PUSH_MULTICAST_BATCH_SIZE",default=500,cast=int)
+# share.push.FakeTransport - FCM'siz test va benchmark uchun
+PUSH_TRANSPORT = config("PUSH_TRANSPORT",default="share.push.FirebaseTransport")
+PUSH_FAKE_LATENCY = config("PUSH_FAKE_LATENCY",default=0.0,cast=float)
+PUSH_MAX_RETRIES = config("PUSH_MAX_RETRIES",default=5,cast=int)
+PUSH_RETRY_BACKOFF = config("PUSH_RETRY_BACKOFF",default=2,cast=int)
+CHANNEL_BROADCAST_CHUNKS_PER_RUN = config("CHANNEL_BROADCAST_CHUNKS_PER_RUN",default=20,cast=int)
+CHANNEL_BROADCAST_STALE_AFTER = config("CHANNEL_BROADCAST_STALE_AFTER",default=120,cast=int)
+
+# SCHEDULER
+# -----------------------------------------------------------------------------------------
+# Rejalashtirilgan habarlar `python manage.py run_scheduler` jarayoni orqali yuboriladi
+SCHEDULED_MESSAGE_KINDS = {
+    "chat":{"model":"chat.ScheduledMessage","task":"chat.tasks.send_scheduled_message"},
+    "group":{"model":"group.GroupScheduledMessage","task":"group.tasks.send_group_scheduled_message"},
+    "channel":{"model":"channel.ChannelScheduledMessage","task":"channel.tasks.send_channel_scheduled_message"},
+}
+SCHEDULER_BATCH_SIZE = config("SCHEDULER_BATCH_SIZE",default=500,cast=int)
+SCHEDULER_MAX_SLEEP = config("SCHEDULER_MAX_SLEEP",default=30.0,cast=float)
+SCHEDULER_REBUILD_INTERVAL = config("SCHEDULER_REBUILD_INTERVAL",default=300.0,cast=float)
+
+# PRESENCE
+# -----------------------------------------------------------------------------------------
+PRESENCE_TTL = config("PRESENCE_TTL",default=120,cast=int)
+PRESENCE_FLUSH_INTERVAL = config("PRESENCE_FLUSH_INTERVAL",default=30.0,cast=float)
+PRESENCE_FLUSH_BATCH_SIZE = config("PRESENCE_FLUSH_BATCH_SIZE",default=500,cast=int)
+# Uzilmasdan muddati o'tgan ulanishlar (worker qulagan) shu oraliqda tekshiriladi
+PRESENCE_EXPIRE_INTERVAL = config("PRESENCE_EXPIRE_INTERVAL",default=30.0,cast=float)
+PRESENCE_BULK_MAX_USERS = config("PRESENCE_BULK_MAX_USERS",default=500,cast=int)
+PRESENCE_DIFF_WINDOW = config("PRESENCE_DIFF_WINDOW",default=1.0,cast=float)
+
+# DEVICE ACTIVITY
+# -----------------------------------------------------------------------------------------
+# So'rovlardagi qurilma va last_login Redis'da buferlanadi, bazaga flush_device_activity_task yozadi.
+# Bir xil (user, ip, user-agent) jarayonda DEVICE_ACTIVITY_DEDUPE_TTL soniyada bir marta yoziladi
+DEVICE_ACTIVITY_DEDUPE_TTL = config("DEVICE_ACTIVITY_DEDUPE_TTL",default=60.0,cast=float)
+DEVICE_ACTIVITY_CACHE_MAX_SIZE = config("DEVICE_ACTIVITY_CACHE_MAX_SIZE",default=10000,cast=int)
+DEVICE_ACTIVITY_FLUSH_INTERVAL = config("DEVICE_ACTIVITY_FLUSH_INTERVAL",default=30.0,cast=float)
+DEVICE_ACTIVITY_FLUSH_BATCH_SIZE = config("DEVICE_ACTIVITY_FLUSH_BATCH_SIZE",default=500,cast=int)
+
+# SEARCH INDEX
+# -----------------------------------------------------------------------------------------
+# Indekslangan maydonlari o'zgargan User/Group/Channel qatorlari Redis navbatiga yoziladi,
+# flush_search_index_task ularni Elasticsearch'ga bulk so'rovlar bilan yuboradi
+SEARCH_INDEX_FLUSH_INTERVAL = config("SEARCH_INDEX_FLUSH_INTERVAL",default=5.0,cast=float)
+SEARCH_INDEX_BATCH_SIZE = config("SEARCH_INDEX_BATCH_SIZE",default=500,cast=int)
+
+# AUTH CACHE
+# -----------------------------------------------------------------------------------------
+# Tekshirilgan access token (user_id, jti) va foydalanuvchi obyektlari jarayon ichida saqlanadi,
+# chiqish (logout) va foydalanuvchi o'zgarishlari Redis pub/sub orqali barcha jarayonlarda tozalanadi
+AUTH_CACHE_ENABLED = config("AUTH_CACHE_ENABLED",default=True,cast=bool)
+AUTH_CACHE_TTL = config("AUTH_CACHE_TTL",default=30.0,cast=float)
+AUTH_USER_CACHE_TTL = config("AUTH_USER_CACHE_TTL",default=30.0,cast=float)
+AUTH_CACHE_MAX_SIZE = config("AUTH_CACHE_MAX_SIZE",default=10000,cast=int)
+
 # CELERY
 # -----------------------------------------------------------------------------------------
 if USE_TZ:
@@ -302,20 +416,34 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_WORKER_SEND_TASK_EVENTS = True
-CELERY_ALWAYS_EAGER=True
-CELERY_TASK_ALWAYS_EAGER=True
+# Vazifalar faqat testlarda (pytest.ini) joyida bajariladi, aks holda worker'lar navbatdan oladi
+CELERY_TASK_ALWAYS_EAGER = config("CELERY_TASK_ALWAYS_EAGER",default=False,cast=bool)
+CELERY_TASK_ROUTES = {
+    "group.tasks.fan_out_group_message":{"queue":"push"},
+    "channel.tasks.run_channel_broadcast":{"queue":"push"},
+    "share.tasks.send_push_batch":{"queue":"push"},
+    "share.tasks.send_push_notification":{"queue":"push"},
+}
 CELERY_BEAT_SCHEDULE = {
-    "send-scheduled-message":{
-        'task':"chat.tasks.send_scheduled_message",
-        "schedule":10.0,
+    "resume-channel-broadcasts":{
+        'task':"channel.tasks.resume_channel_broadcasts",
+        "schedule":60.0
+    },
+    "flush-presence":{
+        'task':"user.tasks.flush_presence_task",
+        "schedule":PRESENCE_FLUSH_INTERVAL
+    },
+    "expire-presence":{
+        'task':"user.tasks.expire_presence_task",
+        "schedule":PRESENCE_EXPIRE_INTERVAL
     },
-    "send-scheduled-group-message":{
-        'task':"group.tasks.send_group_scheduled_message",
-        "schedule":10.0
+    "flush-device-activity":{
+        'task':"user.tasks.flush_device_activity_task",
+        "schedule":DEVICE_ACTIVITY_FLUSH_INTERVAL
     },
-    "send-scheduled-channel-message":{
-        'task':"channel.tasks.send_channel_scheduled_message",
-        "schedule":10.0
+    "flush-search-index":{
+        'task':"share.tasks.flush_search_index_task",
+        "schedule":SEARCH_INDEX_FLUSH_INTERVAL
     }
 }
 
@@ -368,6 +496,8 @@ ELASTICSEARCH_DSL = {
     }
 }
 ENABLE_ES = config("ENABLE_ES",default=False,cast=bool)
+# Indekslanmagan maydonlarni saqlash indeksga tegmaydi, qolganlari SEARCH INDEX navbatiga yoziladi
+ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = "share.indexing.FieldAwareSignalProcessor"
 
 # LOGGING
 # -----------------------------------------------------------------------------------------